@@ -1,8 +1,8 @@
 from time import sleep
-import random
 from datetime import datetime
 from datetime import timedelta
 import re
+import json
 import traceback
 import pandas as pd
 import sqlite3
@@ -10,39 +10,93 @@ import logging
 import os
 import sys
 import subprocess
+import threading
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import monotonic
+from urllib.parse import urlparse
 from duckdb import sql
-import requests
 import unicodedata
 
+import rate_limit
+import page_cache
+import retry_policy
+import fetch_planner
+import job_queue
+import metrics
+import network_capture
+import subscription_sync
+
 import warnings
 warnings.filterwarnings("ignore") # warnings are annoying!
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 import urllib.request
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions
+from selenium.common.exceptions import TimeoutException
 # from subprocess import CREATE_NO_WINDOW
 
 logger = logging.getLogger('data_collection')
 
 # urllib_sleep = 15 # time to sleep when collecting theater data from zip codes
-sleep_amt = 30 # time to sleep when collecting showtime and movie data from theaters
+scrape_workers = 3 # number of theaters scraped at the same time - request rate is limited separately by rate_limit
 
 log_location = None # filepath for log
 driver_location = None # filepath for chrome driver
 app_db = None # filepath for webapp database - needed for subscription data
+db_location = os.path.join('sqlite3', 'moviedb') # filepath for movie database, shared by every worker
+fandango_url = 'https://www.fandango.com' # base url of site, pointed at fandango_standin when benchmarking
 
 progress_made = False # bool to keep track of whether any progess was made in a run
 
-collected_movies = []
+collected_movies = set() # ids of movies already handled during the current collection
+collected_movies_lock = threading.Lock()
+
+movie_info_ttl = 7 # days before complete movie details (scores, genres, synopsis) are fetched again
+fresh_movies = set() # ids of movies that don't need their detail page fetched
+max_info_attempts = 3 # failed detail fetches before a movie is dropped from the movie info queue
+
+zip_refresh_days = 7 # days a zip code's theater list is kept before its search page is fetched again
 
 options = None
 service = None
 
 headless = False
 
+browser_pool_size = 3 # number of browsers kept open and shared by all page loads
+browser_max_pages = 50 # number of pages a browser loads before it is replaced with a fresh one
+browser_wait_seconds = 5 # seconds a fetch waits for a browser to be handed back before checking whether a retired one left room for a new one
+reset_browser_state = True # clear cookies and storage before a browser is handed out again
+
+page_load_strategy = 'eager' # hand pages over once the document is parsed, without waiting for scripts, ads and analytics to finish loading
+page_ready_timeout = 15 # seconds to wait for the part of a page data is collected from before reading it anyway
+theater_ready_selector = 'ul.thtr-mv-list, h1.offline__header' # a theater page is ready once its movie list or the offline header is there - pages with no showtimes wait out page_ready_timeout, since the live markup of their notice hasn't been recorded
+movie_ready_selector = '#movie-detail-synopsis, span.rottentomatoes-rating' # a movie page is ready once its synopsis or scores are there
+
+capture_mode = False # read movies and showtimes from the json responses theater pages load, falling back to the html parsers
+
+lean_mode = False # block stylesheets, fonts, media and third-party requests so pages load with less traffic
+blocked_resource_types = ['stylesheet', 'image', 'font', 'media'] # resource types blocked in lean mode - scripts are kept since they may build the page
+allowed_domains = ['fandango.com', '*.fandango.com'] # hosts requests may still go to in lean mode, the host of fandango_url is always allowed
+resource_patterns = { # url patterns that block each resource type
+    'stylesheet': ['*.css', '*.css?*']
+    ,'image': ['*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.svg*', '*.ico*', '*.avif*']
+    ,'font': ['*.woff*', '*.ttf*', '*.otf*', '*.eot*']
+    ,'media': ['*.mp4*', '*.webm*', '*.m3u8*', '*.mp3*', '*.vtt*']
+}
+
+browser_pool = queue.Queue() # idle browsers waiting to be borrowed
+browser_pool_lock = threading.Lock()
+browser_pages = {} # id(browser) -> number of pages loaded by that browser
+live_browsers = 0 # number of browsers currently open, idle or borrowed
+
 def browser_init():
     """Create Selenium browser instance.
     
@@ -80,6 +134,16 @@ def browser_init():
         options.add_argument("--log-level=3")
         options.add_argument("--silent")
         options.add_argument('--blink-settings=imagesEnabled=false') # prevent image loading
+        options.page_load_strategy = page_load_strategy
+
+        if(capture_mode):
+            network_capture.enable(options)
+
+        if(lean_mode):
+            # every host outside the allowlist fails to resolve, which takes out ads, trackers and third-party widgets
+            logger.info(f'Running in lean mode - only requests to {", ".join(allowed_domains)} are allowed')
+            allowed = allowed_domains + [urlparse(fandango_url).hostname]
+            options.add_argument('--host-resolver-rules=MAP * ~NOTFOUND , ' + ' , '.join(f'EXCLUDE {domain}' for domain in allowed))
 
     if service is None:
         service = Service(executable_path=driver_location)
@@ -89,434 +153,1374 @@ def browser_init():
     driver = webdriver.Chrome(service=service, options=options)
     # driver = webdriver.Chrome(options=options) # if on pythonanywhere
     driver.set_page_load_timeout(300)
+
+    if(lean_mode):
+        # requests for blocked resource types fail inside the browser through devtools, before anything is downloaded
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': [pattern for resource_type in blocked_resource_types for pattern in resource_patterns[resource_type]]})
     
     logger.info('New browser created')
 
-    return driver
+    return driver
+
+def browser_healthy(browser):
+    """Check whether a pooled browser is still responsive
+
+    Keyword arguments:
+    browser - selenium browser
+
+    Returns:
+    bool - True if the browser answers a trivial script
+    """
+    try:
+        return browser.execute_script('return 1;') == 1
+    except Exception:
+        return False
+
+def retire_browser(browser):
+    """Quit a browser and remove it from the pool bookkeeping
+
+    Keyword arguments:
+    browser - selenium browser
+
+    Returns:
+    None
+    """
+    global live_browsers
+
+    try:
+        browser.quit()
+    except Exception:
+        logger.warning('Browser could not be quit cleanly')
+
+    with browser_pool_lock:
+        live_browsers -= 1
+        browser_pages.pop(id(browser), None)
+
+def borrow_browser():
+    """Take an idle browser from the pool, opening a new one if the pool is not yet full
+
+    Returns:
+    selenium browser instance
+    """
+    global live_browsers
+
+    while True:
+        try:
+            browser = browser_pool.get_nowait()
+        except queue.Empty:
+            with browser_pool_lock:
+                can_create = live_browsers < browser_pool_size
+                if(can_create):
+                    live_browsers += 1
+
+            if(can_create):
+                try:
+                    with metrics.timed('browser_startup'):
+                        browser = browser_init()
+                except Exception:
+                    with browser_pool_lock:
+                        live_browsers -= 1
+                    raise
+                with browser_pool_lock:
+                    browser_pages[id(browser)] = 0
+                return browser
+
+            # pool is full, wait for another fetch to hand its browser back - a browser that is retired instead never comes back, but frees a slot
+            try:
+                browser = browser_pool.get(timeout=browser_wait_seconds)
+            except queue.Empty:
+                continue
+
+        if(browser_healthy(browser)):
+            return browser
+
+        logger.warning('Pooled browser is unresponsive - replacing it')
+        retire_browser(browser)
+
+def release_browser(browser, crashed=False):
+    """Hand a borrowed browser back to the pool, recycling it if it crashed or is worn out
+
+    Keyword arguments:
+    browser - selenium browser
+    crashed - whether the page load using this browser raised an exception
+
+    Returns:
+    None
+    """
+    with browser_pool_lock:
+        browser_pages[id(browser)] = browser_pages.get(id(browser), 0) + 1
+        worn_out = browser_pages[id(browser)] >= browser_max_pages
+
+    if(crashed or worn_out):
+        logger.info(f'Recycling browser ({"crashed" if crashed else "page limit reached"})')
+        retire_browser(browser)
+        return
+
+    if(reset_browser_state):
+        try:
+            browser.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            browser.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except Exception:
+            logger.warning('Could not reset browser state - recycling browser')
+            retire_browser(browser)
+            return
+
+    browser_pool.put(browser)
+
+@contextmanager
+def pooled_browser():
+    """Borrow a browser from the pool for the duration of a with block
+
+    Returns:
+    selenium browser instance
+    """
+    browser = borrow_browser()
+    try:
+        yield browser
+    except Exception:
+        release_browser(browser, crashed=True)
+        raise
+    else:
+        release_browser(browser)
+
+def close_browser_pool():
+    """Quit every idle browser in the pool
+
+    Returns:
+    None
+    """
+    while True:
+        try:
+            browser = browser_pool.get_nowait()
+        except queue.Empty:
+            break
+        retire_browser(browser)
+
+    logger.info('Browser pool closed')
+
+def initialize_db(db_name):
+    """Connect to sqlite3 database
+
+    Keyword arguments:
+    db_name - name of database
+
+    Returns:
+    [database connection, connection cursor]
+    """
+    conn = sqlite3.connect(db_name, timeout=30) # other workers may be holding the write lock
+    return conn, conn.cursor()
+
+def get_zip_codes(conn):
+    """Get list of zip codes to be used for locating theaters. 
+
+    Keyword Arguments:
+    from_file - whether to read zip codes from file (1) or take user input (0)
+    filename - relative path to read zip codes from when from_file == 1
+
+    Returns:
+    list - [str zip code, str zip code, str zip code]
+    """
+
+    # zip codes to check are those with active subscriptions
+    return list(pd.read_sql('SELECT DISTINCT zip_code FROM subscriptions WHERE active=1;', conn)['zip_code'])
+
+theater_page_strainer = SoupStrainer(['ul', 'h1'], class_=['thtr-mv-list', 'offline__header'])
+zip_page_strainer = SoupStrainer(id='nearby-theaters-select-list')
+
+def response_status(browser):
+    """Get the HTTP status the page loaded in a browser was served with
+
+    Keyword arguments:
+    browser - selenium browser instance
+
+    Returns:
+    int - HTTP status, or None if the browser doesn't report it
+    """
+    try:
+        status = browser.execute_script("const entry = performance.getEntriesByType('navigation')[0]; return entry ? entry.responseStatus : null;")
+    except Exception:
+        return None
+
+    # browsers without navigation timing level 2 report 0
+    return status if status else None
+
+def fetch_page(url, bucket=None, ready_selector=None, capture=False):
+    """Load a page in a pooled browser once the rate limiter allows it
+
+    Keyword arguments:
+    url - full url of page
+    bucket - name of rate limit budget to use, defaults to the url's host
+    ready_selector - css selector of the element data is collected from; the page is read as soon as it appears
+    capture - also return the json responses the page loaded, browsers must have been created in capture_mode
+
+    Returns:
+    str - html of page, or [html, list of json payloads] if capture
+
+    Raises an exception if the page was served with a server error or rate limit status
+    """
+    rate_limit.wait_for_token(url, bucket) # shared request budget so my ip doesn't get banned again
+
+    with pooled_browser() as browser, metrics.timed('page_load'):
+        if(capture):
+            network_capture.drain(browser)
+
+        browser.get(url)
+
+        metrics.count('pages')
+
+        # error pages never show the ready element, so they are caught before waiting for it - the browser itself is fine and goes back to the pool
+        status = response_status(browser)
+        error_page = status is not None and (status == 429 or status >= 500)
+
+        if(ready_selector is not None and not error_page):
+            try:
+                WebDriverWait(browser, page_ready_timeout).until(expected_conditions.presence_of_element_located((By.CSS_SELECTOR, ready_selector)))
+            except TimeoutException:
+                # theater pages without showtimes and movie pages without synopsis or scores never show the element, the callers work out what is there
+                logger.warning(f'{ready_selector} not found within {page_ready_timeout} seconds at {url}')
+
+        if(not error_page):
+            html = browser.page_source
+            payloads = network_capture.captured_payloads(browser) if capture else []
+
+    if(error_page):
+        metrics.count('error_pages')
+        raise Exception(f'Error page (HTTP {status}) served for {url}')
+
+    if(capture):
+        return html, payloads
+    return html
+
+def parse_theater_page(html):
+    """Parse only the parts of a theater page that data is collected from
+
+    Keyword arguments:
+    html - html of theater page
+
+    Returns:
+    BeautifulSoup object containing the movie list and offline header, if present
+    """
+    # the rest of the page (scripts, navigation, ads) is tokenized but never built into the tree
+    with metrics.timed('parse'):
+        return BeautifulSoup(html, 'html.parser', parse_only=theater_page_strainer)
+
+def get_theater_page(theater, url, date):
+    """Get the html of a theater page, and the json responses it loaded in capture mode
+
+    Keyword Arguments:
+    theater - name of theater
+    url - base url of theater (https://www.fandango.com/shu-community-theatre-aabqu/theater-page)
+    date - date of showings to collect
+
+    Returns:
+    [str - html of page, list - json payloads captured, empty unless capture_mode is on]
+
+    Raises an exception if the page is served offline or is an error page - retries are left to the caller's retry policy
+    """
+
+    # date must be in YYYY-mm-dd format for url
+    formatted_date = date.strftime('%Y-%m-%d')
+
+    # full url incorporates date restriction
+    full_url = f'{url}?cmp=theater-module&format=all&date={formatted_date}'
+    
+    logger.info(f'current theater: {theater} | current date: {date} | address: {full_url}')
+
+    # pages downloaded by an earlier attempt don't need to be fetched again
+    html = page_cache.get_page(full_url)
+    if(html is not None):
+        payloads = page_cache.get_page(f'{full_url}#responses') if capture_mode else None
+        return html, json.loads(payloads) if payloads is not None else []
+    
+    if(capture_mode):
+        html, payloads = fetch_page(full_url, ready_selector=theater_ready_selector, capture=True)
+    else:
+        html, payloads = fetch_page(full_url, ready_selector=theater_ready_selector), []
+
+    # if offline__header exists, page hasn't loaded properly
+    if('offline__header' in html and parse_theater_page(html).find('h1', 'offline__header') is not None):
+        logger.warning('offline')
+        retry_policy.record_blocked(rate_limit.get_host(full_url))
+        raise Exception(f'Offline page served for {full_url}')
+
+    # error pages were caught by their status in fetch_page, a page without the movie list is a date without showtimes
+    retry_policy.record_unblocked(rate_limit.get_host(full_url))
+    page_cache.store_page(full_url, html)
+    if(payloads != []):
+        page_cache.store_page(f'{full_url}#responses', json.dumps(payloads))
+    return html, payloads
+
+def get_soup(theater, url, date):
+    """Get BeautifulSoup object of a page
+
+    Keyword Arguments:
+    theater - name of theater
+    url - base url of theater (https://www.fandango.com/shu-community-theatre-aabqu/theater-page)
+    date - date of showings to collect
+
+    Returns:
+    BeautifulSoup object
+
+    Raises an exception if the page is served offline or is an error page - retries are left to the caller's retry policy
+    """
+    return parse_theater_page(get_theater_page(theater, url, date)[0])
+
+def get_text(soup):
+    """Get text from a BeautifulSoup element
+
+    Keyword arguments:
+    soup - BeautifulSoup element
+
+    Returns:
+    str - cleaned text of element
+    """
+
+    return soup.text.replace('\n', '').replace('\t', '').strip()
+
+def select_all_from_table(tablename, conn):
+    """Select all data from a given table in database
+
+    Keyword arguments:
+    tablename - name of table in database to query
+    conn - database connection
+
+    Returns:
+    pd.DataFrame - all data from table
+    """
+
+    return pd.read_sql_query(f'SELECT * FROM {tablename}', conn)
+
+def get_subscriptions():
+    """Get subscription and theater data from django app database
+    """
+
+    logger.info('Connecting to django app database')
+    conn, cursor = initialize_db(app_db)
+
+    logger.info('Collecting subscription data')
+    active_users = pd.read_sql('SELECT id, username, first_name, last_name, email FROM auth_user WHERE is_active=1', conn)
+    all_theaters = pd.read_sql('SELECT id, name, url FROM subscriptions_theater WHERE id IN (SELECT DISTINCT theater_id FROM subscriptions_subscription)', conn)
+    all_subscriptions = pd.read_sql('SELECT user_id, theater_id FROM subscriptions_subscription', conn)
+
+    # take only active data
+    subscriptions = sql('SELECT s.user_id, s.theater_id FROM all_subscriptions s INNER JOIN active_users u ON u.id = s.user_id').df()
+    theaters = sql('SELECT t.id, t.name, t.url FROM all_theaters t INNER JOIN subscriptions s ON s.theater_id = t.id').df()
+    
+    logger.info('Subscription data colelcted - closing database connection')
+    conn.close()
+
+    return subscriptions, theaters
+
+def get_subscriptions_api(conn, cursor):
+    """Get subscription and theater data from django app api, through the local copies of its tables
+
+    Keyword arguments:
+    conn - database connection
+    cursor - cursor for database
+
+    Returns:
+    [active subscriptions DataFrame, active theaters DataFrame]
+    """
+
+    logger.info('Syncing subscription, theater and user data from API')
+    subscription_sync.sync(conn, cursor)
+
+    logger.info('Restricting data to active only')
+    active_subscriptions = pd.read_sql('SELECT s.user_id, s.theater_id FROM app_subscriptions s INNER JOIN app_users u ON u.id = s.user_id WHERE u.is_active = 1', conn)
+    active_theaters = pd.read_sql('SELECT id, name, url FROM app_theaters WHERE id IN (SELECT s.theater_id FROM app_subscriptions s INNER JOIN app_users u ON u.id = s.user_id WHERE u.is_active = 1)', conn)
+
+    logger.info('API data collected')
+    return active_subscriptions, active_theaters
+
+
+def insert_zip_code(zip_code, theater_id, cursor):
+    """Insert zip code data into database
+    
+    Keyword arguments:
+    zip_code - zip code as string
+    theater_id - id of theater as string
+    cursor - cursor for database
+    
+    Returns:
+    None
+    """
+
+    query = """
+        INSERT OR IGNORE INTO zip_codes(zip_code, theater_id)
+        VALUES(?, ?);
+        """
+    
+    cursor.execute(query, (zip_code, theater_id))
+
+def parse_zip_page(html):
+    """Get theaters listed on a zip code search page
+
+    Keyword arguments:
+    html - html of zip code search page
+
+    Returns:
+    list - [ { id : theater id , name : theater name , url : theater url , address : None } ]
+    """
+    zip_search_page = BeautifulSoup(html, 'html.parser', parse_only=zip_page_strainer)
+
+    theaters = zip_search_page.find(id='nearby-theaters-select-list').find_all('option') # list of all theaters on page
+
+    return [{
+        'id': theater["value"].replace('/', '').replace('theater-page', '')[-5:] # end of url is theater id
+        ,'name': theater.text.strip()
+        ,'url': f'{fandango_url}{theater["value"]}'
+        ,'address': None # to be added later? probably not, doesn't seem especially useful and would require visiting each theater page
+    } for theater in theaters[1:]]
+
+def fetch_zip_theaters(zip_code):
+    """Get theaters that appear in search for a zip code once the rate limiter allows it
+
+    Keyword arguments:
+    zip_code - zip code as string
+
+    Returns:
+    list - theaters from parse_zip_page
+    """
+    url = f'{fandango_url}/{zip_code}_movietimes'
+
+    rate_limit.wait_for_token(url)
+
+    with metrics.timed('page_load'), urllib.request.urlopen(url, timeout=page_ready_timeout*2) as zip_search:
+        html = zip_search.read().decode('utf8')
+    metrics.count('pages')
+
+    with metrics.timed('parse'):
+        return parse_zip_page(html)
+
+def get_stale_zip_codes(zip_codes, conn):
+    """Get zip codes whose theater list is missing or older than zip_refresh_days
+
+    Keyword arguments:
+    zip_codes - list of zip codes as string
+    conn - database connection
+
+    Returns:
+    list - zip codes to search again, in the order given
+    """
+    fresh = set(pd.read_sql(f"SELECT zip_code FROM zip_searches WHERE date_collected > DATE('now', 'localtime', '-{int(zip_refresh_days)} days')", conn)['zip_code'])
+    return [zip_code for zip_code in dict.fromkeys(zip_codes) if zip_code not in fresh]
+
+def collect_theaters(zip_codes, conn, cursor):
+    """Get list of all theaters that appear in search for each provided zip code.
+
+    Zip codes searched within the last zip_refresh_days keep their stored theaters and are not fetched again
+
+    Keyword arguments:
+    zip_codes - list of zip codes as string
+    conn - database connection
+    cursor - cursor for database
+
+    Returns:
+    list - [ { id : theater id , name : theater name , url : theater url } ] of theaters found in zip codes that were searched
+    """
+    stale_zip_codes = get_stale_zip_codes(zip_codes, conn)
+    logger.info(f'Searching {len(stale_zip_codes)} of {len(set(zip_codes))} zip codes for theaters - the rest were searched in the last {zip_refresh_days} days')
+
+    theaters = {} # theater id -> theater, so a theater near several zip codes is only kept once
+    zip_theaters = {} # zip code -> theater ids
+
+    # pages are fetched in worker threads, everything is written to the database here
+    with ThreadPoolExecutor(max_workers=scrape_workers) as executor:
+        futures = {executor.submit(fetch_zip_theaters, zip_code): zip_code for zip_code in stale_zip_codes}
+        for future in futures:
+            zip_code = futures[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                # the zip code stays stale, so it is searched again next run
+                logger.error(f'Could not search zip code {zip_code}: {e}')
+                continue
+
+            for theater in found:
+                theaters.setdefault(theater['id'], theater)
+            zip_theaters[zip_code] = list(dict.fromkeys(theater['id'] for theater in found))
+            logger.info(f'Found {len(zip_theaters[zip_code])} theaters for zip code {zip_code}')
+
+    # insert data into theater and zip code tables
+    logger.info('Inserting theater data')
+    with metrics.timed('db_insert'), conn:
+        insert_theaters(list(theaters.values()), conn, cursor, commit=False)
+        for zip_code, theater_ids in zip_theaters.items():
+            # theaters no longer listed for a zip code are dropped with the old list
+            cursor.execute('DELETE FROM zip_codes WHERE zip_code = ?;', (zip_code,))
+            for theater_id in theater_ids:
+                insert_zip_code(zip_code, theater_id, cursor)
+            cursor.execute("INSERT OR REPLACE INTO zip_searches(zip_code, date_collected) VALUES(?, DATE('now', 'localtime'));", (zip_code,))
+
+    return list(theaters.values())
+
+def insert_theaters(theaters, conn, cursor, commit=True):
+    """Upsert theaters in a single batch
+
+    Keyword arguments:
+    theaters - DataFrame or list of dicts with id, name, and url
+    conn - database connection
+    cursor - cursor for database
+    commit - whether to commit once the batch is written
+
+    Returns:
+    None
+    """
+    if(isinstance(theaters, pd.DataFrame)):
+        theaters = theaters.to_dict('records')
+
+    query = """
+        INSERT INTO theaters(id, name, url, address)
+        VALUES(?, ?, ?, '')
+        ON CONFLICT(id) DO UPDATE SET
+            name = COALESCE(excluded.name, name)
+            ,address = COALESCE(excluded.address, address)
+            WHERE url = excluded.url
+        ;
+        """
+
+    cursor.executemany(query, [(theater['id'], theater['name'], theater['url'] if theater['url'] != None else '') for theater in theaters])
+
+    if(commit):
+        conn.commit()
+
+def get_movie_list(soup):
+    """Get the movies listed on a theater page
+
+    Keyword arguments:
+    soup - BeautifulSoup object of theater page
+
+    Returns:
+    list - [BeautifulSoup element of movie list item], or None if the page has no movie list
+    """
+    container = soup.find('ul', 'thtr-mv-list')
+
+    if(container is None):
+        logger.warning('no movies found')
+        return None
+
+    # list item must be direct child of container
+    return container.find_all('li', recursive=False)
+
+def claim_movie(movie_id):
+    """Mark a movie as handled, unless another page already handled it
+
+    Keyword arguments:
+    movie_id - id of movie
+
+    Returns:
+    bool - True if the movie had not been collected yet
+    """
+    with collected_movies_lock: # theaters are scraped concurrently, so check and claim the movie in one step
+        if(movie_id in collected_movies):
+            return False
+        collected_movies.add(movie_id)
+        return True
+
+def parse_movie(movie, movie_id):
+    """Get basic movie data from a movie list item on a theater page
+
+    Keyword arguments:
+    movie - BeautifulSoup element of movie list item
+    movie_id - id of movie
+
+    Returns:
+    dict - {id, name, url, release_year, runtime, rating, image_url}
+    """
+    image_sect = movie.find('img')#.find('a')
+    try:
+        # accounting for 2 types of image link storage
+        # if('data-fd-lazy-image' in image_sect.attrs):
+        #     movie_image_url = image_sect['data-fd-lazy-image']
+        # else:
+        #     movie_image_url = image_sect['style'].replace('background-image: url(\"', '').replace('\");', '')
+        movie_image_url = image_sect['src']
+    except:
+        logger.warning(f'no image found for movie {movie_id}')
+        movie_image_url = None
+
+    # detail_sect = movie.find('div', 'thtr-mv-list__detail')
+    detail_sect = movie.find('section', 'shared-movie-showtimes__movie-details')
+
+    # title_sect = detail_sect.find('h2', 'thtr-mv-list__detail-title')
+    title_sect = detail_sect.find('a', 'shared-movie-showtimes__movie-title-link')
+    movie_name, movie_year = split_title_year(get_text(title_sect))
+
+    movie_url = fandango_url + title_sect['href']
+
+    movie_info_sect = detail_sect.find('p', 'shared-showtimes__movie-data shared-showtimes__data-text')
+
+    try:
+        movie_rating = get_text(movie_info_sect.find('data', 'shared-showtimes__movie-rating')).split(':')[1].strip()
+    except Exception as e:
+        movie_rating = None
+        logger.warning(f'{e}, error with parsing rating')
+    
+    movie_info_text = get_text(movie_info_sect)
+    runtime_text = movie_info_text.split(':')[-1].strip()
+    try:
+        if('min' not in runtime_text):
+            movie_runtime = int(runtime_text.replace(' ', '').replace('hr', ''))*60
+            logger.warning(f'hr only runtime {movie_runtime}')
+        else: 
+            raw_runtime = runtime_text.replace(' min', '').replace(' ', '').split('hr')
+
+            movie_runtime = int(raw_runtime[0])*60 + int(raw_runtime[1])
+    except Exception as e:
+        movie_runtime = None
+        logger.warning(f'{e}, error with parsing runtime from {movie_info_text}')
+
+    # scores, genres and synopsis are filled in later from the movie info queue
+    return {
+            'id': movie_id
+            ,'name': movie_name
+            ,'url': movie_url
+            ,'release_year': movie_year
+            ,'runtime': movie_runtime
+            ,'rating': movie_rating
+            ,'image_url': movie_image_url
+    }
+
+def split_title_year(movie_name):
+    """Split the release year off the end of a movie title
+
+    Keyword arguments:
+    movie_name - title as listed, e.g. Elf (2003)
+
+    Returns:
+    [str - title without year, int - release year or None]
+    """
+    movie_year = None
+    try:
+        if(re.match(r'\([0-9]{4}\)', movie_name[-6:])):
+            movie_year = int(movie_name[-6:].replace('(', '').replace(')', ''))
+    except Exception:
+        movie_year = None
+        logger.warning(f'year not found for {movie_name}')
+    
+    if(movie_year is not None):
+        movie_name = movie_name[:-7]
+
+    return movie_name, movie_year
+
+def make_showtime(showtime_url, showtime_time, movie_id):
+    """Build a showtime from its ticketing url and listed time
+
+    Keyword arguments:
+    showtime_url - ticketing url, contains theater id (tid) and date (sdate)
+    showtime_time - time as listed on the theater page, e.g. 7:30p
+    movie_id - id of movie
+
+    Returns:
+    dict - {id, movie_id, theater_id, url, date, time, format}
+    """
+    theater_id = showtime_url.split('tid=')[1].split('&')[0].lower()
+
+    showtime_date = showtime_url.split('sdate=')[1].split('%')[0]
+
+    if('p' in showtime_time):
+        if(showtime_time.split(':')[0] != '12'):
+            showtime_time = f"{int(showtime_time.split(':')[0])+12}:{showtime_time.split(':')[1].replace('p', ':00')}"
+        else:
+            showtime_time = showtime_time.replace('p', ':00')
+    else:
+        showtime_time = showtime_time.replace('a', ':00')
+        if(len(showtime_time.split(':')[0]) == 1):
+            showtime_time = '0' + showtime_time
+
+    showtime_id = f'{movie_id}_{theater_id}_{showtime_date}_{showtime_time}'
+
+    showtime_format = None
+
+    return {
+        'id': showtime_id
+        ,'movie_id': movie_id
+        ,'theater_id': theater_id
+        ,'url': showtime_url
+        ,'date': showtime_date
+        ,'time': showtime_time
+        ,'format': showtime_format
+    }
+
+def parse_showtimes(movie, movie_id):
+    """Get showtimes from a movie list item on a theater page
+
+    Keyword arguments:
+    movie - BeautifulSoup element of movie list item
+    movie_id - id of movie
+
+    Returns:
+    list - [ {id, movie_id, theater_id, url, date, time, format} ]
+    """
+    showtimes = []
+
+    # for showtime_sect in movie.find_all('div', 'thtr-mv-list__amenity-group'):
+    for showtime_btn in movie.find_all('li', 'showtimes-btn-list__item'):
+        showtime = showtime_btn.find('a')
+
+        if(showtime is None): # showtime took place in the past
+            continue;
+
+        showtimes.append(make_showtime(showtime['href'], get_text(showtime), movie_id))
+
+    return showtimes
+
+def collect_movies_from_theater(soup):
+    movies = []
+
+    movie_list = get_movie_list(soup)
+    if(movie_list is None):
+        return movies
+
+    for movie in movie_list:
+        movie_id = movie['id'].replace('movie-', '')
+        if(not claim_movie(movie_id)):
+            continue;
+
+        movies.append(parse_movie(movie, movie_id))
+        
+    return movies
+
+def collect_showtimes_from_theater(soup):
+    showtimes = []
+
+    movie_list = get_movie_list(soup)
+    if(movie_list is None):
+        return showtimes
+
+    for movie in movie_list:
+        showtimes += parse_showtimes(movie, movie['id'].replace('movie-', ''))
+
+    return showtimes
+
+def collect_from_theater(soup):
+    """Get movies and showtimes from a theater page in a single pass over its movie list
+
+    Keyword arguments:
+    soup - BeautifulSoup object of theater page, ideally parsed by parse_theater_page
+
+    Returns:
+    [list of movie dicts, list of showtime dicts] - same as collect_movies_from_theater and collect_showtimes_from_theater
+    """
+    movies = []
+    showtimes = []
+
+    movie_list = get_movie_list(soup)
+    if(movie_list is None):
+        return movies, showtimes
+
+    for movie in movie_list:
+        movie_id = movie['id'].replace('movie-', '')
+
+        if(claim_movie(movie_id)):
+            movies.append(parse_movie(movie, movie_id))
+
+        showtimes += parse_showtimes(movie, movie_id)
+
+    return movies, showtimes
+
+def parse_movie_record(record, movie_id):
+    """Get basic movie data from a movie record captured from a theater page's json responses
+
+    Keyword arguments:
+    record - movie record from network_capture.find_movies
+    movie_id - id of movie
+
+    Returns:
+    dict - same fields as parse_movie
+    """
+    movie_name, movie_year = split_title_year(str(network_capture.first_field(record, network_capture.movie_name_fields)).strip())
+
+    movie_url = network_capture.first_field(record, network_capture.movie_url_fields)
+    if(movie_url is not None and not movie_url.startswith('http')):
+        movie_url = fandango_url + movie_url
+
+    movie_runtime = network_capture.first_field(record, network_capture.movie_runtime_fields)
+    movie_runtime = int(movie_runtime) if movie_runtime is not None and str(movie_runtime).isdigit() else None
+
+    movie_rating = network_capture.first_field(record, network_capture.movie_rating_fields)
+
+    return {
+            'id': movie_id
+            ,'name': movie_name
+            ,'url': movie_url
+            ,'release_year': movie_year
+            ,'runtime': movie_runtime
+            ,'rating': str(movie_rating) if movie_rating is not None else None
+            ,'image_url': network_capture.first_string(network_capture.first_field(record, network_capture.movie_poster_fields))
+    }
+
+def parse_showtime_records(record, movie_id):
+    """Get showtimes from a movie record captured from a theater page's json responses
+
+    Keyword arguments:
+    record - movie record from network_capture.find_movies
+    movie_id - id of movie
+
+    Returns:
+    list - same fields as parse_showtimes
+    """
+    showtimes = []
+
+    for showtime in network_capture.find_showtimes(record):
+        showtime_url = network_capture.first_field(showtime, network_capture.showtime_url_fields)
+
+        if(showtime_url is None or showtime.get('expired')): # showtime took place in the past
+            continue
+
+        # times are listed as 7:30 PM, 7:30p or 19:30 - make_showtime takes them the way the html lists them
+        showtime_time = str(network_capture.first_field(showtime, network_capture.showtime_time_fields)).lower().replace(' ', '').replace('m', '')
+        if(showtime_time[-1] not in ['a', 'p']):
+            hour, minute = showtime_time.split(':')[:2]
+            showtime_time = f'{(int(hour) + 11)%12 + 1}:{minute}{"p" if int(hour) >= 12 else "a"}'
+
+        showtimes.append(make_showtime(showtime_url, showtime_time, movie_id))
+
+    return showtimes
+
+def collect_from_payloads(payloads):
+    """Get movies and showtimes from the json responses a theater page loaded
+
+    Keyword arguments:
+    payloads - list of json payloads from network_capture.captured_payloads
+
+    Returns:
+    [list of movie dicts, list of showtime dicts] - same as collect_from_theater, or None if no movies were found so the html should be parsed instead
+    """
+    records = [record for payload in payloads for record in network_capture.find_movies(payload)]
+    if(records == []):
+        return None
+
+    movies = []
+    showtimes = []
+    claimed = []
+    try:
+        for record in records:
+            movie_id = str(network_capture.first_field(record, network_capture.movie_id_fields))
+
+            if(claim_movie(movie_id)):
+                claimed.append(movie_id)
+                movies.append(parse_movie_record(record, movie_id))
+
+            showtimes += parse_showtime_records(record, movie_id)
+    except Exception:
+        # records that don't look like expected are left to the html parsers, which need to claim the movies again
+        logger.warning(f'Captured responses could not be read\n{traceback.format_exc()}')
+        with collected_movies_lock:
+            collected_movies.difference_update(claimed)
+        return None
+
+    return movies, showtimes
+
+def load_fresh_movies(conn):
+    """Get movies whose detail page was fetched recently and parsed completely
+
+    Keyword arguments:
+    conn - database connection
+
+    Returns:
+    set - ids of movies with up to date details
+    """
+    fresh = pd.read_sql(f"""
+        SELECT id FROM movies
+            WHERE 1=1
+                AND rt_critic IS NOT NULL AND rt_critic != 'NULL'
+                AND rt_audience IS NOT NULL AND rt_audience != 'NULL'
+                AND genres IS NOT NULL AND genres != ''
+                AND synopsis IS NOT NULL AND synopsis != ''
+                AND info_updated >= DATETIME('now', 'localtime', '-{int(movie_info_ttl)} days')
+        """, conn)
+
+    movies = set(fresh['id'])
+
+    logger.info(f'{len(movies)} movies have up to date details')
+    return movies
+
+def journal_page(theater_id, date, showtimes, cursor):
+    """Record that a theater page has been collected and its data written
+
+    Keyword arguments:
+    theater_id - id of theater
+    date - date of theater page
+    showtimes - number of showtimes found on the page
+    cursor - cursor for database
+
+    Returns:
+    None
+    """
+    cursor.execute('INSERT OR REPLACE INTO page_journal(theater_id, date, date_collected, showtimes) VALUES(?, ?, DATE(\'now\', \'localtime\'), ?);', (theater_id, date.strftime('%Y-%m-%d'), showtimes))
+
+def collect_all_movies_and_showtimes(theaters, dates, conn, cursor, redo=False, dry_run=False, distributed=False):
+    global collected_movies
+    global fresh_movies
+
+    # only pages without fresh showtimes (or not fetched today, on a retry) are collected
+    planned, skipped = fetch_planner.plan_pages(theaters, dates, conn, redo=redo)
+    for row, date, reason in skipped:
+        logger.info(f'Skipping date {datetime.strftime(date, "%Y-%m-%d")} for theater {row["name"]} - {reason}')
+
+    if(dry_run):
+        logger.info(fetch_planner.plan_report(planned, skipped))
+        return
 
-def initialize_db(db_name):
-    """Connect to sqlite3 database
+    # movies claimed by a failed attempt were never inserted, so every attempt starts over
+    collected_movies = set()
+    fresh_movies = load_fresh_movies(conn)
 
-    Keyword arguments:
-    db_name - name of database
+    failed_theaters = []
+    pending_pages = {} # theater id -> number of pages not yet written
+    work = [] # [theater row, date, failed attempts, earliest time of next attempt]
 
-    Returns:
-    [database connection, connection cursor]
-    """
-    conn = sqlite3.connect(db_name)
-    return conn, conn.cursor()
+    for row, date in planned:
+        work.append([row, date, 0, 0])
+        pending_pages[row['id']] = pending_pages.get(row['id'], 0) + 1
 
-def get_zip_codes(conn):
-    """Get list of zip codes to be used for locating theaters. 
+    for index, row in theaters.iterrows():
+        if(row['id'] not in pending_pages):
+            theater_date_update(row['id'], conn, cursor)
+
+    if(distributed):
+        collect_distributed(planned, conn, cursor)
+        return
+
+    # pages are fetched and parsed by worker threads, database writes stay on this thread since the connection can't be shared
+    # failed pages are retried with backoff while the rest continue, and a theater that keeps failing is parked until the next run
+    with ThreadPoolExecutor(max_workers=scrape_workers) as executor:
+        running = {}
+        while work or running:
+            now = monotonic()
+            for item in list(work):
+                if(len(running) >= scrape_workers):
+                    break
+                row, date, attempts, not_before = item
+                if(not_before > now or retry_policy.breaker_open(row['id'])):
+                    if(retry_policy.breaker_wait(row['id']) > 0):
+                        drop_parked_theater(row, work, failed_theaters)
+                    continue
+
+                work[:] = [other for other in work if other is not item]
+                running[executor.submit(scrape_page, row, date)] = item
+
+            if(not running):
+                if(not work):
+                    break
+                # everything left is waiting on a backoff
+                next_attempt = min(item[3] - now for item in work)
+                logger.info(f'Waiting {round(next_attempt)} seconds for the next retry')
+                with metrics.timed('sleep'):
+                    sleep(max(1, next_attempt))
+                continue
 
-    Keyword Arguments:
-    from_file - whether to read zip codes from file (1) or take user input (0)
-    filename - relative path to read zip codes from when from_file == 1
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                row, date, attempts, not_before = running.pop(future)
+                try:
+                    new_movies, new_showtimes = future.result()
+                except Exception:
+                    logger.error(f'Collection failed for theater {row["name"]} on {date} (attempt {attempts + 1})\n{traceback.format_exc()}')
+                    retry_policy.record_failure(row['id'])
 
-    Returns:
-    list - [str zip code, str zip code, str zip code]
-    """
+                    if(attempts + 1 >= retry_policy.max_attempts):
+                        logger.error(f'Giving up on theater {row["name"]} on {date} for this run')
+                        if(row['name'] not in failed_theaters):
+                            failed_theaters.append(row['name'])
+                    else:
+                        work.append([row, date, attempts + 1, monotonic() + retry_policy.backoff_delay(attempts)])
 
-    # zip codes to check are those with active subscriptions
-    return list(pd.read_sql('SELECT DISTINCT zip_code FROM subscriptions WHERE active=1;', conn)['zip_code'])
+                    if(retry_policy.breaker_wait(row['id']) > 0):
+                        drop_parked_theater(row, work, failed_theaters)
+                    continue
 
-def get_soup(theater, url, date):
-    """Get BeautifulSoup object of a page
+                retry_policy.record_success(row['id'])
 
-    Keyword Arguments:
-    theater - name of theater
-    url - base url of theater (https://www.fandango.com/shu-community-theatre-aabqu/theater-page)
-    date - date of showings to collect
-    browser - selenium browser
+                with metrics.timed('db_insert'), conn:
+                    write_page(row, date, new_movies, new_showtimes, conn, cursor)
 
-    Returns:
-    BeautifulSoup object
-    """
+                    pending_pages[row['id']] -= 1
+                    if(pending_pages[row['id']] == 0):
+                        logger.info(f'Updating theater date_updated for {row["name"]}')
+                        theater_date_update(row['id'], conn, cursor, commit=False)
 
-    # date must be in YYYY-mm-dd format for url
-    formatted_date = date.strftime('%Y-%m-%d')
+    given_up = sum(pending_pages.values())
+    finish_collection(len(planned) - given_up, given_up, f'{len(failed_theaters)} theaters: {", ".join(failed_theaters)}')
 
-    # full url incorporates date restriction
-    full_url = f'{url}?cmp=theater-module&format=all&date={formatted_date}'
-    
-    logger.info(f'current theater: {theater} | current date: {date} | address: {full_url}')
-    
-    # try to get html until page loads properly - max 10 attempts
-    for i in range(10):
+def finish_collection(pages_written, pages_given_up, failures):
+    """Report pages given up on, failing the run only if none of the planned pages were written
 
-        browser = browser_init()
+    Keyword arguments:
+    pages_written - number of planned pages written
+    pages_given_up - number of planned pages given up on for this run
+    failures - description of what was given up on
 
-        browser.get(full_url)
+    Returns:
+    None
 
+    Pages given up on aren't journaled, so the next run's plan picks them up again - the rest of the run goes ahead with what was written
+    """
+    if(pages_given_up == 0):
+        return
 
-        soup = BeautifulSoup(browser.page_source, 'html.parser')
+    metrics.count('pages_given_up', pages_given_up)
 
-        browser.quit()
-        
-        sleep(random.randint(sleep_amt//2, sleep_amt)) # wait time incorporated so my ip doesn't get banned again
+    if(pages_written == 0):
+        raise Exception(f'Collection failed for every planned page - {failures}')
 
-        # if offline__header exists, page hasn't loaded properly
-        container = soup.find('h1', 'offline__header')
-        if(container is None):
-            break;
-        else:
-            logger.warning('offline')
-            sleep(60)
-    return soup
+    logger.error(f'Gave up on {pages_given_up} pages for this run, {pages_written} were written - {failures}')
 
-def get_text(soup):
-    """Get text from a BeautifulSoup element
+def drop_parked_theater(row, work, failed_theaters):
+    """Give up on a parked theater's remaining pages for this run instead of waiting out the park
 
     Keyword arguments:
-    soup - BeautifulSoup element
+    row - theater row with id and name
+    work - list of [theater row, date, failed attempts, earliest time of next attempt] still to be collected, dropped pages are removed from it
+    failed_theaters - list of names of theaters given up on, added to
 
     Returns:
-    str - cleaned text of element
+    None
     """
+    dropped = len([item for item in work if item[0]['id'] == row['id']])
+    if(dropped == 0):
+        return
 
-    return soup.text.replace('\n', '').replace('\t', '').replace('\'', '\'\'').strip()
+    # rows are Series, which can't be compared, so work is filtered by theater id rather than removed from item by item
+    work[:] = [item for item in work if item[0]['id'] != row['id']]
 
-def select_all_from_table(tablename, conn):
-    """Select all data from a given table in database
+    # the pages aren't journaled, so the next run's plan picks them up again
+    logger.error(f'Theater {row["name"]} is parked - leaving its {dropped} remaining pages for the next run')
+    if(row['name'] not in failed_theaters):
+        failed_theaters.append(row['name'])
+
+def write_page(row, date, new_movies, new_showtimes, conn, cursor):
+    """Write one theater page's movies and showtimes along with its journal entry
 
     Keyword arguments:
-    tablename - name of table in database to query
+    row - theater row with id and name
+    date - date of theater page
+    new_movies - list of movie dicts from the page
+    new_showtimes - list of showtime dicts from the page
     conn - database connection
+    cursor - cursor for database
 
     Returns:
-    pd.DataFrame - all data from table
-    """
-
-    return pd.read_sql_query(f'SELECT * FROM {tablename}', conn)
+    None
 
-def get_subscriptions():
-    """Get subscription and theater data from django app database
+    Nothing is committed - callers wrap this in one transaction, so a crash loses at most the pages in flight
     """
+    logger.info(f'Inserting movies and showtimes for {row["name"]} on {date}')
+    if(new_movies != []):
+        insert_movies(new_movies, conn, cursor, commit=False)
+        queue_movie_info([movie for movie in new_movies if movie['id'] not in fresh_movies], conn, cursor, commit=False)
+    if(new_showtimes != []):
+        insert_showtimes(new_showtimes, conn, cursor, commit=False)
 
-    logger.info('Connecting to django app database')
-    conn, cursor = initialize_db(app_db)
+    journal_page(row['id'], date, len(new_showtimes), cursor)
 
-    logger.info('Collecting subscription data')
-    active_users = pd.read_sql('SELECT id, username, first_name, last_name, email FROM auth_user WHERE is_active=1', conn)
-    all_theaters = pd.read_sql('SELECT id, name, url FROM subscriptions_theater WHERE id IN (SELECT DISTINCT theater_id FROM subscriptions_subscription)', conn)
-    all_subscriptions = pd.read_sql('SELECT user_id, theater_id FROM subscriptions_subscription', conn)
+    metrics.count('movies', len(new_movies))
+    metrics.count('showtimes', len(new_showtimes))
 
-    # take only active data
-    subscriptions = sql('SELECT s.user_id, s.theater_id FROM all_subscriptions s INNER JOIN active_users u ON u.id = s.user_id').df()
-    theaters = sql('SELECT t.id, t.name, t.url FROM all_theaters t INNER JOIN subscriptions s ON s.theater_id = t.id').df()
-    
-    logger.info('Subscription data colelcted - closing database connection')
-    conn.close()
+def scrape_page(row, date):
+    """Fetch and parse one date of one theater
 
-    return subscriptions, theaters
+    Keyword arguments:
+    row - theater row with id, name, and url
+    date - date to collect
 
-def get_subscriptions_api():
-    """Get subscription and theater data from django app api
+    Returns:
+    [list of movie dicts, list of showtime dicts]
     """
+    html, payloads = get_theater_page(row['name'], row['url'], date)
 
-    logger.info('Collecting subscription data from API')
-    all_subscriptions = pd.DataFrame(requests.get(os.environ['WEBAPP_BASEURL'] + 'api/subscriptions/', headers={'Authorization': f'Token {os.environ["API_KEY"]}'}).json())
-    
-    logger.info('Collecting theater data from API')
-    all_theaters = pd.DataFrame(requests.get(os.environ['WEBAPP_BASEURL'] + 'api/theaters/', headers={'Authorization': f'Token {os.environ["API_KEY"]}'}).json())
-
-    logger.info('Collecting user data from API')
-    all_users = pd.DataFrame(requests.get(os.environ['WEBAPP_BASEURL'] + 'api/users/', headers={'Authorization': f'Token {os.environ["API_KEY"]}'}).json())
-
-    logger.info('Restricting data to active only')
+    if(payloads != []):
+        with metrics.timed('parse'):
+            collected = collect_from_payloads(payloads)
+        if(collected is not None):
+            return collected
+        logger.warning(f'No movies found in captured responses for {row["name"]} on {date} - parsing html instead')
 
-    active_users = sql('SELECT * FROM all_users WHERE is_active=1').df()
-    active_subscriptions = sql('SELECT * FROM all_subscriptions WHERE user_id IN (SELECT DISTINCT id FROM active_users)').df()
-    active_theaters = sql('SELECT * FROM all_theaters WHERE id IN (SELECT DISTINCT theater_id FROM active_subscriptions)').df()
+    soup = parse_theater_page(html)
 
-    logger.info('API data collected')
-    return active_subscriptions, active_theaters
+    with metrics.timed('parse'):
+        return collect_from_theater(soup)
 
+def queue_movie_info(movies, conn, cursor, commit=True):
+    """Add movies to the job queue for their detail pages to be fetched
 
-def insert_zip_code(zip_code, theater_id, cursor):
-    """Insert zip code data into database
-    
     Keyword arguments:
-    zip_code - zip code as string
-    theater_id - id of theater as string
+    movies - list of movie dicts with id and url
+    conn - database connection
     cursor - cursor for database
-    
+    commit - whether to commit once the batch is written
+
     Returns:
     None
     """
+    logger.info(f'Queueing movie info for {len(movies)} movies')
+    for movie in movies:
+        # a movie is fetched at most once a day, even if its details are still incomplete and it is on many more pages
+        job_queue.enqueue('movie_info', f'movie_info:{movie["id"]}', {'movie_id': movie['id'], 'url': movie['url']}, cursor, requeue_today=False)
 
-    query = f"""
-        INSERT OR IGNORE INTO zip_codes(zip_code, theater_id)
-        VALUES(
-            '{zip_code}'
-            ,'{theater_id}'
-        );
-        """
-    
-    cursor.execute(query)
+    if(commit):
+        conn.commit()
 
-def collect_theaters(zip_codes, conn, cursor):
-    """Get list of all theaters that appear in search for each provided zip code.
+def update_movie_info(movie_id, movie_info, conn, cursor):
+    """Write fetched movie details
 
     Keyword arguments:
-    zip_codes - list of zip codes as string
+    movie_id - id of movie
+    movie_info - dict returned by get_movie_info
+    conn - database connection
+    cursor - cursor for database
 
     Returns:
-    list - [ { id : theater id , name : theater name , url : theater url } ]
+    None
     """
+    # details missing from this fetch keep what was stored before
+    cursor.execute("""
+        UPDATE movies SET
+            rt_critic = COALESCE(?, rt_critic)
+            ,rt_audience = COALESCE(?, rt_audience)
+            ,genres = COALESCE(?, genres)
+            ,synopsis = COALESCE(?, synopsis)
+            ,info_updated = COALESCE(?, info_updated)
+            WHERE id = ?
+        ;
+        """, (movie_info['rt_critic'], movie_info['rt_audience'], movie_info['genres'], movie_info['synopsis'], movie_info['info_updated'], movie_id))
 
-    theater_list = []
-    for zip_code in zip_codes:
-        url = f'https://www.fandango.com/{zip_code}_movietimes'
-
-        zip_search = urllib.request.urlopen(url)
-        zip_search_page = BeautifulSoup(zip_search.read().decode('utf8'), 'html.parser')
-
-        sleep(sleep_amt)
+    if(cursor.rowcount > 0 and movie_info['info_updated'] is not None):
+        global progress_made
+        progress_made = True
 
-        zip_search.close()
+def enrich_movies(stop_event=None):
+    """Fetch detail pages for queued movies on a separate rate budget from theater pages
 
-        theaters = zip_search_page.find(id='nearby-theaters-select-list').find_all('option') # list of all theaters on page
+    Keyword arguments:
+    stop_event - threading.Event; if given, keep waiting for new movies until it is set, otherwise stop once the queue is empty
 
-        for theater in theaters[1:]:
-            theater_dict = {}
-            theater_dict['id'] = theater["value"].replace('/', '').replace('theater-page', '')[-5:] # end of url is theater id
-            theater_dict['name'] = theater.text.strip()
-            theater_dict['url'] = f'https://www.fandango.com{theater["value"]}'
-            theater_dict['address'] = None # to be added later? probably not, doesn't seem especially useful and would require visiting each theater page
+    Returns:
+    int - number of movies enriched
+    """
+    enriched = work_jobs(['movie_info'], stop_event)
 
-            if(theater_dict not in theater_list):
-                theater_list.append(theater_dict)
+    logger.info(f'Enriched {enriched} movies')
+    return enriched
 
-            # insert data into zip code table
-            logger.info(f'Adding {theater_dict["name"]} for zip code {zip_code}')
-            insert_zip_code(zip_code, theater_dict['id'], cursor)
-    
-    # insert data into theater table
-    logger.info('Inserting theater data')
-    insert_theaters(theater_list, conn, cursor)
+def work_jobs(kinds, stop_event=None, idle_seconds=0):
+    """Claim and run jobs from the shared job queue until there are none left
 
-def insert_theaters(theaters, conn, cursor):
-    # loop through all theaters
-    for index, row in theaters.iterrows():
-        query = f"""
-        INSERT INTO theaters(id, name, url, address)
-        VALUES(
-            '{row['id']}'
-            ,'{row['name'].replace("'", "''")}'
-            ,'{row['url'] if row['url'] != None else ''}'
-            ,''
-        )
-        ON CONFLICT(id) DO UPDATE SET
-            name = COALESCE(excluded.name, name)
-            ,address = COALESCE(excluded.address, address)
-            WHERE url = excluded.url
-        ;
-        """
+    Keyword arguments:
+    kinds - list of job kinds to work on, 'theater_page' and/or 'movie_info'
+    stop_event - threading.Event; if given, keep waiting for new jobs until it is set, otherwise stop once no jobs are queued or leased
+    idle_seconds - seconds to keep waiting for new jobs once none are queued or leased
 
-        cursor.execute(query)
+    Returns:
+    int - number of jobs completed
+    """
+    # every worker needs its own connection, whether it is a thread or a process on another host
+    conn, cursor = initialize_db(db_location)
+    worker = job_queue.worker_name()
+    completed = 0
+    idle_since = monotonic()
 
-    conn.commit()
-    global progress_made
-    progress_made = True
+    try:
+        while stop_event is None or not stop_event.is_set():
+            job = job_queue.claim(conn, worker, kinds)
+
+            if(job is None):
+                if(stop_event is None and job_queue.pending(conn, kinds) == 0 and monotonic() - idle_since >= idle_seconds):
+                    break
+                # jobs leased by other workers come back if their lease expires
+                if(stop_event is None):
+                    sleep(job_queue.poll_seconds)
+                else:
+                    stop_event.wait(job_queue.poll_seconds)
+                continue
 
-def collect_movies_from_theater(soup):
-    global collected_movies
-    movies = []
-    
-    container = soup.find('ul', 'thtr-mv-list')
+            idle_since = monotonic()
+            heartbeat = job_queue.start_heartbeat(db_location, job['id'], worker)
+            try:
+                if(job['kind'] == 'theater_page'):
+                    run_theater_page_job(job, worker, conn, cursor)
+                else:
+                    run_movie_info_job(job, worker, conn, cursor)
+                completed += 1
+            except Exception:
+                logger.error(f'Job {job["id"]} ({job["kind"]}) failed on attempt {job["attempts"]}\n{traceback.format_exc()}')
+
+                max_attempts = retry_policy.max_attempts if job['kind'] == 'theater_page' else max_info_attempts
+                parked = False
+                if(job['theater_id'] is not None):
+                    retry_policy.record_failure(job['theater_id'])
+                    parked = retry_policy.breaker_wait(job['theater_id']) > 0
+
+                # a parked theater isn't waited out, its pages are left for the next run
+                if(job_queue.fail(conn, job, worker, 0 if parked else max_attempts, retry_policy.backoff_delay(job['attempts'] - 1))):
+                    logger.error(f'Giving up on job {job["id"]} after {job["attempts"]} attempts')
+                if(parked):
+                    dropped = job_queue.give_up_theater(conn, [job['kind']], job['theater_id'])
+                    logger.error(f'Theater {job["theater_id"]} is parked - leaving its {dropped} remaining queued pages for the next run')
+            finally:
+                heartbeat.set()
+                idle_since = monotonic()
+    finally:
+        conn.close()
 
-    if(container is None):
-        logger.warning('no movies found')
-        return movies
+    return completed
 
-    for movie in container.find_all('li'):
-        if(not movie.parent.__eq__(container)): # list item must be direct child of container
-            continue;
+def run_theater_page_job(job, worker, conn, cursor):
+    """Collect one theater page claimed from the job queue and write its data
 
-        movie_id = movie['id'].replace('movie-', '')
-        if(movie_id in collected_movies):
-            continue;
-        else:
-            collected_movies.append(movie_id)
+    Keyword arguments:
+    job - job dict returned by job_queue.claim
+    worker - name of worker holding the lease
+    conn - database connection
+    cursor - cursor for database
 
-        image_sect = movie.find('img')#.find('a')
-        try:
-            # accounting for 2 types of image link storage
-            # if('data-fd-lazy-image' in image_sect.attrs):
-            #     movie_image_url = image_sect['data-fd-lazy-image']
-            # else:
-            #     movie_image_url = image_sect['style'].replace('background-image: url(\"', '').replace('\");', '')
-            movie_image_url = image_sect['src']
-        except:
-            logger.warning(f'no image found for movie {movie_id}')
-            movie_image_url = None
+    Returns:
+    None
+    """
+    row = job['payload']
+    date = datetime.strptime(row['date'], '%Y-%m-%d').date()
 
-        # detail_sect = movie.find('div', 'thtr-mv-list__detail')
-        detail_sect = movie.find('section', 'shared-movie-showtimes__movie-details')
+    new_movies, new_showtimes = scrape_page(row, date)
+    retry_policy.record_success(row['id'])
 
-        # title_sect = detail_sect.find('h2', 'thtr-mv-list__detail-title')
-        title_sect = detail_sect.find('a', 'shared-movie-showtimes__movie-title-link')
-        movie_name = get_text(title_sect)
+    with metrics.timed('db_insert'), conn:
+        write_page(row, date, new_movies, new_showtimes, conn, cursor)
+        job_queue.complete(cursor, job['id'], worker)
 
-        movie_year = None
-        try:
-            if(re.match(r'\([0-9]{4}\)', get_text(title_sect)[-6:])):
-                movie_year = int(get_text(title_sect)[-6:].replace('(', '').replace(')', ''))
-        except Exception:
-            movie_year = None
-            logger.warning(f'year not found for {movie_name}')
-        
-        if(movie_year is not None):
-            movie_name = movie_name[:-7]
+        # the theater is up to date once none of its pages are left, including pages given up on
+        if(job_queue.pending(conn, ['theater_page'], row['id'], include_failed=True) == 0):
+            logger.info(f'Updating theater date_updated for {row["name"]}')
+            theater_date_update(row['id'], conn, cursor, commit=False)
 
-        movie_url = 'https://www.fandango.com' + title_sect['href']
+def run_movie_info_job(job, worker, conn, cursor):
+    """Fetch one movie detail page claimed from the job queue and write its details
 
-        movie_info_sect = detail_sect.find('p', 'shared-showtimes__movie-data shared-showtimes__data-text')
+    Keyword arguments:
+    job - job dict returned by job_queue.claim
+    worker - name of worker holding the lease
+    conn - database connection
+    cursor - cursor for database
 
-        try:
-            movie_rating = get_text(movie_info_sect.find('data', 'shared-showtimes__movie-rating')).split(':')[1].strip()
-        except Exception as e:
-            movie_rating = None
-            logger.warning(f'{e}, error with parsing rating')
-        
-        runtime_text = get_text(movie_info_sect).split(':')[-1].strip()
-        try:
-            if('min' not in runtime_text):
-                movie_runtime = int(runtime_text.replace(' ', '').replace('hr', ''))*60
-                logger.warning(f'hr only runtime {movie_runtime}')
-            else: 
-                raw_runtime = runtime_text.replace(' min', '').replace(' ', '').split('hr')
-
-                movie_runtime = int(raw_runtime[0])*60 + int(raw_runtime[1])
-        except Exception as e:
-            movie_runtime = None
-            logger.warning(f'{e}, error with parsing runtime from {get_text(movie_info_sect)}')
-
-        movie_info = get_movie_info(movie_url)
-        
-        movie_dict = {
-                'id': movie_id
-                ,'name': movie_name
-                ,'url': movie_url
-                ,'release_year': movie_year
-                ,'runtime': movie_runtime
-                ,'rating': movie_rating
-                ,'image_url': movie_image_url
-        }
-        movie_dict.update(movie_info)
-
-        movies.append(movie_dict)
-        
-    return movies
+    Returns:
+    None
+    """
+    movie_info = get_movie_info(job['payload']['url'])
 
-def collect_showtimes_from_theater(soup):
-    showtimes = []
+    with metrics.timed('db_insert'), conn:
+        update_movie_info(job['payload']['movie_id'], movie_info, conn, cursor)
+        job_queue.complete(cursor, job['id'], worker)
 
-    container = soup.find('ul', 'thtr-mv-list')
+    metrics.count('movies_enriched')
 
-    if(container is None):
-        logger.warning('no movies found')
-        return showtimes
+def collect_distributed(planned, conn, cursor):
+    """Queue planned theater pages as jobs and work on them alongside any other worker processes
 
-    for movie in container.find_all('li'):
-        if(not movie.parent.__eq__(container)): # list item must be direct child of container
-            continue;
+    Keyword arguments:
+    planned - list of (theater row, date) to fetch
+    conn - database connection
+    cursor - cursor for database
 
-        # for showtime_sect in movie.find_all('div', 'thtr-mv-list__amenity-group'):
-        for showtime_btn in movie.find_all('li', 'showtimes-btn-list__item'):
-            showtime = showtime_btn.find('a')
+    Returns:
+    None
+    """
+    with conn:
+        job_queue.cleanup(cursor)
+        for row, date in planned:
+            formatted_date = date.strftime('%Y-%m-%d')
+            job_queue.enqueue('theater_page', f'theater_page:{row["id"]}:{formatted_date}', {'id': row['id'], 'name': row['name'], 'url': row['url'], 'date': formatted_date}, cursor, theater_id=row['id'])
 
-            if(showtime is None): # showtime took place in the past
-                continue;
+    logger.info(f'Queued {len(planned)} theater pages - working with {scrape_workers} local workers')
 
-            showtime_url = showtime['href']
+    # this process works the queue too, any workers started with run_worker share the load
+    with ThreadPoolExecutor(max_workers=scrape_workers) as executor:
+        for future in [executor.submit(work_jobs, ['theater_page']) for i in range(scrape_workers)]:
+            future.result()
 
-            movie_id = movie['id'].replace('movie-', '')
+    failed_jobs = job_queue.failed(conn, ['theater_page'])
+    finish_collection(len(planned) - len(failed_jobs), len(failed_jobs), f'{len(failed_jobs)} theater pages: {", ".join(job_key for job_key, theater_id in failed_jobs)}')
 
-            theater_id = showtime_url.split('tid=')[1].split('&')[0].lower()
+def run_worker(headless_val=False, lean=False, capture=False):
+    """Work on the shared job queue as an extra worker process, until no jobs are left for job_queue.idle_seconds
 
-            showtime_date = showtime_url.split('sdate=')[1].split('%')[0]
+    Keyword arguments:
+    headless_val - whether to run browsers in headless mode
+    lean - whether to block non-essential resources, see lean_mode
+    capture - whether to read showtimes from captured json responses, see capture_mode
 
-            showtime_time = get_text(showtime)
+    Returns:
+    int - number of jobs completed
+    """
+    global headless
+    global lean_mode
+    global capture_mode
+    global fresh_movies
+    headless = headless_val
+    lean_mode = lean
+    capture_mode = capture
 
-            if('p' in showtime_time):
-                if(showtime_time.split(':')[0] != '12'):
-                    showtime_time = f"{int(showtime_time.split(':')[0])+12}:{showtime_time.split(':')[1].replace('p', ':00')}"
-                else:
-                    showtime_time = showtime_time.replace('p', ':00')
-            else:
-                showtime_time = showtime_time.replace('a', ':00')
-                if(len(showtime_time.split(':')[0]) == 1):
-                    showtime_time = '0' + showtime_time
-
-            showtime_id = f'{movie_id}_{theater_id}_{showtime_date}_{showtime_time}'
-
-            showtime_format = None
-
-            showtimes.append(
-                {
-                    'id': showtime_id
-                    ,'movie_id': movie_id
-                    ,'theater_id': theater_id
-                    ,'url': showtime_url
-                    ,'date': showtime_date
-                    ,'time': showtime_time
-                    ,'format': showtime_format
-                }
-            )
+    start_time = load_config()
+    logger.info(f'Starting worker {job_queue.worker_name()} {start_time.strftime("%m/%d/%Y %H:%M:%S")}')
 
-    return showtimes
+    # theater pages this worker writes only queue movie info for movies without up to date details
+    conn, cursor = initialize_db(db_location)
+    try:
+        fresh_movies = load_fresh_movies(conn)
+    finally:
+        conn.close()
 
-def collect_all_movies_and_showtimes(theaters, dates, conn, cursor, redo=False):
-    # skip theaters that have showtime data one week away - these have already gone through the data collection process
-    # smaller theaters that do not have screenings one week away but do have screenings within the following week will be rechecked in this scenario, but this is uncommon and shouldn't be an issue
-    if(not redo):
-        skip_theaters = list(pd.read_sql('SELECT DISTINCT id FROM theaters WHERE date_updated = DATE(\'now\', \'localtime\')', conn)['id'])
-    else:
-        skip_theaters = []
+    try:
+        # a worker may be started before the main run has queued anything
+        return work_jobs(['theater_page', 'movie_info'], idle_seconds=job_queue.idle_seconds)
+    finally:
+        close_browser_pool()
 
-    for index, row in theaters.iterrows():
-        # logger.info(f'Theater switching to {row["name"]}')
-        if(row['id'] in skip_theaters):
-            logger.info(f'Skipping theater {row["name"]} - data already collected')
-            continue;
+        end_time = datetime.now()
+        logger.info(f'Worker finished {end_time.strftime("%m/%d/%Y %H:%M:%S")}, total runtime: {(end_time-start_time).total_seconds()} seconds')
 
-        new_movies = []
-        new_showtimes = []
-        for date in dates:
-            if(row['date_updated'] is not None and date <= datetime.strptime(row['date_updated'], '%Y-%m-%d').date()+timedelta(days=6)):
-                logger.info(f'Skipping date {datetime.strftime(date, "%Y-%m-%d")} for theater {row["name"]} - data already collected.')
-                continue
-            soup = get_soup(row['name'], row['url'], date)
-            
-            new_movies += collect_movies_from_theater(soup)
-            new_showtimes += collect_showtimes_from_theater(soup)
-        
-        logger.info(f'Inserting movies and showtimes for {row["name"]}')
-        if(new_movies != []):
-            insert_movies(new_movies, conn, cursor)
-        if(new_showtimes != []):
-            insert_showtimes(new_showtimes, conn, cursor)
+def run_enrichment():
+    """Drain whatever is left in the movie info queue after data collection
 
-        logger.info(f'Updating theater date_updated for {row["name"]}')
-        theater_date_update(row['id'], conn, cursor)
+    Returns:
+    int - number of movies enriched
+    """
+    start_time = datetime.now()
 
-        # logger.info('Closing browser')
-        # browser.quit()
+    try:
+        return enrich_movies()
+    finally:
+        close_browser_pool()
 
-        # browser = browser_init()
+        end_time = datetime.now()
+        logger.info(f'Enrichment finished {end_time.strftime("%m/%d/%Y %H:%M:%S")}, total runtime: {(end_time-start_time).total_seconds()} seconds')
 
 def get_movie_info(url):
     logger.info(f'Collecting movie info at {url}')
-    browser = browser_init()
 
-    page = browser.get(url)
-    movie = BeautifulSoup(browser.page_source, 'html.parser')
+    html = page_cache.get_page(url)
+    cached = html is not None
+    if(not cached):
+        html = fetch_page(url, bucket='movie_info', ready_selector=movie_ready_selector)
+
+    with metrics.timed('parse'):
+        movie_info = parse_movie_info(html)
+
+    # error pages were caught by their status in fetch_page - a page without any details leaves the stored ones alone and isn't cached, so the next fetch asks again
+    if(not cached and movie_info['info_updated'] is not None):
+        page_cache.store_page(url, html)
+    return movie_info
+
+def parse_movie_info(html):
+    """Get scores, genres and synopsis from a movie detail page
 
-    browser.quit()
+    Keyword arguments:
+    html - html of movie detail page
 
-    sleep(sleep_amt)
+    Returns:
+    dict - {rt_critic, rt_audience, genres, synopsis, info_updated}, info_updated is None if none of the details were found
+    """
+    movie = BeautifulSoup(html, 'html.parser')
 
     ratings = movie.findAll('span', 'rottentomatoes-rating')
     if(len(ratings) == 2):
@@ -539,32 +1543,72 @@ def get_movie_info(url):
     else:
         synopsis = None
 
-    return {'rt_critic': rt_critic, 'rt_audience': rt_audience, 'genres': genres, 'synopsis': synopsis}
+    # info_updated is only set when the page had details, so a page that didn't parse is fetched again next run
+    parsed = any(value is not None for value in [rt_critic, rt_audience, genres, synopsis])
+
+    return {'rt_critic': rt_critic, 'rt_audience': rt_audience, 'genres': genres, 'synopsis': synopsis, 'info_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S') if parsed else None}
+
+def update_schema(conn, cursor):
+    """Add columns introduced after the original table definitions to an existing database
+
+    Keyword arguments:
+    conn - database connection
+    cursor - cursor for database
+
+    Returns:
+    None
+    """
+    movie_columns = list(pd.read_sql('PRAGMA table_info(movies)', conn)['name'])
+    if('info_updated' not in movie_columns):
+        logger.info('Adding info_updated column to movies')
+        cursor.execute('ALTER TABLE movies ADD COLUMN info_updated datetime;')
+
+    job_queue.create_table(cursor)
+
+    # movies waiting in the old movie info queue move over to the job queue
+    if(len(pd.read_sql("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'movie_info_queue'", conn)) > 0):
+        logger.info('Moving movie_info_queue into scrape_jobs')
+        queued = pd.read_sql('SELECT movie_id AS id, url FROM movie_info_queue', conn)
+        queue_movie_info(queued.to_dict('records'), conn, cursor, commit=False)
+        cursor.execute('DROP TABLE movie_info_queue;')
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS page_journal(
+            theater_id text not null
+            ,date date not null
+            ,date_collected date not null
+            ,showtimes int
+            ,PRIMARY KEY(theater_id, date)
+            ,FOREIGN KEY (theater_id) REFERENCES theaters(id)
+        );
+        """)
+    journal_columns = list(pd.read_sql('PRAGMA table_info(page_journal)', conn)['name'])
+    if('showtimes' not in journal_columns):
+        logger.info('Adding showtimes column to page_journal')
+        cursor.execute('ALTER TABLE page_journal ADD COLUMN showtimes int;')
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS zip_searches(
+            zip_code text primary key
+            ,date_collected date not null
+        );
+        """)
+
+    # older entries are no longer used to plan fetches
+    cursor.execute(f"DELETE FROM page_journal WHERE date_collected < DATE('now', 'localtime', '-{int(fetch_planner.history_days)} days');")
 
-def theater_date_update(theater_id, conn, cursor):
-    cursor.execute(f"UPDATE theaters SET date_updated = CURRENT_DATE WHERE id='{theater_id}';")
     conn.commit()
-    global progress_made
-    progress_made = True
 
-def insert_movies(movies, conn, cursor):
+def theater_date_update(theater_id, conn, cursor, commit=True):
+    cursor.execute('UPDATE theaters SET date_updated = CURRENT_DATE WHERE id = ?;', (theater_id,))
+    if(commit):
+        conn.commit()
+
+def insert_movies(movies, conn, cursor, commit=True):
     logger.info(f'Inserting {len(movies)} movies')
-    for movie in movies:
-        query = f"""
-        INSERT INTO movies(id, name, url, release_year, runtime, rating, image_url, rt_critic, rt_audience, genres, synopsis)
-        VALUES(
-            '{movie.get('id')}'
-            ,'{movie.get('name')}'
-            ,'{movie.get('url')}'
-            ,{movie.get('release_year') if movie.get('release_year') != None else 'NULL'}
-            ,{movie.get('runtime') if movie.get('runtime') != None else 'NULL'}
-            ,'{movie.get('rating') if movie.get('rating') != None else ''}'
-            ,'{movie.get('image_url') if movie.get('image_url') != None else ''}'
-            ,'{movie.get('rt_critic') if movie.get('rt_critic') != None else 'NULL'}'
-            ,'{movie.get('rt_audience') if movie.get('rt_audience') != None else 'NULL'}'
-            ,'{movie.get('genres') if movie.get('genres') != None else ''}'
-            ,'{movie.get('synopsis') if movie.get('synopsis') != None else ''}'
-        )
+    query = """
+        INSERT INTO movies(id, name, url, release_year, runtime, rating, image_url, rt_critic, rt_audience, genres, synopsis, info_updated)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(id) DO UPDATE SET
             name = COALESCE(excluded.name, name)
             ,release_year = COALESCE(excluded.release_year, release_year)
@@ -575,30 +1619,37 @@ def insert_movies(movies, conn, cursor):
             ,rt_audience = COALESCE(excluded.rt_audience, rt_audience)
             ,genres = COALESCE(excluded.genres, genres)
             ,synopsis = COALESCE(excluded.synopsis, synopsis)
+            ,info_updated = COALESCE(excluded.info_updated, info_updated)
             WHERE url = excluded.url
         ;
         """
 
-        cursor.execute(query)
+    cursor.executemany(query, [
+        (
+            movie.get('id')
+            ,movie.get('name')
+            ,movie.get('url')
+            ,movie.get('release_year')
+            ,movie.get('runtime')
+            ,movie.get('rating') if movie.get('rating') != None else ''
+            ,movie.get('image_url') if movie.get('image_url') != None else ''
+            ,movie.get('rt_critic')
+            ,movie.get('rt_audience')
+            ,movie.get('genres')
+            ,movie.get('synopsis')
+            ,movie.get('info_updated')
+        )
+        for movie in movies
+    ])
         
-    conn.commit()
-    global progress_made
-    progress_made = True
+    if(commit):
+        conn.commit()
 
-def insert_showtimes(showtimes, conn, cursor):
+def insert_showtimes(showtimes, conn, cursor, commit=True):
     logger.info(f'Inserting {len(showtimes)} showtimes')
-    for showtime in showtimes:
-        query = f"""
+    query = """
         INSERT INTO showtimes(id, movie_id, theater_id, url, date, time, format)
-        VALUES(
-            '{showtime.get('id')}'
-            ,'{showtime.get('movie_id')}'
-            ,'{showtime.get('theater_id')}'
-            ,'{showtime.get('url')}'
-            ,'{showtime.get('date')}'
-            ,'{showtime.get('time')}'
-            ,'{showtime.get('format') if showtime.get('format') != None else ''}'
-        )
+        VALUES(?, ?, ?, ?, ?, ?, ?)
         ON CONFLICT(id) DO UPDATE SET
             movie_id = COALESCE(excluded.movie_id, movie_id)
             ,theater_id = COALESCE(excluded.theater_id, theater_id)
@@ -610,22 +1661,49 @@ def insert_showtimes(showtimes, conn, cursor):
         ;
         """
 
-        cursor.execute(query)
+    cursor.executemany(query, [
+        (
+            showtime.get('id')
+            ,showtime.get('movie_id')
+            ,showtime.get('theater_id')
+            ,showtime.get('url')
+            ,showtime.get('date')
+            ,showtime.get('time')
+            ,showtime.get('format') if showtime.get('format') != None else ''
+        )
+        for showtime in showtimes
+    ])
 
-    conn.commit()
-    global progress_made
-    progress_made = True
+    # only showtimes written count as progress - theaters, movies and date updates are written on every attempt, even one that collects nothing
+    if(cursor.rowcount > 0):
+        global progress_made
+        progress_made = True
+
+    if(commit):
+        conn.commit()
 
-def collect_data():
+def collect_data(dry_run=False, distributed=False):
     conn = None
     # driver = None
 
+    # movie detail pages are fetched in the background so theater pages never wait on them
+    enrichment_stop = threading.Event()
+    enrichment_worker = threading.Thread(target=enrich_movies, args=(enrichment_stop,), daemon=True)
+
     try:
         logger.info('Initializing browser')
         # driver = browser_init()
 
         logger.info('Connecting to database')
-        conn, cursor = initialize_db(os.path.join('sqlite3', 'moviedb'))
+        conn, cursor = initialize_db(db_location)
+        update_schema(conn, cursor)
+
+        logger.info('Evicting stale pages from page cache')
+        page_cache.evict()
+
+        if(not dry_run):
+            logger.info('Starting movie info worker')
+            enrichment_worker.start()
 
         # zip_codes = get_zip_codes(conn)
         
@@ -634,7 +1712,7 @@ def collect_data():
 
         # zip_code_str = ','.join([f"\'{i}\'" for i in zip_codes])
 
-        app_subscriber_df, app_theater_df = get_subscriptions_api()
+        app_subscriber_df, app_theater_df = get_subscriptions_api(conn, cursor)
         insert_theaters(app_theater_df, conn, cursor)
 
         theater_ids = list(sql('SELECT DISTINCT id FROM app_theater_df').df()['id'])
@@ -643,7 +1721,7 @@ def collect_data():
         theater_df = pd.read_sql(f"SELECT * FROM theaters WHERE id IN ({ids})", conn)
 
         logger.info('Collecting movies and showtimes')
-        collect_all_movies_and_showtimes(theater_df, [datetime.now().date() + timedelta(days=i) for i in range(7)], conn, cursor, redo=False)
+        collect_all_movies_and_showtimes(theater_df, [datetime.now().date() + timedelta(days=i) for i in range(7)], conn, cursor, redo=False, dry_run=dry_run, distributed=distributed)
 
     except Exception:
         logging.error(traceback.format_exc())
@@ -651,6 +1729,11 @@ def collect_data():
     else:
         success = 1
     finally:
+        if(enrichment_worker.is_alive()):
+            logger.info('Stopping movie info worker - remaining movies stay queued')
+            enrichment_stop.set()
+            enrichment_worker.join()
+
         try: 
             conn.close() 
         except: 
@@ -664,15 +1747,15 @@ def collect_data():
         logger.info('Closed db connection and webdriver')
         return success
 
-def run(vpn=False, headless_val=False):
+def load_config():
+    """Read file locations and set up logging
 
-    global logger
+    Returns:
+    datetime - time the run started
+    """
     global log_location
     global driver_location
     global app_db
-    global progress_made
-    global headless 
-    headless = headless_val
 
     start_time = datetime.now()
 
@@ -698,6 +1781,31 @@ def run(vpn=False, headless_val=False):
         raise Exception('WebDriver not provided. Please add WebDriver filepath to data/file_locations.txt on a new line in the format of "driver=<filepath>"')
 
     logging.basicConfig(filename=log_location, level=logging.INFO)
+
+    return start_time
+
+def run(vpn=False, headless_val=False, workers=None, requests_per_minute=None, dry_run=False, distributed=False, lean=False, capture=False):
+
+    global logger
+    global progress_made
+    global headless 
+    global scrape_workers
+    global browser_pool_size
+    global lean_mode
+    global capture_mode
+    headless = headless_val
+    lean_mode = lean
+    capture_mode = capture
+
+    if(workers is not None):
+        scrape_workers = workers
+    if(requests_per_minute is not None):
+        rate_limit.requests_per_minute = requests_per_minute
+
+    # every worker, plus the movie info worker, needs its own browser
+    browser_pool_size = max(browser_pool_size, scrape_workers + 1)
+
+    start_time = load_config()
     logger.info(f'Starting {start_time.strftime("%m/%d/%Y %H:%M:%S")}')
 
     if(vpn):
@@ -708,16 +1816,15 @@ def run(vpn=False, headless_val=False):
         sleep(30)
 
 
-    sleep_value = 300
-
     success = 0
     no_progress_ct = 0
     runs = 0
-    while not success and no_progress_ct <= 10:
+    # pages finished by earlier attempts are journaled and cached, so each retry only redoes failed work
+    while not success and no_progress_ct < retry_policy.max_run_attempts:
         runs += 1
         logger.info(f'Run - starting attempt {runs}')
         try:
-            success = collect_data()
+            success = collect_data(dry_run=dry_run, distributed=distributed)
         except Exception:
             logger.error(traceback.format_exc())
             success = 0
@@ -726,14 +1833,20 @@ def run(vpn=False, headless_val=False):
             logger.info(f'Run - attempt {runs} successful')
             break
         else:
-            logger.info(f'Run - attempt {runs} failed; sleeping for {sleep_value} seconds')
             if(progress_made):
                 no_progress_ct = 0
                 progress_made = False
             else:
                 no_progress_ct += 1
                 logger.warning(f'No progress made in run {runs} - number of consecutive runs without progress is now {no_progress_ct}')
-            sleep(sleep_value)
+
+            if(no_progress_ct < retry_policy.max_run_attempts):
+                sleep_value = retry_policy.backoff_delay(no_progress_ct)
+                logger.info(f'Run - attempt {runs} failed; sleeping for {round(sleep_value)} seconds')
+                with metrics.timed('sleep'):
+                    sleep(sleep_value)
+
+    close_browser_pool()
 
     end_time = datetime.now()
 
@@ -747,4 +1860,7 @@ def run(vpn=False, headless_val=False):
     return success
 
 if __name__ == "__main__":
-    run(headless_val = 1 if 'headless' in sys.argv else 0)
+    if('worker' in sys.argv):
+        run_worker(headless_val = 1 if 'headless' in sys.argv else 0, lean = 'lean' in sys.argv, capture = 'capture' in sys.argv)
+    else:
+        run(headless_val = 1 if 'headless' in sys.argv else 0, dry_run = 'dry_run' in sys.argv, distributed = 'distributed' in sys.argv, lean = 'lean' in sys.argv, capture = 'capture' in sys.argv)
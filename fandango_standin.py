@@ -0,0 +1,396 @@
+import os
+import re
+import json
+import sys
+import random
+import tempfile
+import threading
+import logging
+from datetime import datetime, timedelta
+from time import sleep, perf_counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+import data_collection
+import rate_limit
+import page_cache
+import metrics
+
+logger = logging.getLogger('fandango_standin')
+
+port = 8765 # port the stand-in listens on when served on its own
+latency = 0.5 # seconds the stand-in waits before answering each request
+latency_jitter = 0.25 # up to this many extra seconds are added to latency at random
+error_rate = 0.0 # fraction of theater and movie requests answered with a 503
+offline_rate = 0.0 # fraction of theater requests answered with an offline__header page
+use_fixtures = False # serve the pages in fixture_dir instead of pages generated per request
+fixture_dir = 'fixtures' # directory of synthetic theater and movie pages written by fixture_pages.py
+
+theater_count = 20 # theaters listed on every zip code page
+movie_count = 60 # distinct movies shared between theaters
+movies_per_theater = 12 # movies on a theater page
+showtimes_per_movie = 6 # showtimes per movie on a theater page
+horizon_days = 5 # days ahead theaters publish showtimes, pages further out are empty
+padding_rows = 1200 # lines of script in every page, so pages weigh about as much as the real site's
+
+served = [] # [path, status, seconds] for every request answered
+served_lock = threading.Lock()
+
+def page_head(title):
+    # scripts, styles and navigation the parsers have to skip over
+    script = ''.join(f'window.fdg_{i} = {{"track": "page-{i}", "enabled": true}};\n' for i in range(padding_rows))
+    style = ''.join(f'.fd-c{i}{{margin:{i%9}px}}\n' for i in range(padding_rows//2))
+    nav = ''.join(f'<li class="site-nav__item"><a href="/section-{i}">Section {i}</a></li>' for i in range(150))
+    return f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title} | Fandango</title><script>{script}</script><style>{style}</style></head><body><header class="site-header"><nav><ul class="site-nav">{nav}</ul></nav></header><main>'
+
+def page_foot():
+    return '</main><footer class="site-footer">' + ''.join(f'<a class="site-footer__link" href="/help/{i}">Help {i}</a>' for i in range(120)) + '</footer></body></html>'
+
+def theater_id(number):
+    """Get the id of a generated theater
+
+    Keyword arguments:
+    number - position of theater on zip code page
+
+    Returns:
+    str - 5 character theater id
+    """
+    return f'aa{number:03d}'
+
+def zip_page(zip_code):
+    """Generate a zip code search page listing every generated theater
+
+    Keyword arguments:
+    zip_code - zip code searched
+
+    Returns:
+    str - html of page
+    """
+    options = ''.join(f'<option value="/standin-theater-{number}-{theater_id(number)}/theater-page">Standin Theater {number}</option>' for number in range(theater_count))
+    return page_head(f'Movie times near {zip_code}') + f'<select id="nearby-theaters-select-list"><option value="">Select a theater</option>{options}</select>' + page_foot()
+
+def theater_schedule(theater, date):
+    """Generate the movies and showtimes a theater lists for a date
+
+    Keyword arguments:
+    theater - id of theater
+    date - date string in YYYY-mm-dd format
+
+    Returns:
+    list - [ {id, title, runtime, rating, showtimes: [(hour, minute, a or p)]} ], empty past horizon_days
+    """
+    if(days_ahead(date) > horizon_days):
+        return []
+
+    # the same theater and date always gets the same schedule
+    schedule = random.Random(f'{theater}{date}')
+
+    movies = []
+    for number in sorted(schedule.sample(range(movie_count), min(movies_per_theater, movie_count))):
+        movies.append({
+            'id': 200000 + number
+            ,'title': f'Standin Movie {number}' + (f' ({2000 + number%25})' if number%3 else '')
+            ,'runtime': (1 + number%3)*60 + (number%60 if number%4 else 0)
+            ,'rating': ['G', 'PG', 'PG-13', 'R'][number%4]
+            ,'showtimes': sorted((schedule.randint(1, 12), schedule.choice(['00', '15', '30', '45']), schedule.choice('ap')) for i in range(showtimes_per_movie))
+        })
+
+    return movies
+
+def ticketing_url(theater, date, movie_id, hour, minute):
+    return f'https://tickets.fandango.com/transaction/ticketing/mobile/jump.aspx?row_count=1&tid={theater.upper()}&sdate={date}%2B{hour}:{minute}&mid={movie_id}'
+
+def theater_page(theater, date):
+    """Generate a theater page for a date
+
+    Keyword arguments:
+    theater - id of theater
+    date - date string in YYYY-mm-dd format
+
+    Returns:
+    str - html of page, without a movie list past horizon_days
+    """
+    if(use_fixtures):
+        return load_fixture('theater_large' if days_ahead(date) <= horizon_days else 'theater_none')
+
+    # like the real page, the showtimes are also loaded as json so capture mode has something to read
+    html = page_head(f'Standin Theater {theater}') + f'<script>fetch("/napi/theaterMovieShowtimes/{theater.upper()}?startDate={date}");</script><h2 class="theater-name">Standin Theater</h2>'
+
+    schedule = theater_schedule(theater, date)
+    if(schedule == []):
+        return html + '<p class="thtr-mv-list__empty">No showtimes are available for this date.</p>' + page_foot()
+
+    movies = []
+    for movie in schedule:
+        runtime = f'{movie["runtime"]//60} hr {movie["runtime"]%60} min' if movie['runtime']%60 else f'{movie["runtime"]//60} hr'
+        buttons = ''.join(f'<li class="showtimes-btn-list__item"><a class="showtime-btn" href="{ticketing_url(theater, date, movie["id"], hour, minute).replace("&", "&amp;")}">{hour}:{minute}{meridiem}</a></li>' for hour, minute, meridiem in movie['showtimes'])
+
+        movies.append(
+            f'<li class="thtr-mv-list__item" id="movie-{movie["id"]}"><a href="/standin-movie-{movie["id"]}/movie-overview"><img src="/images/{movie["id"]}.jpg" alt="poster"></a>'
+            f'<section class="shared-movie-showtimes__movie-details"><a class="shared-movie-showtimes__movie-title-link" href="/standin-movie-{movie["id"]}/movie-overview">{movie["title"]}</a>'
+            f'<p class="shared-showtimes__movie-data shared-showtimes__data-text"><data class="shared-showtimes__movie-rating">Rated: {movie["rating"]}</data>, Runtime: {runtime}</p></section>'
+            f'<ul class="showtimes-btn-list">{buttons}</ul></li>')
+
+    return html + f'<ul class="thtr-mv-list">{"".join(movies)}</ul>' + page_foot()
+
+def theater_json(theater, date):
+    """Generate the json a theater page loads its showtimes from
+
+    Keyword arguments:
+    theater - id of theater
+    date - date string in YYYY-mm-dd format
+
+    Returns:
+    str - json of the same schedule theater_page lists
+    """
+    movies = []
+    for movie in theater_schedule(theater, date):
+        showtimes = [{'ticketingJumpPageURL': ticketing_url(theater, date, movie['id'], hour, minute), 'screenReaderTime': f'{hour}:{minute} {meridiem.upper()}M', 'expired': False} for hour, minute, meridiem in movie['showtimes']]
+        movies.append({
+            'id': movie['id']
+            ,'title': movie['title']
+            ,'mopURI': f'/standin-movie-{movie["id"]}/movie-overview'
+            ,'runtime': movie['runtime']
+            ,'rating': movie['rating']
+            ,'poster': {'size': {'200': f'/images/{movie["id"]}.jpg'}}
+            ,'variants': [{'format': 'Standard', 'amenityGroups': [{'showtimes': showtimes}]}]
+        })
+
+    return json.dumps({'viewModel': {'theaterId': theater.upper(), 'date': date, 'movies': movies}})
+
+def movie_page(movie_id):
+    """Generate a movie detail page
+
+    Keyword arguments:
+    movie_id - id of movie
+
+    Returns:
+    str - html of page, every fourth movie has no scores or synopsis
+    """
+    if(use_fixtures):
+        return load_fixture('movie_full' if int(movie_id)%4 else 'movie_partial')
+
+    html = page_head(f'Standin Movie {movie_id}') + '<section class="movie-detail">'
+    if(int(movie_id)%4):
+        html += f'<div class="movie-detail__scores"><span class="rottentomatoes-rating">{int(movie_id)%100}%</span> Tomatometer <span class="rottentomatoes-rating">{(int(movie_id)*7)%100}%</span> Popcornmeter</div>'
+    html += '<ul class="movie-detail__grv"><li class="movie-detail__grv-item">GENRE: Comedy, Drama</li></ul>'
+    if(int(movie_id)%4):
+        html += f'<p id="movie-detail-synopsis">Standin movie {movie_id} plays at every standin theater.</p>'
+    return html + '</section>' + page_foot()
+
+def offline_page():
+    return page_head('Fandango') + '<h1 class="offline__header">We\'re sorry, Fandango is temporarily unavailable.</h1>' + page_foot()
+
+def load_fixture(name):
+    with open(os.path.join(fixture_dir, f'{name}.html'), 'r', encoding='utf8') as f:
+        return f.read()
+
+def days_ahead(date):
+    return (datetime.strptime(date, '%Y-%m-%d').date() - datetime.now().date()).days
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answer requests the scraper makes to Fandango with generated or fixture pages"""
+
+    def do_GET(self):
+        start = perf_counter()
+        sleep(latency + random.uniform(0, latency_jitter))
+
+        url = urlparse(self.path)
+        zip_match = re.match(r'^/([0-9]{5})_movietimes$', url.path)
+        theater_match = re.match(r'^/[a-z0-9-]+-([a-z0-9]{5})/theater-page$', url.path)
+        movie_match = re.match(r'^/[a-z0-9-]*?([0-9]+)/movie-overview$', url.path)
+        json_match = re.match(r'^/napi/theaterMovieShowtimes/([A-Za-z0-9]{5})$', url.path)
+
+        # zip code pages are never failed, theater discovery isn't retried
+        if((theater_match or movie_match) and random.random() < error_rate):
+            status, html = 503, '<html><body>Service Unavailable</body></html>'
+        elif(zip_match):
+            status, html = 200, zip_page(zip_match.group(1))
+        elif(theater_match):
+            date = parse_qs(url.query).get('date', [datetime.now().strftime('%Y-%m-%d')])[0]
+            status, html = 200, offline_page() if random.random() < offline_rate else theater_page(theater_match.group(1), date)
+        elif(movie_match):
+            status, html = 200, movie_page(movie_match.group(1))
+        elif(json_match):
+            date = parse_qs(url.query).get('startDate', [datetime.now().strftime('%Y-%m-%d')])[0]
+            status, html = 200, theater_json(json_match.group(1).lower(), date)
+        else:
+            status, html = 404, '<html><body>Not Found</body></html>'
+
+        body = html.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json' if json_match and status == 200 else 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        with served_lock:
+            served.append([url.path, status, perf_counter() - start])
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def start_server(listen_port=0):
+    """Serve the stand-in from a background thread
+
+    Keyword arguments:
+    listen_port - port to listen on, 0 picks a free one
+
+    Returns:
+    [ThreadingHTTPServer - call shutdown() when done, str - base url of stand-in]
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', listen_port), StandinHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def percentile(values, pct):
+    """Get a percentile of a list of numbers
+
+    Keyword arguments:
+    values - list of numbers
+    pct - percentile, 0 to 100
+
+    Returns:
+    float - value at percentile, or None if values is empty
+    """
+    if(values == []):
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct/100 * (len(values) - 1))))]
+
+def create_db(db_name):
+    """Create an empty movie database from table_structure
+
+    Keyword arguments:
+    db_name - filepath of database
+
+    Returns:
+    [sqlite3 connection, cursor]
+    """
+    conn, cursor = data_collection.initialize_db(db_name)
+    for table in ['theaters', 'movies', 'showtimes', 'zip_codes']:
+        with open(os.path.join('table_structure', f'{table}.txt'), 'r') as f:
+            cursor.executescript(f.read())
+    cursor.execute('ALTER TABLE showtimes ADD COLUMN date_inserted date;') # present in the live database
+    data_collection.update_schema(conn, cursor)
+
+    return conn, cursor
+
+def benchmark(days=7, workers=3, requests_per_minute=600, headless_val=True):
+    """Run theater discovery, showtime collection and movie enrichment against the stand-in
+
+    Keyword arguments:
+    days - number of days of showtimes to collect
+    workers - theaters scraped at the same time
+    requests_per_minute - rate limit applied to the stand-in
+    headless_val - whether to run browsers in headless mode
+
+    Returns:
+    str - report of throughput and page latency
+
+    Raises an exception if an injected error page was taken for a real page instead of being retried
+    """
+    data_collection.headless = headless_val
+    data_collection.load_config()
+
+    server, base_url = start_server()
+    work_dir = tempfile.mkdtemp(prefix='standin_')
+
+    # everything the scraper touches points at the stand-in and a throwaway database
+    data_collection.fandango_url = base_url
+    data_collection.db_location = os.path.join(work_dir, 'moviedb')
+    data_collection.scrape_workers = workers
+    data_collection.browser_pool_size = max(data_collection.browser_pool_size, workers + 1)
+    page_cache.cache_dir = os.path.join(work_dir, 'pages')
+    rate_limit.requests_per_minute = requests_per_minute
+    rate_limit.bucket_rates['movie_info'] = requests_per_minute
+
+    # time spent in each page fetch, rate limit wait included
+    fetch_times = []
+    fetch_page = data_collection.fetch_page
+    def timed_fetch_page(url, bucket=None, ready_selector=None, capture=False):
+        start = perf_counter()
+        try:
+            return fetch_page(url, bucket, ready_selector, capture)
+        finally:
+            fetch_times.append(perf_counter() - start)
+    data_collection.fetch_page = timed_fetch_page
+
+    conn, cursor = create_db(data_collection.db_location)
+    metrics.reset()
+    with served_lock:
+        served.clear()
+    stages = {}
+    try:
+        start = perf_counter()
+        data_collection.collect_theaters(['00000'], conn, cursor)
+        stages['theaters'] = perf_counter() - start
+
+        theaters = pd.read_sql('SELECT * FROM theaters', conn)
+        dates = [datetime.now().date() + timedelta(days=i) for i in range(days)]
+
+        start = perf_counter()
+        try:
+            data_collection.collect_all_movies_and_showtimes(theaters, dates, conn, cursor, redo=True)
+        except Exception as e:
+            logger.error(f'Collection incomplete: {e}')
+        stages['showtimes'] = perf_counter() - start
+        theater_fetches = len(fetch_times)
+
+        start = perf_counter()
+        data_collection.enrich_movies()
+        stages['movie_info'] = perf_counter() - start
+    finally:
+        data_collection.fetch_page = fetch_page
+        data_collection.close_browser_pool()
+        server.shutdown()
+
+    showtimes = cursor.execute('SELECT COUNT(*) FROM showtimes').fetchone()[0]
+    movies = cursor.execute('SELECT COUNT(*) FROM movies WHERE info_updated IS NOT NULL').fetchone()[0]
+    conn.close()
+
+    server_times = [seconds for path, status, seconds in served]
+    # browsers also ask for images and favicons the stand-in answers with 404s, only the injected 503s are error pages
+    errors = len([status for path, status, seconds in served if status == 503])
+    # every error page the stand-in served has to be caught by the scraper, or its data is silently lost
+    caught = metrics.snapshot()['counters'].get('error_pages', 0)
+
+    report = f'Stand-in benchmark: {len(theaters)} theaters, {days} days, {workers} workers, {requests_per_minute} requests/minute\n'
+    report += f'\tlatency {latency}s + up to {latency_jitter}s, error rate {error_rate}, offline rate {offline_rate}\n'
+    report += f'\ttheater discovery {round(stages["theaters"], 2)}s\n'
+    report += f'\tshowtimes {round(stages["showtimes"], 2)}s - {theater_fetches} theater pages ({round(theater_fetches/stages["showtimes"], 2)} pages/s), {showtimes} showtimes\n'
+    report += f'\tmovie info {round(stages["movie_info"], 2)}s - {len(fetch_times) - theater_fetches} movie pages, {movies} movies enriched\n'
+    report += f'\tpage fetch p50 {round(percentile(fetch_times, 50), 3)}s, p95 {round(percentile(fetch_times, 95), 3)}s, p99 {round(percentile(fetch_times, 99), 3)}s, max {round(max(fetch_times), 3)}s\n'
+    report += f'\tstand-in answered {len(served)} requests, {errors} with injected errors, p50 {round(percentile(server_times, 50), 3)}s, p99 {round(percentile(server_times, 99), 3)}s\n'
+    report += f'\t{caught} error pages caught and retried or given up on\n'
+
+    if(caught != errors):
+        raise Exception(f'{errors - caught} of {errors} error pages were not caught by the scraper\n{report}')
+    return report
+
+if __name__ == '__main__':
+    # settings are given as name=value, e.g. python fandango_standin.py benchmark workers=5 latency=1 error_rate=0.1
+    benchmark_args = {}
+    for arg in sys.argv[1:]:
+        if('=' not in arg):
+            continue
+        name, value = arg.split('=', 1)
+        if(name in ['days', 'workers', 'requests_per_minute']):
+            benchmark_args[name] = int(value)
+        elif(isinstance(globals()[name], bool)):
+            globals()[name] = value.lower() in ['1', 'true', 'yes']
+        else:
+            globals()[name] = type(globals()[name])(value)
+
+    if('benchmark' in sys.argv):
+        data_collection.lean_mode = 'lean' in sys.argv
+        data_collection.capture_mode = 'capture' in sys.argv
+        print(benchmark(headless_val='headless' in sys.argv, **benchmark_args))
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', port), StandinHandler)
+        print(f'Fandango stand-in serving on http://127.0.0.1:{port}')
+        server.serve_forever()
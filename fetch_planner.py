@@ -0,0 +1,174 @@
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+
+logger = logging.getLogger('fetch_planner')
+
+refresh_days = 7 # days before a fetched page is fetched again - a week, so like the old date_updated rule each page is fetched once while it is in range
+horizon_probe_days = 0 # if set, a theater that publishes fewer days ahead than are collected has the day past its horizon fetched once every this many days, to notice when it starts publishing further ahead - each probe that comes back empty costs an extra page, so it is off to keep to one page per theater a night
+history_days = 30 # days of page history used to work out how far ahead each theater publishes
+baseline_days = 6 # the old rule skipped every date up to this many days after a theater's date_updated, plan_report compares against it
+
+def load_page_history(conn):
+    """Get when each theater page was last fetched
+
+    Keyword arguments:
+    conn - database connection
+
+    Returns:
+    dict - (theater id, date string) -> date string the page was last collected
+    """
+    journal = pd.read_sql('SELECT theater_id, date, date_collected FROM page_journal', conn)
+    return {(row['theater_id'], row['date']): row['date_collected'] for index, row in journal.iterrows()}
+
+def load_coverage(conn, dates):
+    """Get how many showtimes are stored for each theater and date
+
+    Keyword arguments:
+    conn - database connection
+    dates - list of dates being planned
+
+    Returns:
+    dict - (theater id, date string) -> number of showtimes
+    """
+    coverage = pd.read_sql(
+        'SELECT theater_id, date, COUNT(*) AS ct FROM showtimes WHERE date BETWEEN ? AND ? GROUP BY theater_id, date'
+        ,conn
+        ,params=(min(dates).strftime('%Y-%m-%d'), max(dates).strftime('%Y-%m-%d')))
+    return {(row['theater_id'], row['date']): row['ct'] for index, row in coverage.iterrows()}
+
+def load_horizons(conn):
+    """Get how many days ahead each theater usually publishes showtimes
+
+    Keyword arguments:
+    conn - database connection
+
+    Returns:
+    dict - theater id -> furthest number of days ahead a fetched page has had showtimes
+    """
+    horizons = pd.read_sql(f"""
+        SELECT theater_id, MAX(JULIANDAY(date) - JULIANDAY(date_collected)) AS horizon FROM page_journal
+            WHERE 1=1
+                AND showtimes > 0
+                AND date_collected >= DATE('now', 'localtime', '-{int(history_days)} days')
+            GROUP BY theater_id
+        """, conn)
+    return {row['theater_id']: int(row['horizon']) for index, row in horizons.iterrows()}
+
+def probe_due(theater_id, today):
+    """Check whether tonight is the night a theater's publishing horizon is probed
+
+    Theaters are spread over the horizon_probe_days nights by their id, so probes don't all land on the same night. Never due if horizon_probe_days is 0
+
+    Keyword arguments:
+    theater_id - id of theater
+    today - date of run
+
+    Returns:
+    bool
+    """
+    if(horizon_probe_days <= 0):
+        return False
+    return (today.toordinal() + sum(ord(c) for c in str(theater_id))) % horizon_probe_days == 0
+
+def plan_pages(theaters, dates, conn, redo=False):
+    """Work out the smallest set of theater pages that need to be fetched
+
+    In steady state each date is fetched once per theater - the night it comes into range, or for theaters that publish fewer days ahead, the night it comes
+    within their publishing horizon. Empty pages fetched before they were within the horizon are fetched again once they are
+
+    Keyword arguments:
+    theaters - DataFrame of theaters with id, name, url, and date_updated
+    dates - list of dates to cover
+    conn - database connection
+    redo - fetch every page regardless of existing data
+
+    Returns:
+    [list of (theater row, date) to fetch, list of (theater row, date, reason) skipped]
+    """
+    today = datetime.now().date()
+
+    history = load_page_history(conn)
+    coverage = load_coverage(conn, dates)
+    horizons = load_horizons(conn)
+
+    planned = []
+    skipped = []
+    for index, row in theaters.iterrows():
+        date_updated = datetime.strptime(row['date_updated'], '%Y-%m-%d').date() if isinstance(row['date_updated'], str) else None
+
+        for date in dates:
+            if(redo):
+                planned.append((row, date))
+                continue
+
+            formatted_date = date.strftime('%Y-%m-%d')
+            last_fetched = history.get((row['id'], formatted_date))
+            last_fetched = datetime.strptime(last_fetched, '%Y-%m-%d').date() if last_fetched is not None else None
+            showtimes = coverage.get((row['id'], formatted_date), 0)
+            horizon = horizons.get(row['id'])
+            days_ahead = (date - today).days
+
+            if(last_fetched == today or (last_fetched is None and date_updated == today and date <= today + timedelta(days=baseline_days))):
+                reason = 'fetched today'
+            elif(showtimes > 0 and last_fetched is not None and (today - last_fetched).days < refresh_days):
+                reason = f'{showtimes} showtimes fetched {last_fetched}'
+            elif(showtimes > 0 and last_fetched is None and date_updated is not None and date <= date_updated + timedelta(days=baseline_days)):
+                # pages collected before the journal existed are only known through the theater's last full update
+                reason = f'{showtimes} showtimes covered by update on {date_updated}'
+            elif(showtimes == 0 and last_fetched is not None and (today - last_fetched).days < refresh_days
+                and not (horizon is not None and (date - last_fetched).days > horizon and days_ahead <= horizon)):
+                # empty pages are only fetched again once they come within the theater's horizon, when their showtimes are expected
+                reason = f'empty on {last_fetched}'
+            elif(last_fetched is None and horizon is not None and days_ahead > horizon and not (days_ahead == horizon + 1 and probe_due(row['id'], today))):
+                reason = f'beyond {horizon} day publishing horizon'
+            else:
+                planned.append((row, date))
+                continue
+
+            skipped.append((row, date, reason))
+
+    logger.info(f'Planned {len(planned)} pages, skipping {len(skipped)}')
+    return planned, skipped
+
+def baseline_pages(planned, skipped):
+    """Count the pages the old rule would have fetched for the same theaters and dates
+
+    The old rule skipped theaters updated today and, for the rest, every date up to baseline_days after the theater's date_updated
+
+    Keyword arguments:
+    planned - list of (theater row, date) to fetch
+    skipped - list of (theater row, date, reason) skipped
+
+    Returns:
+    int - number of pages
+    """
+    today = datetime.now().date()
+
+    pages = 0
+    for row, date in [page[:2] for page in planned + skipped]:
+        date_updated = datetime.strptime(row['date_updated'], '%Y-%m-%d').date() if isinstance(row['date_updated'], str) else None
+        if(date_updated is None or (date_updated != today and date > date_updated + timedelta(days=baseline_days))):
+            pages += 1
+    return pages
+
+def plan_report(planned, skipped):
+    """Describe a fetch plan theater by theater
+
+    Keyword arguments:
+    planned - list of (theater row, date) to fetch
+    skipped - list of (theater row, date, reason) skipped
+
+    Returns:
+    str - report of planned and skipped pages
+    """
+    theaters = {}
+    for row, date in planned:
+        theaters.setdefault(row['name'], []).append(f'\t{date.strftime("%Y-%m-%d")} fetch')
+    for row, date, reason in skipped:
+        theaters.setdefault(row['name'], []).append(f'\t{date.strftime("%Y-%m-%d")} skip - {reason}')
+
+    report = f'Fetch plan: {len(planned)} pages planned, {len(skipped)} skipped - the old date_updated rule would fetch {baseline_pages(planned, skipped)}\n'
+    for name in sorted(theaters):
+        report += name + '\n' + '\n'.join(sorted(theaters[name])) + '\n'
+    return report
@@ -0,0 +1,128 @@
+import os
+import sys
+import random
+
+# the fixtures are synthetic - their markup is modelled on the selectors the parsers look for, not recorded from the live site,
+# so parser checks against them only show the parsers agree with each other, not that they still match Fandango
+
+fixture_dir = 'fixtures' # directory the pages are written to, parser_benchmark and fandango_standin read them from here
+seed = 1 # seed for generated showtimes, so the pages come out the same every time
+
+# real pages carry a lot of script, style and navigation around the data - the parsers have to get through it, so the pages are padded out with made up filler
+script_entries = 1200 # tracking entries in the inline script
+style_rules = 800 # rules in the inline stylesheet
+nav_items = 150 # links in the site navigation
+footer_links = 120 # links in the site footer
+
+def page_head(title):
+    """Get the top of a page, up to and including the site navigation
+
+    Keyword arguments:
+    title - page title
+
+    Returns:
+    str - html
+    """
+    html = [f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title} | Fandango</title>']
+    html.append('<script>' + ''.join(f'window.fdg_{i} = {{"track": "page-{i}", "enabled": true}};\n' for i in range(script_entries)) + '</script>')
+    html.append('<style>' + ''.join(f'.fd-c{i}{{margin:{i%9}px;color:#{i%999:03d}}}\n' for i in range(style_rules)) + '</style></head><body>')
+    html.append('<header class="site-header"><nav><ul class="site-nav">' + ''.join(f'<li class="site-nav__item"><a href="/section-{i}">Section {i}</a></li>' for i in range(nav_items)) + '</ul></nav></header>')
+    return ''.join(html)
+
+def page_foot():
+    return '<footer class="site-footer">' + ''.join(f'<a class="site-footer__link" href="/help/{i}">Help {i}</a>' for i in range(footer_links)) + '</footer></body></html>'
+
+def theater_page(rng, movie_count, showtime_count, theater_id='AABQU'):
+    """Build a theater page listing movies with their showtimes
+
+    Every third movie has no year in its title, every fourth an hour-only runtime, and every fifth showtime is sold out (no ticket link)
+
+    Keyword arguments:
+    rng - random.Random that showtimes are drawn from
+    movie_count - number of movies listed
+    showtime_count - number of showtimes per movie
+    theater_id - id of theater in ticket links
+
+    Returns:
+    str - html of page
+    """
+    html = [page_head('Shu Community Theatre'), '<main><h2 class="theater-name">Shu Community Theatre</h2>', '<ul class="thtr-mv-list">']
+    for i in range(movie_count):
+        movie_id = 200000 + i
+        html.append(f'<li class="thtr-mv-list__item" id="movie-{movie_id}"><a href="/movie-{movie_id}/movie-overview"><img src="https://images.fandango.com/ImageRenderer/200/0/redesign/static/img/default_poster.png/0/images/masterrepository/fandango/{movie_id}/poster.jpg" alt="poster"></a>')
+
+        year = f' ({2000 + i%25})' if i%3 else ''
+        runtime = f'{1 + i%3} hr {i%60} min' if i%4 else f'{1 + i%3} hr'
+        rating = ['G', 'PG', 'PG-13', 'R'][i%4]
+        html.append(f'<section class="shared-movie-showtimes__movie-details"><a class="shared-movie-showtimes__movie-title-link" href="/movie-{movie_id}/movie-overview">Movie\'s Title {i}{year}</a>'
+                    f'<p class="shared-showtimes__movie-data shared-showtimes__data-text"><data class="shared-showtimes__movie-rating">Rated: {rating}</data>, Runtime: {runtime}</p></section>')
+
+        html.append('<ul class="showtimes-btn-list">')
+        for j in range(showtime_count):
+            hour = rng.randint(1, 12)
+            minute = rng.choice(['00', '15', '30', '45'])
+            meridiem = rng.choice('ap')
+            if(j%5 == 0):
+                html.append(f'<li class="showtimes-btn-list__item"><span class="showtimes-btn--disabled">{hour}:{minute}{meridiem}</span></li>')
+            else:
+                html.append(f'<li class="showtimes-btn-list__item"><a class="showtime-btn" href="https://tickets.fandango.com/transaction/ticketing/mobile/jump.aspx?row_count=1&amp;tid={theater_id}&amp;sdate=2026-10-1{j%7}%2B{hour}:{minute}&amp;mid={movie_id}">{hour}:{minute}{meridiem}</a></li>')
+        html.append('</ul></li>')
+
+    html.append('</ul></main>' + page_foot())
+    return ''.join(html)
+
+def empty_theater_page():
+    # the no showtimes notice is made up, the parsers only rely on the movie list being missing
+    return page_head('Shu Community Theatre') + '<main><h2 class="theater-name">Shu Community Theatre</h2><p class="thtr-mv-list__empty">No showtimes are available for this date.</p></main>' + page_foot()
+
+def offline_page():
+    return page_head('Fandango') + '<main><h1 class="offline__header">We\'re sorry, Fandango is temporarily unavailable.</h1></main>' + page_foot()
+
+def movie_page(full):
+    """Build a movie detail page
+
+    Keyword arguments:
+    full - whether the page has scores and a synopsis, otherwise it only has genres
+
+    Returns:
+    str - html of page
+    """
+    html = [page_head('Movie\'s Title 1 (2001)'), '<main><section class="movie-detail">']
+    if(full):
+        html.append('<div class="movie-detail__scores"><span class="rottentomatoes-rating">87%</span> Tomatometer <span class="rottentomatoes-rating">91%</span> Popcornmeter</div>')
+    # genres are separated by non-breaking spaces, which the parsers normalize
+    html.append('<ul class="movie-detail__grv"><li class="movie-detail__grv-item">GENRE: Comedy,\u00a0Drama,\u00a0Family</li><li class="movie-detail__grv-item">RUNTIME: 1 hr 41 min</li></ul>')
+    if(full):
+        html.append('<p id="movie-detail-synopsis">\n\t\tA long-shot community theatre troupe stages one last show before the lights go out for good.\n\t</p>')
+    html.append('</section></main>' + page_foot())
+    return ''.join(html)
+
+def generate():
+    """Write every fixture page
+
+    Returns:
+    list - names of fixtures written
+    """
+    rng = random.Random(seed)
+
+    # theater_large is drawn before theater_small, both from the same rng
+    pages = {
+        'theater_large': theater_page(rng, 40, 12)
+        ,'theater_small': theater_page(rng, 3, 4)
+        ,'theater_none': empty_theater_page()
+        ,'theater_offline': offline_page()
+        ,'movie_full': movie_page(True)
+        ,'movie_partial': movie_page(False)
+    }
+
+    os.makedirs(fixture_dir, exist_ok=True)
+    for name, html in pages.items():
+        with open(os.path.join(fixture_dir, f'{name}.html'), 'w', encoding='utf8') as f:
+            f.write(html)
+
+    return list(pages)
+
+if __name__ == '__main__':
+    if(len(sys.argv) > 1):
+        fixture_dir = sys.argv[1]
+    print(f'Wrote {", ".join(generate())} to {fixture_dir}')
@@ -0,0 +1,269 @@
+import json
+import socket
+import os
+import threading
+import logging
+import sqlite3
+from time import time
+
+logger = logging.getLogger('job_queue')
+
+lease_seconds = 600 # seconds a claimed job belongs to a worker without a heartbeat before it returns to the queue
+heartbeat_seconds = 60 # seconds between lease renewals while a job is being worked on
+poll_seconds = 10 # seconds an idle worker waits before checking the queue again
+idle_seconds = 300 # seconds a standalone worker waits for jobs to be queued before it exits
+
+def create_table(cursor):
+    """Create the job table if it doesn't exist yet
+
+    Keyword arguments:
+    cursor - cursor for database
+
+    Returns:
+    None
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_jobs(
+            id integer primary key autoincrement
+            ,kind text not null
+            ,job_key text not null unique
+            ,theater_id text
+            ,payload text not null
+            ,status text not null default 'queued'
+            ,attempts int not null default 0
+            ,not_before real not null default 0
+            ,lease_owner text
+            ,lease_expires real
+            ,date_queued datetime not null
+        );
+        """)
+    cursor.execute('CREATE INDEX IF NOT EXISTS scrape_jobs_claim ON scrape_jobs(kind, status, not_before);')
+
+def worker_name():
+    """Get a name for this worker that is unique across hosts and processes
+
+    Returns:
+    str - host:pid:thread
+    """
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+def enqueue(kind, job_key, payload, cursor, theater_id=None, requeue_today=True):
+    """Add a job to the queue, or requeue it if an earlier copy already finished
+
+    Keyword arguments:
+    kind - type of job, 'theater_page' or 'movie_info'
+    job_key - unique key of job, so the same work is never queued twice
+    payload - dict of data the worker needs
+    cursor - cursor for database
+    theater_id - theater the job belongs to, if any
+    requeue_today - whether to requeue a copy that was queued and finished today, copies from before today are always requeued
+
+    Returns:
+    None
+    """
+    cursor.execute("""
+        INSERT INTO scrape_jobs(kind, job_key, theater_id, payload, date_queued)
+        VALUES(?, ?, ?, ?, DATETIME('now', 'localtime'))
+        ON CONFLICT(job_key) DO UPDATE SET
+            payload = excluded.payload
+            ,status = 'queued'
+            ,attempts = 0
+            ,not_before = 0
+            ,date_queued = excluded.date_queued
+            WHERE status IN ('done', 'failed') AND (? OR date_queued < DATE('now', 'localtime'))
+        ;
+        """, (kind, job_key, theater_id, json.dumps(payload), int(requeue_today)))
+
+def claim(conn, worker, kinds):
+    """Lease the next available job to a worker
+
+    Keyword arguments:
+    conn - database connection
+    worker - name of worker claiming the job
+    kinds - list of job kinds the worker handles
+
+    Returns:
+    dict - {id, kind, theater_id, payload, attempts}, or None if no job is available
+    """
+    now = time()
+    kind_params = ','.join(['?']*len(kinds))
+
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers can never select the same job
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE;')
+    try:
+        job = conn.execute(f"""
+            SELECT id, kind, theater_id, payload, attempts, status FROM scrape_jobs
+                WHERE 1=1
+                    AND kind IN ({kind_params})
+                    AND not_before <= ?
+                    AND (status = 'queued' OR (status = 'leased' AND lease_expires < ?))
+                ORDER BY attempts, id
+                LIMIT 1
+            """, (*kinds, now, now)).fetchone()
+
+        if(job is None):
+            conn.commit()
+            return None
+
+        if(job[5] == 'leased'):
+            logger.warning(f'Lease on job {job[0]} expired - reclaiming it')
+
+        conn.execute("""
+            UPDATE scrape_jobs SET
+                status = 'leased'
+                ,lease_owner = ?
+                ,lease_expires = ?
+                ,attempts = attempts + 1
+                WHERE id = ?
+            ;
+            """, (worker, now + lease_seconds, job[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {'id': job[0], 'kind': job[1], 'theater_id': job[2], 'payload': json.loads(job[3]), 'attempts': job[4] + 1}
+
+def heartbeat(conn, job_id, worker):
+    """Extend a worker's lease on a job
+
+    Keyword arguments:
+    conn - database connection
+    job_id - id of job
+    worker - name of worker holding the lease
+
+    Returns:
+    bool - False if the lease was lost to another worker
+    """
+    cursor = conn.execute("UPDATE scrape_jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'leased';", (time() + lease_seconds, job_id, worker))
+    conn.commit()
+    return cursor.rowcount == 1
+
+def start_heartbeat(db_name, job_id, worker):
+    """Keep a job's lease alive from a background thread while it is worked on
+
+    Keyword arguments:
+    db_name - filepath of database
+    job_id - id of job
+    worker - name of worker holding the lease
+
+    Returns:
+    threading.Event - set it to stop the heartbeat
+    """
+    stop = threading.Event()
+
+    def beat():
+        # sqlite connections can't be shared between threads
+        conn = sqlite3.connect(db_name, timeout=30)
+        try:
+            while not stop.wait(heartbeat_seconds):
+                if(not heartbeat(conn, job_id, worker)):
+                    logger.warning(f'Lost lease on job {job_id}')
+                    break
+        finally:
+            conn.close()
+
+    threading.Thread(target=beat, daemon=True).start()
+    return stop
+
+def complete(cursor, job_id, worker):
+    """Mark a job done - run this in the same transaction as the job's results
+
+    Keyword arguments:
+    cursor - cursor for database
+    job_id - id of job
+    worker - name of worker holding the lease
+
+    Returns:
+    None
+    """
+    cursor.execute("UPDATE scrape_jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ?;", (job_id, worker))
+
+def fail(conn, job, worker, max_attempts, delay):
+    """Return a failed job to the queue, or give up on it after max_attempts
+
+    Keyword arguments:
+    conn - database connection
+    job - job dict returned by claim
+    worker - name of worker holding the lease
+    max_attempts - attempts before the job is marked failed
+    delay - seconds before the job may be claimed again
+
+    Returns:
+    bool - True if the job was given up on
+    """
+    gave_up = job['attempts'] >= max_attempts
+    conn.execute("""
+        UPDATE scrape_jobs SET
+            status = ?
+            ,not_before = ?
+            ,lease_owner = NULL
+            ,lease_expires = NULL
+            WHERE id = ? AND lease_owner = ?
+        ;
+        """, ('failed' if gave_up else 'queued', time() + delay, job['id'], worker))
+    conn.commit()
+    return gave_up
+
+def give_up_theater(conn, kinds, theater_id):
+    """Give up on every queued job for a theater, leaving jobs other workers are running alone
+
+    Keyword arguments:
+    conn - database connection
+    kinds - list of job kinds to give up on
+    theater_id - id of theater
+
+    Returns:
+    int - number of jobs given up on
+    """
+    kind_params = ','.join(['?']*len(kinds))
+    cursor = conn.execute(f"UPDATE scrape_jobs SET status = 'failed' WHERE kind IN ({kind_params}) AND theater_id = ? AND status = 'queued';", (*kinds, theater_id))
+    conn.commit()
+    return cursor.rowcount
+
+def pending(conn, kinds, theater_id=None, include_failed=False):
+    """Count jobs that are queued or being worked on
+
+    Keyword arguments:
+    conn - database connection
+    kinds - list of job kinds to count
+    theater_id - only count jobs for this theater
+    include_failed - also count jobs that were given up on
+
+    Returns:
+    int - number of unfinished jobs
+    """
+    kind_params = ','.join(['?']*len(kinds))
+    statuses = "'queued', 'leased', 'failed'" if include_failed else "'queued', 'leased'"
+    query = f"SELECT COUNT(*) FROM scrape_jobs WHERE kind IN ({kind_params}) AND status IN ({statuses})"
+    params = list(kinds)
+    if(theater_id is not None):
+        query += ' AND theater_id = ?'
+        params.append(theater_id)
+
+    return conn.execute(query, params).fetchone()[0]
+
+def cleanup(cursor):
+    """Remove finished jobs queued before today
+
+    Keyword arguments:
+    cursor - cursor for database
+
+    Returns:
+    None
+    """
+    cursor.execute("DELETE FROM scrape_jobs WHERE status IN ('done', 'failed') AND date_queued < DATE('now', 'localtime');")
+
+def failed(conn, kinds):
+    """Get jobs that were given up on
+
+    Keyword arguments:
+    conn - database connection
+    kinds - list of job kinds
+
+    Returns:
+    list - [(job_key, theater_id)]
+    """
+    kind_params = ','.join(['?']*len(kinds))
+    return conn.execute(f"SELECT job_key, theater_id FROM scrape_jobs WHERE kind IN ({kind_params}) AND status = 'failed'", kinds).fetchall()
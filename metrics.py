@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+import logging
+from time import perf_counter, time
+from contextlib import contextmanager
+
+logger = logging.getLogger('metrics')
+
+metrics_dir = 'metrics' # directory run metrics are written to
+textfile_location = os.path.join(metrics_dir, 'movie_schedule.prom') # Prometheus textfile, overwritten every run - point node_exporter's textfile collector here
+
+stage_times = {} # stage -> [seconds spent, number of times entered]
+counters = {} # name -> count
+metrics_lock = threading.Lock()
+
+def reset():
+    """Forget everything recorded so far, at the start of a pipeline run
+
+    Returns:
+    None
+    """
+    with metrics_lock:
+        stage_times.clear()
+        counters.clear()
+
+def add_time(stage, seconds):
+    """Add time spent in a stage
+
+    Keyword arguments:
+    stage - name of stage, e.g. page_load
+    seconds - seconds spent
+
+    Returns:
+    None
+    """
+    with metrics_lock:
+        total, calls = stage_times.get(stage, [0, 0])
+        stage_times[stage] = [total + seconds, calls + 1]
+
+@contextmanager
+def timed(stage):
+    """Time the body of a with block as a stage
+
+    Keyword arguments:
+    stage - name of stage
+
+    Yields:
+    None
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, perf_counter() - start)
+
+def count(name, amount=1):
+    """Add to a counter
+
+    Keyword arguments:
+    name - name of counter, e.g. pages
+    amount - amount to add
+
+    Returns:
+    None
+    """
+    with metrics_lock:
+        counters[name] = counters.get(name, 0) + amount
+
+def snapshot():
+    """Get everything recorded so far
+
+    Returns:
+    dict - {stages: {stage: {seconds, calls}}, counters: {name: count}}
+    """
+    with metrics_lock:
+        return {
+            'stages': {stage: {'seconds': round(total, 3), 'calls': calls} for stage, (total, calls) in sorted(stage_times.items())}
+            ,'counters': dict(sorted(counters.items()))
+        }
+
+def summary():
+    """Describe everything recorded so far for the completion email
+
+    Returns:
+    str - one line per stage and counter
+    """
+    recorded = snapshot()
+
+    lines = [f'{stage}: {round(timing["seconds"], 1)} seconds over {timing["calls"]} calls' for stage, timing in recorded['stages'].items()]
+    lines += [f'{name}: {value}' for name, value in recorded['counters'].items()]
+    return '\n'.join(lines)
+
+def write(start_time, end_time, success):
+    """Write everything recorded during a run to a JSON file and the Prometheus textfile
+
+    Keyword arguments:
+    start_time - datetime the run started
+    end_time - datetime the run ended
+    success - whether every step finished
+
+    Returns:
+    str - filepath of JSON file
+    """
+    os.makedirs(metrics_dir, exist_ok=True)
+    recorded = snapshot()
+    run_seconds = (end_time - start_time).total_seconds()
+
+    json_location = os.path.join(metrics_dir, f'movie_schedule_{start_time.strftime("%d%m%Y_%H%M%S")}.json')
+    with open(json_location, 'w') as f:
+        json.dump({'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(), 'run_seconds': run_seconds, 'success': bool(success), **recorded}, f, indent=1)
+
+    lines = [
+        '# HELP movie_schedule_stage_seconds Seconds spent in each stage during the last run'
+        ,'# TYPE movie_schedule_stage_seconds gauge'
+    ]
+    lines += [f'movie_schedule_stage_seconds{{stage="{stage}"}} {timing["seconds"]}' for stage, timing in recorded['stages'].items()]
+    lines += [
+        '# HELP movie_schedule_stage_calls Times each stage was entered during the last run'
+        ,'# TYPE movie_schedule_stage_calls gauge'
+    ]
+    lines += [f'movie_schedule_stage_calls{{stage="{stage}"}} {timing["calls"]}' for stage, timing in recorded['stages'].items()]
+    lines += [
+        '# HELP movie_schedule_items Pages, movies, showtimes and emails handled during the last run'
+        ,'# TYPE movie_schedule_items gauge'
+    ]
+    lines += [f'movie_schedule_items{{name="{name}"}} {value}' for name, value in recorded['counters'].items()]
+    lines += [
+        '# HELP movie_schedule_run_seconds Runtime of the last run'
+        ,'# TYPE movie_schedule_run_seconds gauge'
+        ,f'movie_schedule_run_seconds {run_seconds}'
+        ,'# HELP movie_schedule_run_success Whether the last run finished every step'
+        ,'# TYPE movie_schedule_run_success gauge'
+        ,f'movie_schedule_run_success {int(bool(success))}'
+        ,'# HELP movie_schedule_last_run_timestamp_seconds When the last run ended'
+        ,'# TYPE movie_schedule_last_run_timestamp_seconds gauge'
+        ,f'movie_schedule_last_run_timestamp_seconds {round(time())}'
+    ]
+
+    # the textfile collector may read at any moment, so the file is swapped in whole
+    tmp_location = f'{textfile_location}.{os.getpid()}.tmp'
+    with open(tmp_location, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_location, textfile_location)
+
+    logger.info(f'Run metrics written to {json_location} and {textfile_location}')
+    return json_location
@@ -0,0 +1,144 @@
+import json
+import base64
+import logging
+
+logger = logging.getLogger('network_capture')
+
+response_patterns = ['/napi/theaterMovieShowtimes'] # urls of json responses that carry a theater's movies and showtimes
+
+# names a field may go by in captured movie records, tried in order
+movie_id_fields = ['id', 'movieId']
+movie_name_fields = ['title', 'name']
+movie_url_fields = ['mopURI', 'movieUrl', 'url']
+movie_runtime_fields = ['runtime', 'duration']
+movie_rating_fields = ['rating', 'mpaaRating']
+movie_poster_fields = ['poster', 'posterImage', 'image']
+showtime_url_fields = ['ticketingJumpPageURL', 'ticketingUrl', 'url']
+showtime_time_fields = ['screenReaderTime', 'time', 'label']
+
+def enable(options):
+    """Turn on the performance log that network responses are read from
+
+    Keyword arguments:
+    options - selenium Options browsers are created with
+
+    Returns:
+    None
+    """
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+def drain(browser):
+    """Throw away logged network events, so the next page only sees its own responses
+
+    Keyword arguments:
+    browser - selenium browser
+
+    Returns:
+    None
+    """
+    browser.get_log('performance')
+
+def captured_payloads(browser):
+    """Get the json bodies of matching responses received since the last drain
+
+    Keyword arguments:
+    browser - selenium browser created with enable(options)
+
+    Returns:
+    list - decoded json of every response whose url matches response_patterns
+    """
+    payloads = []
+    for entry in browser.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if(message.get('method') != 'Network.responseReceived'):
+            continue
+
+        response = message['params']['response']
+        if(not any(pattern in response['url'] for pattern in response_patterns)):
+            continue
+
+        try:
+            body = browser.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+            text = base64.b64decode(body['body']).decode('utf8') if body.get('base64Encoded') else body['body']
+            payloads.append(json.loads(text))
+        except Exception as e:
+            # the body may already be gone if the page navigated, the html is still there to fall back on
+            logger.warning(f'Could not read response from {response["url"]}: {e}')
+
+    return payloads
+
+def first_field(record, names):
+    """Get the first of several possible fields that a record has
+
+    Keyword arguments:
+    record - dict
+    names - field names to try in order
+
+    Returns:
+    value of first field present and not None, otherwise None
+    """
+    for name in names:
+        if(record.get(name) is not None):
+            return record[name]
+    return None
+
+def find_movies(payload):
+    """Find movie records anywhere in a captured payload
+
+    Keyword arguments:
+    payload - decoded json
+
+    Returns:
+    list - [dict of movie record], a movie record being any dict in a "movies" list with an id and a name
+    """
+    movies = []
+    if(isinstance(payload, dict)):
+        for key, value in payload.items():
+            if(key == 'movies' and isinstance(value, list)):
+                movies += [movie for movie in value if isinstance(movie, dict) and first_field(movie, movie_id_fields) is not None and first_field(movie, movie_name_fields) is not None]
+            else:
+                movies += find_movies(value)
+    elif(isinstance(payload, list)):
+        for value in payload:
+            movies += find_movies(value)
+
+    return movies
+
+def find_showtimes(movie):
+    """Find showtime records anywhere in a movie record, however they are grouped
+
+    Keyword arguments:
+    movie - movie record from find_movies
+
+    Returns:
+    list - [dict of showtime record], a showtime record being any dict in a "showtimes" list
+    """
+    showtimes = []
+    if(isinstance(movie, dict)):
+        for key, value in movie.items():
+            if(key == 'showtimes' and isinstance(value, list)):
+                showtimes += [showtime for showtime in value if isinstance(showtime, dict)]
+            else:
+                showtimes += find_showtimes(value)
+    elif(isinstance(movie, list)):
+        for value in movie:
+            showtimes += find_showtimes(value)
+
+    return showtimes
+
+def first_string(value):
+    """Get the first string in a value, which may be nested in dicts and lists (e.g. poster image sizes)
+
+    Keyword arguments:
+    value - str, dict or list
+
+    Returns:
+    str - first string found, or None
+    """
+    if(isinstance(value, str)):
+        return value
+    for item in (value.values() if isinstance(value, dict) else value if isinstance(value, list) else []):
+        found = first_string(item)
+        if(found is not None):
+            return found
+    return None
@@ -0,0 +1,105 @@
+import os
+import gzip
+import hashlib
+import logging
+from time import time
+
+logger = logging.getLogger('page_cache')
+
+cache_dir = os.path.join('cache', 'pages') # directory compressed pages are stored in
+page_ttl = 12*60*60 # seconds a stored page may be served before it has to be fetched again
+max_cache_bytes = 500*1024*1024 # total size of stored pages before the oldest are evicted
+
+def page_path(url):
+    """Get the file a page is stored in
+
+    Keyword arguments:
+    url - full url of page, including query string
+
+    Returns:
+    str - filepath of compressed page
+    """
+    key = hashlib.sha256(url.encode('utf8')).hexdigest()
+    return os.path.join(cache_dir, key[:2], f'{key}.html.gz')
+
+def get_page(url, ttl=None):
+    """Read a page from the cache
+
+    Keyword arguments:
+    url - full url of page
+    ttl - maximum age of page in seconds, defaults to page_ttl
+
+    Returns:
+    str - html of page, or None if the page is not stored or has expired
+    """
+    path = page_path(url)
+    ttl = page_ttl if ttl is None else ttl
+
+    try:
+        if(time() - os.path.getmtime(path) > ttl):
+            os.remove(path)
+            return None
+
+        with gzip.open(path, 'rt', encoding='utf8') as f:
+            html = f.read()
+    except (FileNotFoundError, OSError, EOFError):
+        return None
+
+    logger.info(f'Page cache hit for {url}')
+    return html
+
+def store_page(url, html):
+    """Write a page to the cache
+
+    Keyword arguments:
+    url - full url of page
+    html - html of page
+
+    Returns:
+    None
+    """
+    path = page_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write to a temporary file first so a crash or a concurrent reader never sees half a page
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf8') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+
+def evict():
+    """Remove expired pages, then the oldest pages until the cache fits in max_cache_bytes
+
+    Returns:
+    int - number of pages removed
+    """
+    if(not os.path.isdir(cache_dir)):
+        return 0
+
+    now = time()
+    pages = []
+    for root, dirs, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            pages.append((stat.st_mtime, stat.st_size, path))
+
+    pages.sort()
+    total_size = sum(size for mtime, size, path in pages)
+
+    removed = 0
+    for mtime, size, path in pages:
+        if(now - mtime <= page_ttl and total_size <= max_cache_bytes):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+        removed += 1
+
+    logger.info(f'Evicted {removed} pages from page cache')
+    return removed
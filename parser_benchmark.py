@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import cProfile
+import pstats
+import logging
+import importlib.util
+import tracemalloc
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+import data_collection
+
+fixture_dir = 'fixtures' # directory of synthetic theater and movie pages written by fixture_pages.py
+expected_location = os.path.join(fixture_dir, 'expected.json') # parser output each fixture must still produce
+baseline_location = 'parser_baseline.json' # timings saved on this machine to compare later runs against
+iterations = 10 # times each parser runs over each fixture per timing round
+rounds = 3 # timing rounds per parser and fixture - the fastest is kept so other load on the machine doesn't count
+regression_threshold = 1.25 # slowdown against the baseline reported as a regression
+
+theater_fixtures = ['theater_large', 'theater_small', 'theater_none', 'theater_offline']
+movie_fixtures = ['movie_full', 'movie_partial']
+
+# functions whose time is broken out in the report
+profiled_functions = ['parse_theater_page', 'get_movie_list', 'parse_movie', 'parse_showtimes', 'parse_movie_info', 'get_text']
+
+def load_fixture(name):
+    """Read a fixture page
+
+    Keyword arguments:
+    name - name of fixture without extension
+
+    Returns:
+    str - html of page
+    """
+    with open(os.path.join(fixture_dir, f'{name}.html'), 'r', encoding='utf8') as f:
+        return f.read()
+
+def parse_theater(html):
+    data_collection.collected_movies = set()
+    return data_collection.collect_from_theater(data_collection.parse_theater_page(html))
+
+def parse_theater_movies(html):
+    data_collection.collected_movies = set()
+    return data_collection.collect_movies_from_theater(data_collection.parse_theater_page(html))
+
+def parse_theater_showtimes(html):
+    return data_collection.collect_showtimes_from_theater(data_collection.parse_theater_page(html))
+
+def parse_movie(html):
+    movie_info = data_collection.parse_movie_info(html)
+    movie_info.pop('info_updated') # changes every run
+    return movie_info
+
+# parser name -> [function, fixtures it runs over, part of the fixture's expected output it produces]
+parsers = {
+    'collect_from_theater': [parse_theater, theater_fixtures, None]
+    ,'collect_movies_from_theater': [parse_theater_movies, theater_fixtures, 0]
+    ,'collect_showtimes_from_theater': [parse_theater_showtimes, theater_fixtures, 1]
+    ,'parse_movie_info': [parse_movie, movie_fixtures, None]
+}
+
+def load_baseline(path):
+    """Import the data_collection.py from before the parser rewrite, whose output the fixtures are checked against
+
+    Keyword arguments:
+    path - filepath of the old data_collection.py, e.g. saved with git show <commit>:data_collection.py
+
+    Returns:
+    module
+    """
+    spec = importlib.util.spec_from_file_location('baseline_data_collection', path)
+    baseline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(baseline)
+
+    # the old get_text doubled quotes for the hand-built insert statements, which the database undid - the stored text is what is compared
+    get_text = baseline.get_text
+    baseline.get_text = lambda soup: get_text(soup).replace("\'\'", "\'")
+    return baseline
+
+def baseline_theater(baseline, html):
+    """Parse a theater page with the old parsers
+
+    Keyword arguments:
+    baseline - module from load_baseline
+    html - html of page
+
+    Returns:
+    [list of movie dicts, list of showtime dicts], like collect_from_theater
+    """
+    get_movie_info = baseline.get_movie_info
+    baseline.get_movie_info = lambda url: {} # the old parser fetched every movie's detail page inline, those are fixtures of their own
+    try:
+        baseline.collected_movies = []
+        soup = BeautifulSoup(html, 'html.parser')
+        return [baseline.collect_movies_from_theater(soup), baseline.collect_showtimes_from_theater(soup)]
+    finally:
+        baseline.get_movie_info = get_movie_info
+
+def baseline_movie(baseline, html):
+    """Parse a movie detail page with the old parser, which loaded the page itself
+
+    Keyword arguments:
+    baseline - module from load_baseline
+    html - html of page
+
+    Returns:
+    dict - {rt_critic, rt_audience, genres, synopsis}, like parse_movie
+    """
+    class SavedPage:
+        page_source = html
+        def get(self, url):
+            pass
+        def quit(self):
+            pass
+
+    browser_init = baseline.browser_init
+    baseline.browser_init = SavedPage
+    baseline.sleep_amt = 0
+    try:
+        return baseline.get_movie_info('fixture')
+    finally:
+        baseline.browser_init = browser_init
+
+def snapshot(baseline_path):
+    """Save what the old parsers produce for every fixture as the expected output
+
+    The expected output comes from the parsers the current ones replaced, so check_output compares against them rather than against itself
+
+    Keyword arguments:
+    baseline_path - filepath of the old data_collection.py
+
+    Returns:
+    None
+    """
+    baseline = load_baseline(baseline_path)
+
+    expected = {name: baseline_theater(baseline, load_fixture(name)) for name in theater_fixtures}
+    expected.update({name: baseline_movie(baseline, load_fixture(name)) for name in movie_fixtures})
+
+    with open(expected_location, 'w') as f:
+        json.dump(expected, f, sort_keys=True)
+
+    print(f'Saved expected output to {expected_location}')
+
+def check_output():
+    """Compare every parser's output against the expected output
+
+    Returns:
+    list - ["parser on fixture"] that no longer match
+    """
+    with open(expected_location, 'r') as f:
+        expected = json.load(f)
+
+    mismatches = []
+    for parser, (func, names, part) in parsers.items():
+        for name in names:
+            # round trip through json so tuples and lists compare equal
+            output = json.loads(json.dumps(func(load_fixture(name))))
+            if(output != (expected[name] if part is None else expected[name][part])):
+                mismatches.append(f'{parser} on {name}')
+
+    return mismatches
+
+def time_parser(func, html):
+    """Time a parser over one page
+
+    Keyword arguments:
+    func - parser function
+    html - html of page
+
+    Returns:
+    dict - {pages_per_sec, ms_per_page, peak_kb, functions: {function name: ms per page}}
+    """
+    func(html) # first run builds regex and strainer caches
+
+    elapsed = None
+    for i in range(rounds):
+        start = perf_counter()
+        for j in range(iterations):
+            func(html)
+        elapsed = perf_counter() - start if elapsed is None else min(elapsed, perf_counter() - start)
+
+    profile = cProfile.Profile()
+    profile.enable()
+    for i in range(iterations):
+        func(html)
+    profile.disable()
+
+    stats = pstats.Stats(profile)
+    # the profiler slows everything down, so each function's share of the profiled run is applied to the unprofiled time
+    functions = {}
+    for (filename, line, function), (cc, nc, tt, ct, callers) in stats.stats.items():
+        if(function in profiled_functions and filename.endswith('data_collection.py')):
+            functions[function] = round(ct / stats.total_tt * elapsed / iterations * 1000, 3)
+
+    tracemalloc.start()
+    func(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'pages_per_sec': round(iterations / elapsed, 1)
+        ,'ms_per_page': round(elapsed / iterations * 1000, 3)
+        ,'peak_kb': round(peak / 1024, 1)
+        ,'functions': functions
+    }
+
+def run_benchmark():
+    """Time every parser over every fixture
+
+    Returns:
+    dict - parser name -> fixture name -> timings from time_parser
+    """
+    return {parser: {name: time_parser(func, load_fixture(name)) for name in names} for parser, (func, names, part) in parsers.items()}
+
+def report(results, baseline=None):
+    """Describe benchmark results, flagging parsers that got slower than the baseline
+
+    Keyword arguments:
+    results - results from run_benchmark
+    baseline - earlier results to compare against
+
+    Returns:
+    [str - report, list of regressions]
+    """
+    lines = [f'{"parser":<32}{"fixture":<18}{"pages/s":>10}{"ms/page":>10}{"peak kB":>10}{"baseline":>10}']
+    regressions = []
+
+    for parser, fixtures in results.items():
+        for name, timing in fixtures.items():
+            before = None if baseline is None else baseline.get(parser, {}).get(name)
+            change = ''
+            if(before is not None):
+                ratio = timing['ms_per_page'] / before['ms_per_page']
+                change = f'{ratio:.2f}x'
+                if(ratio > regression_threshold):
+                    regressions.append(f'{parser} on {name} {change} slower')
+
+            lines.append(f'{parser:<32}{name:<18}{timing["pages_per_sec"]:>10}{timing["ms_per_page"]:>10}{timing["peak_kb"]:>10}{change:>10}')
+            lines.append('\t' + ', '.join(f'{function} {ms} ms' for function, ms in sorted(timing['functions'].items(), key=lambda i: -i[1])))
+
+    return '\n'.join(lines), regressions
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING) # parser warnings for missing years and short runtimes would flood the output
+
+    # python parser_benchmark.py snapshot <old data_collection.py>
+    if('snapshot' in sys.argv):
+        snapshot(sys.argv[sys.argv.index('snapshot') + 1])
+        sys.exit(0)
+
+    for arg in sys.argv[1:]:
+        if(arg.isdigit()):
+            iterations = int(arg)
+
+    mismatches = check_output()
+    if(mismatches != []):
+        print('Parser output changed:\n\t' + '\n\t'.join(mismatches))
+
+    baseline = None
+    if(os.path.isfile(baseline_location) and 'save' not in sys.argv):
+        with open(baseline_location, 'r') as f:
+            baseline = json.load(f)
+
+    results = run_benchmark()
+    text, regressions = report(results, baseline)
+    print(text)
+
+    if('save' in sys.argv):
+        with open(baseline_location, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f'Saved baseline to {baseline_location}')
+
+    if(regressions != []):
+        print('Slower than baseline:\n\t' + '\n\t'.join(regressions))
+
+    sys.exit(1 if mismatches != [] or regressions != [] else 0)
@@ -0,0 +1,82 @@
+import random
+import threading
+import logging
+from time import sleep, monotonic
+from urllib.parse import urlparse
+
+import metrics
+
+logger = logging.getLogger('rate_limit')
+
+requests_per_minute = 4 # sustained request rate allowed against a single host
+burst = 1 # number of requests that may be made back to back before the rate applies
+jitter = 0.5 # extra random wait, as a fraction of the interval between requests
+bucket_rates = {'movie_info': 2} # requests per minute for named budgets that don't follow requests_per_minute
+
+buckets = {} # host or budget name -> [available tokens, time of last refill]
+buckets_lock = threading.Lock()
+
+def get_host(url):
+    """Get the host that a request will be made to
+
+    Keyword arguments:
+    url - full url of request
+
+    Returns:
+    str - host name of url
+    """
+    return urlparse(url).netloc.lower()
+
+def get_rate(bucket):
+    """Get the sustained request rate of a bucket
+
+    Keyword arguments:
+    bucket - host name or named budget
+
+    Returns:
+    float - requests per second
+    """
+    return bucket_rates.get(bucket, requests_per_minute) / 60
+
+def reserve_token(bucket):
+    """Take a token from a bucket, going into debt if none are available
+
+    Keyword arguments:
+    bucket - host name or named budget to take token from
+
+    Returns:
+    float - seconds to wait before the reserved token may be used
+    """
+    rate = get_rate(bucket)
+
+    with buckets_lock:
+        now = monotonic()
+        tokens, last_refill = buckets.get(bucket, [burst, now])
+
+        tokens = min(burst, tokens + (now - last_refill) * rate)
+        tokens -= 1
+
+        buckets[bucket] = [tokens, now]
+
+    # a negative balance means earlier callers have already claimed the upcoming tokens
+    return 0 if tokens >= 0 else -tokens / rate
+
+def wait_for_token(url, bucket=None):
+    """Block until a request to url is allowed by its token bucket
+
+    Keyword arguments:
+    url - full url of request about to be made
+    bucket - name of budget to draw from, defaults to the url's host
+
+    Returns:
+    float - seconds spent waiting
+    """
+    bucket = get_host(url) if bucket is None else bucket
+
+    wait = reserve_token(bucket) + random.uniform(0, jitter / get_rate(bucket))
+
+    logger.info(f'Waiting {round(wait, 1)} seconds before request to {bucket}')
+    with metrics.timed('sleep'):
+        sleep(wait)
+
+    return wait
@@ -0,0 +1,236 @@
+import sys
+import random
+import logging
+from time import perf_counter
+from datetime import datetime, timedelta
+
+import pandas as pd
+from duckdb import sql
+
+import schedule
+import schedule_engine
+import template_engine
+
+theater_count = 40 # theaters in generated data
+movie_count = 150 # movies in generated data
+subscriber_count = 100 # subscribers schedules are rendered for
+theaters_per_subscriber = 5 # most theaters a subscriber subscribes to
+showtimes_per_movie = 8 # most showtimes of a movie at a theater
+seed = 1 # seed for generated data, so runs are comparable
+rounds = 5 # timing rounds of the template microbenchmark - the fastest is kept so other load on the machine doesn't count
+
+# renderer name -> function taking a subscriber's data
+renderers = {
+    'legacy_styled_html': lambda data: legacy_styled_html(*data, subscriber='Benchmark')
+    ,'schedule_styled_html': lambda data: schedule.schedule_styled_html(*data, subscriber='Benchmark')
+    ,'schedule_simple_html': lambda data: schedule.schedule_simple_html(*data, subscriber='Benchmark')
+    ,'schedule_simple': lambda data: schedule.schedule_simple(*data)
+    ,'showtime_prettify': lambda data: schedule.showtime_prettify(*data[:3], include_titles=True)
+}
+
+def generate_data():
+    """Generate theaters, movies, showtimes and subscriptions shaped like the live database
+
+    Returns:
+    [subscriptions, showtimes, movies, theaters, new this week] DataFrames
+    """
+    rng = random.Random(seed)
+    today = datetime.now().date()
+
+    theaters = pd.DataFrame([{'id': f'AA{i:03d}', 'name': f'Theater {i:03d}', 'url': f'/theater-{i:03d}', 'address': '', 'date_updated': str(today)} for i in range(theater_count)])
+    movies = pd.DataFrame([{
+        'id': str(200000 + i), 'name': f'Movie {i:03d}', 'url': f'/movie-{i:03d}', 'release_year': rng.choice([None, 2024, 2025])
+        ,'runtime': rng.choice([None, 95, 120]), 'rating': rng.choice([None, 'PG', 'R']), 'image_url': f'/poster-{i:03d}.jpg'
+        ,'rt_critic': rng.choice([None, 91]), 'rt_audience': rng.choice([None, 84]), 'genres': rng.choice([None, 'Drama']), 'synopsis': rng.choice([None, 'A film.'])
+    } for i in range(movie_count)])
+
+    showtimes = []
+    for theater_id in theaters['id']:
+        for movie_id in rng.sample(list(movies['id']), rng.randint(3, 20)):
+            for i in range(rng.randint(1, showtimes_per_movie)):
+                showtimes.append({
+                    'id': str(len(showtimes)), 'movie_id': movie_id, 'theater_id': theater_id, 'url': f'/ticket-{len(showtimes)}'
+                    ,'date': str(today + timedelta(days=rng.randint(1, 7))), 'time': f'{rng.randint(10, 23)}:{rng.choice(["00", "30"])}:00', 'format': None
+                })
+    showtimes = pd.DataFrame(showtimes)
+    new_this_week = showtimes[showtimes['movie_id'].isin(set(rng.sample(list(movies['id']), movie_count // 5)))]
+
+    subscriptions = pd.DataFrame([{'user_id': user_id, 'theater_id': theater_id} for user_id in range(subscriber_count) for theater_id in rng.sample(list(theaters['id']), rng.randint(1, theaters_per_subscriber))])
+
+    return subscriptions, showtimes, movies, theaters, new_this_week
+
+def count_queries(func, subscriber_data):
+    """Count the duckdb queries a renderer issues, in a separate untimed pass
+
+    duckdb finds DataFrames by name in the calling function, so sql can't be wrapped - calls to it are watched with a profile hook instead
+
+    Keyword arguments:
+    func - renderer function
+    subscriber_data - list of subscriber data to render
+
+    Returns:
+    int - number of queries
+    """
+    queries = [0]
+    def watch(frame, event, arg):
+        if(event == 'c_call' and getattr(arg, '__name__', None) == 'sql' and 'duckdb' in str(getattr(arg, '__module__', ''))):
+            queries[0] += 1
+
+    sys.setprofile(watch)
+    try:
+        for data in subscriber_data:
+            func(data)
+    finally:
+        sys.setprofile(None)
+
+    return queries[0]
+
+def run_benchmark():
+    """Render every subscriber's schedule with every renderer, including the styled renderer from before showing_counts
+
+    Returns:
+    dict - renderer name -> {ms_per_subscriber, queries_per_subscriber}
+    """
+    subscriptions, showtimes, movies, theaters, new_this_week = generate_data()
+    schedule_data = schedule_engine.prepare(subscriptions, showtimes, movies, theaters, new_this_week)
+    subscriber_data = [schedule_engine.subscriber_data(schedule_data, user_id) for user_id in range(subscriber_count)]
+
+    results = {}
+    for name, func in renderers.items():
+        start = perf_counter()
+        for data in subscriber_data:
+            func(data)
+        elapsed = perf_counter() - start
+
+        results[name] = {'ms_per_subscriber': round(elapsed / subscriber_count * 1000, 2), 'queries_per_subscriber': round(count_queries(func, subscriber_data) / subscriber_count, 1)}
+
+    return results
+
+def card_values(movie):
+    """Get the values filled into a film card, for the template microbenchmark
+
+    Keyword arguments:
+    movie - dict of movie
+
+    Returns:
+    dict - field name -> str
+    """
+    return {
+        'header': movie['name'], 'details': f'{movie["runtime"]} min', 'film_url': movie['url'], 'image_url': movie['image_url'], 'rt_critic': schedule.score_text(movie['rt_critic']) or '--', 'rt_audience': schedule.score_text(movie['rt_audience']) or '--'
+        ,'genres': 'Drama', 'synopsis': 'A film. ' * 40, 'theaters': '<br>'.join([f'\t<span>Theater {i:03d} <sup>x3</sup></p>\n' for i in range(theaters_per_subscriber)])
+    }
+
+def replace_chain_card(values):
+    """Fill in a film card the way schedule_styled_html did before template_engine - the file is read and every field is a str.replace over the whole card
+
+    Keyword arguments:
+    values - dict from card_values
+
+    Returns:
+    str - film card
+    """
+    with open(schedule.film_template_location, 'r') as f:
+        card = f.read()
+    for name, value in values.items():
+        card = card.replace('{' + name + '}', value)
+    return card
+
+def legacy_styled_html(showtime_df, movie_df, theater_df, new_this_week, limited_showings, subscriber):
+    """Render the styled schedule the way schedule_styled_html did before showing_counts - a correlated query per film and a str.replace chain per card
+
+    Scores go through schedule.score_text, as they are numbers in the database
+
+    Keyword arguments:
+    showtime_df - dataframe containing showtimes
+    movie_df - dataframe containing movies
+    theater_df - dataframe containing theaters
+    new_this_week - dataframe containing showtimes of movies new to their theater this week
+    limited_showings - dataframe containing movie_id and theater_id of limited showings
+    subscriber - name of subscriber
+
+    Returns:
+    str - html of schedule
+    """
+    with open(schedule.base_template_location, 'r') as f:
+        base_template = f.read()
+
+    films = []
+    for movie_index, movie_row in movie_df.sort_values(by=['name'], inplace=False).iterrows():
+        theaters = sql(f"""
+                    SELECT DISTINCT 
+                        t.id
+                        ,t.name
+                        ,CASE WHEN n.theater_id IS NOT NULL THEN 1 ELSE 0 END AS new
+                        ,CASE WHEN l.theater_id IS NOT NULL THEN 1 ELSE 0 END AS limited
+                        ,(SELECT COUNT(*) FROM showtime_df s2 GROUP BY s2.movie_id, s2.theater_id HAVING s2.movie_id = s.movie_id AND s2.theater_id = s.theater_id) AS num_showings
+                    FROM showtime_df s
+                    INNER JOIN theater_df t ON t.id = s.theater_id
+                    LEFT JOIN new_this_week n ON n.movie_id = s.movie_id AND n.theater_id = t.id
+                    LEFT JOIN limited_showings l ON l.movie_id = s.movie_id AND l.theater_id = t.id
+                    WHERE s.movie_id = \'{movie_row["id"]}\'
+                    ORDER BY t.name""").df()
+
+        film_header = movie_row['name']
+        if(movie_row['release_year'] is not None and not pd.isna(movie_row['release_year'])):
+            film_header += f' ({int(movie_row["release_year"])})'
+
+        film_details = ''
+        if(movie_row['runtime'] is not None and not pd.isna(movie_row['runtime'])):
+            film_details += str(int(movie_row['runtime'])) + ' min'
+        if(movie_row['rating'] is not None and not pd.isna(movie_row['rating'])):
+            film_details += f'{", " if film_details != "" else ""}{movie_row["rating"]}'
+
+        rt_critic = schedule.score_text(movie_row['rt_critic'])
+        rt_audience = schedule.score_text(movie_row['rt_audience'])
+
+        theater_html = []
+        for index, row in theaters.iterrows():
+            theater_html.append(f"""\t<span style="margin-top: 0.5em;{'color:red;' if row['limited'] else ''}">{'<i>' if row['new'] else ''}{row['name']} <sup>x{row["num_showings"]}</sup>{'</i>' if row['new'] else ''}</p>\n""")
+
+        films.append(replace_chain_card({
+            'header': film_header, 'details': film_details, 'film_url': movie_row['url'], 'image_url': movie_row['image_url']
+            ,'rt_critic': rt_critic if rt_critic != '' and rt_audience != '' else '--', 'rt_audience': rt_audience if rt_critic != '' and rt_audience != '' else '--'
+            ,'genres': movie_row['genres'] if movie_row['genres'] is not None and not pd.isna(movie_row['genres']) and movie_row['genres'] != '' else 'N/A'
+            ,'synopsis': movie_row['synopsis'] if movie_row['synopsis'] is not None and not pd.isna(movie_row['synopsis']) and movie_row['synopsis'] != '' else 'N/A'
+            ,'theaters': '<br>'.join(theater_html)
+        }))
+
+    return base_template.replace('{films}', '\n'.join(films)).replace('{user}', subscriber)
+
+def template_benchmark():
+    """Time filling in film cards with the compiled template against the old str.replace chain
+
+    Returns:
+    dict - method -> microseconds per card
+    """
+    values = [card_values(movie) for movie in generate_data()[2].to_dict('records')]
+    template = template_engine.load_template(schedule.film_template_location)
+
+    results = {}
+    for name, func in {'replace_chain': replace_chain_card, 'compiled_template': lambda card: template_engine.render(template, card)}.items():
+        elapsed = None
+        for i in range(rounds):
+            start = perf_counter()
+            for card in values:
+                func(card)
+            elapsed = perf_counter() - start if elapsed is None else min(elapsed, perf_counter() - start)
+        results[name] = round(elapsed / len(values) * 1000000, 1)
+
+    return results
+
+if __name__ == '__main__':
+    logging.disable(logging.INFO)
+
+    for arg in sys.argv[1:]:
+        if(arg.isdigit()):
+            subscriber_count = int(arg)
+
+    results = run_benchmark()
+
+    print(f'{"renderer":<24}{"ms/subscriber":>15}{"queries/subscriber":>20}')
+    for name, timing in results.items():
+        print(f'{name:<24}{timing["ms_per_subscriber"]:>15}{timing["queries_per_subscriber"]:>20}')
+
+    print(f'\n{"film card":<24}{"us/card":>15}')
+    for name, us in template_benchmark().items():
+        print(f'{name:<24}{us:>15}')
@@ -0,0 +1,156 @@
+import random
+import threading
+import logging
+from time import monotonic
+
+import rate_limit
+
+logger = logging.getLogger('retry_policy')
+
+base_delay = 30 # seconds before the first retry of failed work, doubled for every further attempt
+max_delay = 900 # longest wait between retries
+max_attempts = 5 # attempts at a single page before it is given up on for this run
+max_run_attempts = 4 # collection runs in a row without progress before data collection gives up
+
+failure_threshold = 3 # consecutive failures before a theater is parked
+park_seconds = 1800 # seconds a parked theater is left alone before it is tried again
+
+max_slowdown = 16 # largest factor the request rate is divided by while a host is blocking us
+recovery = 0.8 # slowdown is multiplied by this after every successful request
+
+breakers = {} # theater id -> [consecutive failures, time parked or None, whether the one attempt let through after parking is still running]
+slowdowns = {} # host -> factor request rate is currently divided by
+policy_lock = threading.Lock()
+
+def backoff_delay(attempt):
+    """Get how long to wait before retrying failed work
+
+    Keyword arguments:
+    attempt - number of attempts that have already failed, starting at 0
+
+    Returns:
+    float - seconds to wait, exponential in attempt with jitter so retries don't line up
+    """
+    delay = min(max_delay, base_delay * 2**attempt)
+    return random.uniform(delay/2, delay)
+
+def breaker_open(key):
+    """Check whether a theater is parked
+
+    Keyword arguments:
+    key - theater id
+
+    Returns:
+    bool - True if work for the theater should not be attempted yet
+    """
+    with policy_lock:
+        failures, parked_at, probing = breakers.get(key, [0, None, False])
+
+        # half open - the rest of the theater's work waits until the attempt let through has succeeded or failed
+        if(probing):
+            return True
+
+        if(parked_at is None):
+            return False
+
+        if(monotonic() - parked_at >= park_seconds):
+            # let one attempt through, a failure parks the theater again
+            breakers[key] = [failure_threshold - 1, None, True]
+            logger.info(f'Retrying parked theater {key}')
+            return False
+
+        return True
+
+def breaker_wait(key):
+    """Get how long until a parked theater may be tried again
+
+    Keyword arguments:
+    key - theater id
+
+    Returns:
+    float - seconds until the theater is unparked, 0 if it isn't parked
+    """
+    with policy_lock:
+        failures, parked_at, probing = breakers.get(key, [0, None, False])
+
+    if(parked_at is None):
+        return 0
+    return max(0, park_seconds - (monotonic() - parked_at))
+
+def record_failure(key):
+    """Count a failure against a theater, parking it once failure_threshold is reached
+
+    Keyword arguments:
+    key - theater id
+
+    Returns:
+    None
+    """
+    with policy_lock:
+        failures, parked_at, probing = breakers.get(key, [0, None, False])
+        failures += 1
+
+        if(failures >= failure_threshold and parked_at is None):
+            logger.warning(f'Parking theater {key} for {park_seconds} seconds after {failures} failures in a row')
+            parked_at = monotonic()
+
+        breakers[key] = [failures, parked_at, False]
+
+def record_success(key):
+    """Reset a theater's failure count, closing its breaker if it was half open
+
+    Keyword arguments:
+    key - theater id
+
+    Returns:
+    None
+    """
+    with policy_lock:
+        breakers.pop(key, None)
+
+def apply_slowdown(host):
+    """Pass a host's current slowdown on to its rate limit bucket
+
+    Keyword arguments:
+    host - host name
+
+    Returns:
+    None
+    """
+    rate_limit.bucket_rates[host] = rate_limit.requests_per_minute / slowdowns[host]
+
+def record_blocked(host):
+    """Slow every request to a host down after it served an offline page
+
+    Keyword arguments:
+    host - host name
+
+    Returns:
+    None
+    """
+    with policy_lock:
+        slowdowns[host] = min(max_slowdown, slowdowns.get(host, 1) * 2)
+        apply_slowdown(host)
+
+    logger.warning(f'{host} appears to be blocking requests - request rate divided by {slowdowns[host]}')
+
+def record_unblocked(host):
+    """Let a host's request rate recover after a successful request
+
+    Keyword arguments:
+    host - host name
+
+    Returns:
+    None
+    """
+    with policy_lock:
+        if(host not in slowdowns):
+            return
+
+        slowdowns[host] = slowdowns[host] * recovery
+        if(slowdowns[host] <= 1):
+            slowdowns.pop(host)
+            rate_limit.bucket_rates.pop(host, None)
+            logger.info(f'{host} request rate fully recovered')
+        else:
+            apply_slowdown(host)
@@ -1,6 +1,8 @@
 import data_collection
 import schedule
 import archive
+import metrics
+import webapp_api
 
 import traceback
 import logging
@@ -9,14 +11,13 @@ from datetime import datetime
 import os
 import smtplib
 from email.message import EmailMessage
-from time import sleep
 import sys
 
 logger = logging.getLogger('run')
 
 log_location = None
 
-def send_completion_email(log_location, start_time=datetime.now(), end_time=datetime.now()):
+def send_completion_email(log_location, start_time=datetime.now(), end_time=datetime.now(), metrics_summary=None):
     logger.info('Sending completion email')
 
     # read email credentials
@@ -31,7 +32,10 @@ def send_completion_email(log_location, start_time=datetime.now(), end_time=date
     msg['To'] = recipient_email
     msg['Subject'] = f'Movie Schedule process for {datetime.now().date()} has completed'
 
-    msg.set_content(f'The process started at {start_time} and ended at {end_time}, executing in {(end_time-start_time).total_seconds()} seconds. The log file has been attached.')
+    content = f'The process started at {start_time} and ended at {end_time}, executing in {(end_time-start_time).total_seconds()} seconds. The log file has been attached.'
+    if(metrics_summary):
+        content += f'\n\nRun metrics:\n{metrics_summary}'
+    msg.set_content(content)
 
     with open(log_location, 'rb') as f:
         msg.add_attachment(
@@ -90,6 +94,8 @@ def send_failure_email(step, exception_traceback=None):
     return
 
 def run():
+    metrics.reset()
+    completed = False
     try:
         headless = 0
         if('test' in sys.argv):
@@ -111,30 +117,39 @@ def run():
         logging.basicConfig(filename=log_location, level=logging.INFO)
         logger.info(f'Starting {start_time.strftime("%m/%d/%Y %H:%M:%S")}')
 
-        wait_time = 600
+        # subscription data is fetched once, every stage after this reads the same snapshot
+        logger.info('Collecting subscription data from API')
+        step = 'api'
+        with metrics.timed('step_api'):
+            webapp_api.get_api_data(max_age=0)
+        webapp_api.snapshot_max_age = float('inf')
 
-        for i in range(5):
-            logger.info('Starting data collection')
-            step = 'data_collection'
-            success = data_collection.run(headless_val=headless)
-            logger.info('Data collection done')
-
-            if(success is None or not success):
-                logger.error(f'Data collection attempt {i} failed. Trying again in {wait_time} seconds')
-                sleep(wait_time)
-            else:
-                break
+        # data_collection.run retries failed work itself, so it only needs to be called once
+        logger.info('Starting data collection')
+        step = 'data_collection'
+        with metrics.timed('step_data_collection'):
+            success = data_collection.run(headless_val=headless, lean='lean' in sys.argv, capture='capture' in sys.argv)
+        logger.info('Data collection done')
 
         if(success is not None and success):
             logger.info('Starting schedule')
             step = 'schedule'
-            schedule.run(test = 'test' in sys.argv)
+            with metrics.timed('step_schedule'):
+                schedule.run(test = 'test' in sys.argv, api_max_age = float('inf'))
             logger.info('Schedule done')
 
+            logger.info('Starting movie info enrichment')
+            step = 'enrichment'
+            with metrics.timed('step_enrichment'):
+                data_collection.run_enrichment()
+            logger.info('Movie info enrichment done')
+
             logger.info('Starting archive')
             step = 'archive'
-            archive.run()
+            with metrics.timed('step_archive'):
+                archive.run()
             logger.info('Archive done')
+            completed = True
         else:
             logger.error('Data collection did not finish successfully - schedule and archive not running')
             send_failure_email(step)
@@ -145,7 +160,14 @@ def run():
     finally:
         end_time = datetime.now()
         logger.info(f'Finished {end_time.strftime("%m/%d/%Y %H:%M:%S")}, total runtime: {(end_time-start_time).total_seconds()} seconds')
-        send_completion_email(log_location, start_time, end_time)
+
+        # metrics are nice to have - failing to write them shouldn't stop the completion email
+        try:
+            metrics.write(start_time, end_time, completed)
+        except Exception:
+            logger.error(traceback.format_exc())
+
+        send_completion_email(log_location, start_time, end_time, metrics.summary())
     
 
 if __name__ == "__main__":
@@ -1,12 +1,10 @@
 import pandas as pd
 import sqlite3
-from duckdb import sql
 import datetime
 import traceback
 import platform
 import logging
 import os
-import requests
 import sys
 
 import smtplib
@@ -14,8 +12,19 @@ from email.mime.text import MIMEText
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 
+import metrics
+import subscription_sync
+import schedule_engine
+import template_engine
+
 logger = logging.getLogger('schedule')
 
+film_card_columns = ['id', 'name', 'release_year', 'runtime', 'rating', 'url', 'image_url', 'rt_critic', 'rt_audience', 'genres', 'synopsis'] # movie details a film card is filled in from
+film_card_cache = {} # movie details -> film card without its theater list, cleared every run
+
+base_template_location = 'email_base_template.html' # template of schedule email, {films} and {user} filled in
+film_template_location = 'email_film_template.html' # template of each film in schedule email
+
 
 def initialize_db(db_name):
     """Connect to sqlite3 database
@@ -67,16 +76,18 @@ def send_email(content, subscriber, to, subscriber_id, html=False, dates=None):
         msg.attach(MIMEText(content, 'plain'))
 
     # initialize smtp connection
-    server = smtplib.SMTP(host, 587)
-    server.ehlo()
-    server.starttls()
-    server.ehlo()
-    
-    server.login(email, password)
-    
-    server.sendmail(email, to, msg.as_string())
-    
-    server.quit()
+    with metrics.timed('smtp_send'):
+        server = smtplib.SMTP(host, 587)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        
+        server.login(email, password)
+        
+        server.sendmail(email, to, msg.as_string())
+        
+        server.quit()
+    metrics.count('emails')
 
     logger.info(f'Schedule sent to user {subscriber_id}: {subscriber}')
 
@@ -137,57 +148,88 @@ def showtime_prettify(showtime_df, movie_df, theater_df, include_schedule = True
     """
 
     # join movie_df, showtime_df, and theater_df
-    full_df = sql('SELECT DISTINCT m.name AS movie, m.release_year AS release_year, t.name AS theater, s.date AS date, s.time AS time, s.url AS showtime_url, s.movie_id AS movie_id, s.theater_id AS theater_id, s.id AS showtime_id FROM showtime_df s INNER JOIN movie_df m ON s.movie_id = m.id INNER JOIN theater_df t ON s.theater_id = t.id ORDER BY t.name, s.date, m.name, s.time').df()
+    full_df = showtime_df[['id', 'movie_id', 'theater_id', 'date', 'time', 'url']].rename(columns={'id': 'showtime_id', 'url': 'showtime_url'})
+    full_df = full_df.merge(movie_df[['id', 'name', 'release_year']].rename(columns={'id': 'movie_id', 'name': 'movie'}), on='movie_id')
+    full_df = full_df.merge(theater_df[['id', 'name']].rename(columns={'id': 'theater_id', 'name': 'theater'}), on='theater_id')
+    full_df = full_df.drop_duplicates().sort_values(by=['theater', 'date', 'movie', 'time'], kind='stable')
 
 
     showtime_str = ''
-    # loop through each theater
-    for t_index, t_row in sql('SELECT DISTINCT theater, theater_id FROM full_df').df().iterrows():
+    # full_df is already in schedule order, so each theater and date is a consecutive group of rows
+    for (theater, theater_id), theater_rows in full_df.groupby(['theater', 'theater_id'], sort=False):
         
-        showtime_str += t_row['theater'] + '\n'
-
-        theater_id = t_row['theater_id']
+        showtime_str += theater + '\n'
 
         if(include_titles):
             showtime_str += '\n'
 
-            for index, row in sql(f'SELECT DISTINCT movie FROM full_df WHERE theater_id = \'{theater_id}\' ORDER BY movie').df().iterrows():
-                showtime_str += f'\t{row["movie"]}' + '\n' # add year?
+            for movie in sorted(theater_rows['movie'].unique()):
+                showtime_str += f'\t{movie}' + '\n' # add year?
             
             showtime_str += '\n'
         if(include_schedule):
-            for date in sql(f'SELECT DISTINCT date FROM full_df WHERE theater_id = \'{theater_id}\' ORDER BY date').df()['date']:
+            for date, date_rows in theater_rows.groupby('date', sort=True):
                 showtime_str += f'\t{date}' + '\n'
 
-                for index, row in sql(f'SELECT movie, date, GROUP_CONCAT(SUBSTR(time, 0, 6), \', \') AS times FROM full_df WHERE theater_id = \'{theater_id}\' AND date = \'{date}\' GROUP BY date, movie ORDER BY movie').df().iterrows():
+                for movie, times in date_rows.groupby('movie', sort=True)['time']:
                     if(time_count):
-                        showtime_str += f'\t\t{row["movie"]} ({len(row["times"].split(","))})' + '\n'
+                        showtime_str += f'\t\t{movie} ({len(times)})' + '\n'
                     else:
-                        showtime_str += f'\t\t{row["movie"]} @ {row["times"]}' + '\n'
+                        showtime_str += f'\t\t{movie} @ {", ".join(time[:5] for time in times)}' + '\n'
             showtime_str += '\n'
     return showtime_str
 
+def showing_counts(showtime_df, movie_df, theater_df, new_this_week, limited_showings):
+    """Count showings of every movie at every theater, with whether it is new or limited there
+
+    Keyword arguments:
+    showtime_df - dataframe containing showtimes
+    movie_df - dataframe containing movies
+    theater_df - dataframe containing theaters
+    new_this_week - dataframe containing showtimes of movies new to their theater this week
+    limited_showings - dataframe containing movie_id and theater_id of limited showings
+
+    Returns:
+    list - [ { movie_id, movie, theater_id, theater, num_showings, new, limited } ], one per movie and theater
+    """
+    counts = showtime_df.groupby(['movie_id', 'theater_id'], sort=False).size().reset_index(name='num_showings')
+    counts = counts.merge(movie_df[['id', 'name']].rename(columns={'id': 'movie_id', 'name': 'movie'}), on='movie_id')
+    counts = counts.merge(theater_df[['id', 'name']].rename(columns={'id': 'theater_id', 'name': 'theater'}), on='theater_id')
+
+    new_pairs = set(zip(new_this_week['movie_id'], new_this_week['theater_id']))
+    limited_pairs = set(zip(limited_showings['movie_id'], limited_showings['theater_id']))
+
+    showings = counts.to_dict('records')
+    for showing in showings:
+        showing['new'] = int((showing['movie_id'], showing['theater_id']) in new_pairs)
+        showing['limited'] = int((showing['movie_id'], showing['theater_id']) in limited_pairs)
+    return showings
+
+def group_showings(showings, key, order):
+    """Group showings for one streaming pass, each group sorted
+
+    Keyword arguments:
+    showings - list from showing_counts
+    key - field to group by, movie_id or theater_id
+    order - field to sort each group by, movie or theater
+
+    Returns:
+    dict - key value -> [showing]
+    """
+    # films or theaters that share a name are kept in id order, so the schedule comes out the same every time
+    groups = {}
+    for showing in sorted(showings, key=lambda showing: (showing[order], str(showing[f'{order}_id']))):
+        groups.setdefault(showing[key], []).append(showing)
+    return groups
+
 def schedule_simple(showtime_df, movie_df, theater_df, new_this_week, limited_showings):
     schedule = ''
+    showings_by_theater = group_showings(showing_counts(showtime_df, movie_df, theater_df, new_this_week, limited_showings), 'theater_id', 'movie')
     for theater_index, theater_row in theater_df.iterrows():
         schedule += theater_row['name'] + '\n'
 
-        movies = sql(f"""
-                     SELECT DISTINCT 
-                        s.movie_id
-                        ,m.name
-                        ,CASE WHEN n.movie_id IS NOT NULL THEN 1 ELSE 0 END AS new
-                        ,CASE WHEN l.movie_id IS NOT NULL THEN 1 ELSE 0 END AS limited
-                        ,(SELECT COUNT(*) FROM showtime_df s2 GROUP BY s2.movie_id, s2.theater_id HAVING s2.movie_id = s.movie_id AND s2.theater_id = s.theater_id) AS num_showings
-                     FROM showtime_df s 
-                     INNER JOIN movie_df m ON s.movie_id = m.id 
-                     LEFT JOIN new_this_week n ON m.id = n.movie_id AND n.theater_id = s.theater_id
-                     LEFT JOIN limited_showings l ON l.movie_id = m.id AND l.theater_id = s.theater_id
-                     WHERE s.theater_id = \'{theater_row["id"]}\' 
-                     ORDER BY m.name""").df()
-
-        for index, row in movies.iterrows():
-            schedule += f"""{'+' if row['new'] else ' '}{'*' if row['limited'] else ' '} {row['name']} [x{row["num_showings"]}]\n"""
+        for row in showings_by_theater.get(theater_row['id'], []):
+            schedule += f"""{'+' if row['new'] else ' '}{'*' if row['limited'] else ' '} {row['movie']} [x{row["num_showings"]}]\n"""
         
         schedule += '\n'
     return schedule
@@ -228,131 +270,139 @@ def schedule_simple_html(showtime_df, movie_df, theater_df, new_this_week, limit
     <br>
 """ % subscriber
 
+    showings = showing_counts(showtime_df, movie_df, theater_df, new_this_week, limited_showings)
+
     if(by in ['both', 'theater']):
         schedule += '<h1>Breakdown by Theater</h1>'
 
+        showings_by_theater = group_showings(showings, 'theater_id', 'movie')
         for theater_index, theater_row in theater_df.iterrows():
-            movies = sql(f"""
-                        SELECT DISTINCT 
-                            s.movie_id
-                            ,m.name
-                            ,CASE WHEN n.movie_id IS NOT NULL THEN 1 ELSE 0 END AS new
-                            ,CASE WHEN l.movie_id IS NOT NULL THEN 1 ELSE 0 END AS limited
-                            ,(SELECT COUNT(*) FROM showtime_df s2 GROUP BY s2.movie_id, s2.theater_id HAVING s2.movie_id = s.movie_id AND s2.theater_id = s.theater_id) AS num_showings
-                        FROM showtime_df s 
-                        INNER JOIN movie_df m ON s.movie_id = m.id 
-                        LEFT JOIN new_this_week n ON m.id = n.movie_id AND n.theater_id = s.theater_id
-                        LEFT JOIN limited_showings l ON l.movie_id = m.id AND l.theater_id = s.theater_id
-                        WHERE s.theater_id = \'{theater_row["id"]}\' 
-                        ORDER BY m.name""").df()
+            movies = showings_by_theater.get(theater_row['id'], [])
                         
             if(len(movies) == 0):
                 continue
             else:
                 schedule += f"\t<h2>{theater_row['name']}</h2>\n"
 
-                for index, row in movies.iterrows():
-                    schedule += f"""\t<p{' style="color:#AA0000"' if row['limited'] else ''}>{'<b>' if row['new'] else ''}{row['name']} [x{row["num_showings"]}]{'</b>' if row['new'] else ''}</p>\n"""
+                for row in movies:
+                    schedule += f"""\t<p{' style="color:#AA0000"' if row['limited'] else ''}>{'<b>' if row['new'] else ''}{row['movie']} [x{row["num_showings"]}]{'</b>' if row['new'] else ''}</p>\n"""
             
     if(by == 'both'):
         schedule += '<br><br><br><h1>Breakdown by Film</h1>'
 
     if(by in ['both', 'movie']):
+        showings_by_movie = group_showings(showings, 'movie_id', 'theater')
         for movie_index, movie_row in movie_df.sort_values(by=['name'], inplace=False).iterrows():
             schedule += f"\t<h2>{movie_row['name']}</h2>\n"
 
-            theaters = sql(f"""
-                        SELECT DISTINCT 
-                            t.id
-                            ,t.name
-                            ,CASE WHEN n.theater_id IS NOT NULL THEN 1 ELSE 0 END AS new
-                            ,CASE WHEN l.theater_id IS NOT NULL THEN 1 ELSE 0 END AS limited
-                            ,(SELECT COUNT(*) FROM showtime_df s2 GROUP BY s2.movie_id, s2.theater_id HAVING s2.movie_id = s.movie_id AND s2.theater_id = s.theater_id) AS num_showings
-                        FROM showtime_df s
-                        INNER JOIN theater_df t ON t.id = s.theater_id
-                        LEFT JOIN new_this_week n ON n.movie_id = s.movie_id AND n.theater_id = t.id
-                        LEFT JOIN limited_showings l ON l.movie_id = s.movie_id AND l.theater_id = t.id
-                        WHERE s.movie_id = \'{movie_row["id"]}\'
-                        --GROUP BY t.id, t.name, s.movie_id
-                        ORDER BY t.name""").df()
-            
-            for index, row in theaters.iterrows():
-                schedule += f"""\t<p{' style="color:#AA0000"' if row['limited'] else ''}>{'<b>' if row['new'] else ''}{row['name']} [x{row["num_showings"]}]{'</b>' if row['new'] else ''}</p>\n"""
+            for row in showings_by_movie.get(movie_row['id'], []):
+                schedule += f"""\t<p{' style="color:#AA0000"' if row['limited'] else ''}>{'<b>' if row['new'] else ''}{row['theater']} [x{row["num_showings"]}]{'</b>' if row['new'] else ''}</p>\n"""
         
     
     schedule += '</body>\n</html>'
     return schedule 
 
-def schedule_styled_html(showtime_df, movie_df, theater_df, new_this_week, limited_showings, subscriber):
-    with open('email_base_template.html', 'r') as f:
-        base_template = f.read()
+def score_text(score):
+    """Format a rotten tomatoes score for a film card
+
+    Scores come back from the database as ints, floats (when the column has NULLs) or the text 'NULL' written by older versions
+
+    Keyword arguments:
+    score - score from movies table
+
+    Returns:
+    str - whole number score, or '' if there is none
+    """
+    if(score is None or pd.isna(score) or score in ('NULL', '')):
+        return ''
+    return str(int(float(score)))
+
+def film_card(movie_row):
+    """Fill in a film's card, leaving its theater list to be added per subscriber
+
+    Cards are kept in film_card_cache by the movie's details, so a film is only filled in once a run unless its details change
+
+    Keyword arguments:
+    movie_row - dict of movie
+
+    Returns:
+    list - compiled film template with only {theaters} left
+    """
+    key = tuple(None if pd.isna(movie_row[column]) else movie_row[column] for column in film_card_columns)
+    if(key in film_card_cache):
+        return film_card_cache[key]
+
+    film_header = movie_row['name']
+    if(movie_row['release_year'] is not None and not pd.isna(movie_row['release_year'])):
+        film_header += f' ({int(movie_row["release_year"])})'
+
+    film_details = ''
     
-    with open('email_film_template.html', 'r') as f:
-        film_template = f.read()
+    if(movie_row['runtime'] is not None and not pd.isna(movie_row['runtime'])):
+        film_details += str(int(movie_row['runtime'])) + ' min'
+    if(movie_row['rating'] is not None and not pd.isna(movie_row['rating'])):
+        film_details += f'{", " if film_details != "" else ""}{movie_row["rating"]}'
+
+    values = {
+        'header': film_header
+        ,'details': film_details
+        ,'film_url': movie_row['url']
+        ,'image_url': movie_row['image_url'] if movie_row['image_url'] is not None and not pd.isna(movie_row['image_url']) else ''
+    }
+
+    rt_critic = score_text(movie_row['rt_critic'])
+    rt_audience = score_text(movie_row['rt_audience'])
+    if(rt_critic != '' and rt_audience != ''):
+        values['rt_critic'] = rt_critic
+        values['rt_audience'] = rt_audience
+    else:
+        values['rt_critic'] = '--'
+        values['rt_audience'] = '--'
 
-    films = []
-    for movie_index, movie_row in movie_df.sort_values(by=['name'], inplace=False).iterrows():
-        theaters = sql(f"""
-                    SELECT DISTINCT 
-                        t.id
-                        ,t.name
-                        ,CASE WHEN n.theater_id IS NOT NULL THEN 1 ELSE 0 END AS new
-                        ,CASE WHEN l.theater_id IS NOT NULL THEN 1 ELSE 0 END AS limited
-                        ,(SELECT COUNT(*) FROM showtime_df s2 GROUP BY s2.movie_id, s2.theater_id HAVING s2.movie_id = s.movie_id AND s2.theater_id = s.theater_id) AS num_showings
-                    FROM showtime_df s
-                    INNER JOIN theater_df t ON t.id = s.theater_id
-                    LEFT JOIN new_this_week n ON n.movie_id = s.movie_id AND n.theater_id = t.id
-                    LEFT JOIN limited_showings l ON l.movie_id = s.movie_id AND l.theater_id = t.id
-                    WHERE s.movie_id = \'{movie_row["id"]}\'
-                    --GROUP BY t.id, t.name, s.movie_id
-                    ORDER BY t.name""").df()
-        
-        cur_template = '%s' % film_template
-        film_header = movie_row['name']
-        if(movie_row['release_year'] is not None and not pd.isna(movie_row['release_year'])):
-            film_header += f' ({int(movie_row["release_year"])})'
+    if(movie_row['genres'] is not None and not pd.isna(movie_row['genres']) and movie_row['genres'] != ''):
+        values['genres'] = movie_row['genres']
+    else:
+        values['genres'] = 'N/A'
 
-        film_details = ''
-        
-        if(movie_row['runtime'] is not None and not pd.isna(movie_row['runtime'])):
-            film_details += str(int(movie_row['runtime'])) + ' min'
-        if(movie_row['rating'] is not None and not pd.isna(movie_row['rating'])):
-            film_details += f'{", " if film_details != "" else ""}{movie_row["rating"]}'
-
-        cur_template = cur_template.replace('{header}', film_header)
-        cur_template = cur_template.replace('{details}', film_details)
-        cur_template = cur_template.replace('{film_url}', movie_row['url'])
-        cur_template = cur_template.replace('{image_url}', movie_row['image_url'])
-
-        if(movie_row['rt_critic'] is not None and not pd.isna(movie_row['rt_critic']) and movie_row['rt_critic'] != 'NULL' and movie_row['rt_audience'] is not None and not pd.isna(movie_row['rt_audience']) and movie_row['rt_audience'] != 'NULL'):
-            cur_template = cur_template.replace('{rt_critic}', movie_row['rt_critic'])
-            cur_template = cur_template.replace('{rt_audience}', movie_row['rt_audience'])
-        else:
-            cur_template = cur_template.replace('{rt_critic}', '--')
-            cur_template = cur_template.replace('{rt_audience}', '--')
+    if(movie_row['synopsis'] is not None and not pd.isna(movie_row['synopsis']) and movie_row['synopsis'] != ''):
+        values['synopsis'] = movie_row['synopsis']
+    else:
+        values['synopsis'] = 'N/A'
 
-        if(movie_row['genres'] is not None and not pd.isna(movie_row['genres']) and movie_row['genres'] != ''):
-            cur_template = cur_template.replace('{genres}', movie_row['genres'])
-        else:
-            cur_template = cur_template.replace('{genres}', 'N/A')
+    film_card_cache[key] = template_engine.fill(template_engine.load_template(film_template_location), values)
+    return film_card_cache[key]
 
-        if(movie_row['synopsis'] is not None and not pd.isna(movie_row['synopsis']) and movie_row['synopsis'] != ''):
-            cur_template = cur_template.replace('{synopsis}', movie_row['synopsis'])
-        else:
-            cur_template = cur_template.replace('{synopsis}', 'N/A')
-        
+def styled_schedule(showtime_df, movie_df, theater_df, new_this_week, limited_showings):
+    """Build the styled schedule for a set of theaters, without the subscriber it is for
+
+    Keyword arguments:
+    showtime_df - dataframe containing showtimes
+    movie_df - dataframe containing movies
+    theater_df - dataframe containing theaters
+    new_this_week - dataframe containing showtimes of movies new to their theater this week
+    limited_showings - dataframe containing movie_id and theater_id of limited showings
+
+    Returns:
+    list - compiled base template with only {user} left
+    """
+    showings_by_movie = group_showings(showing_counts(showtime_df, movie_df, theater_df, new_this_week, limited_showings), 'movie_id', 'theater')
+
+    films = []
+    for movie_row in movie_df.sort_values(by=['name'], inplace=False).to_dict('records'):
+        theaters = showings_by_movie.get(movie_row['id'], [])
 
         theater_html = []
-        for index, row in theaters.iterrows():
-            theater_html.append(f"""\t<span style="margin-top: 0.5em;{'color:red;' if row['limited'] else ''}">{'<i>' if row['new'] else ''}{row['name']} <sup>x{row["num_showings"]}</sup>{'</i>' if row['new'] else ''}</p>\n""")
+        for row in theaters:
+            theater_html.append(f"""\t<span style="margin-top: 0.5em;{'color:red;' if row['limited'] else ''}">{'<i>' if row['new'] else ''}{row['theater']} <sup>x{row["num_showings"]}</sup>{'</i>' if row['new'] else ''}</p>\n""")
         
-        cur_template = cur_template.replace('{theaters}', '<br>'.join(theater_html))
+        films.append(template_engine.render(film_card(movie_row), {'theaters': '<br>'.join(theater_html)}))
 
-        films.append(cur_template)
+    return template_engine.fill(template_engine.load_template(base_template_location), {'films': '\n'.join(films)})
 
-    return base_template.replace('{films}', '\n'.join(films)).replace('{user}', subscriber)
+def schedule_styled_html(showtime_df, movie_df, theater_df, new_this_week, limited_showings, subscriber):
+    return template_engine.render(styled_schedule(showtime_df, movie_df, theater_df, new_this_week, limited_showings), {'user': subscriber})
 
-def run(test=False, specific_subscribers=None):
+def run(test=False, specific_subscribers=None, api_max_age=0):
     try:
 
         global logger
@@ -383,11 +433,10 @@ def run(test=False, specific_subscribers=None):
 
         logger.info('Initializing dataframes')
         # initialize dataframes
-        api_subscribers = pd.DataFrame(requests.get(os.environ['WEBAPP_BASEURL'] + 'api/users/', headers={'Authorization': f'Token {os.environ["API_KEY"]}'}).json())
-        api_subscriptions = pd.DataFrame(requests.get(os.environ['WEBAPP_BASEURL'] + 'api/subscriptions/', headers={'Authorization': f'Token {os.environ["API_KEY"]}'}).json())
-        
-        subscribers = sql('SELECT u.id, username, first_name, email FROM api_subscribers u INNER JOIN (SELECT DISTINCT user_id FROM api_subscriptions) s ON s.user_id = u.id WHERE is_active=1').df()
-        subscriptions = sql('SELECT user_id, theater_id FROM api_subscriptions s INNER JOIN api_subscribers u ON u.id = s.user_id WHERE u.is_active = 1').df()
+        # run.py passes an infinite api_max_age so the schedule reads the snapshot data collection synced, on its own the api is always asked
+        subscription_sync.sync(conn, cursor, max_age=api_max_age)
+        subscribers = pd.read_sql('SELECT id, username, first_name, email FROM app_users u WHERE is_active = 1 AND EXISTS (SELECT 1 FROM app_subscriptions s WHERE s.user_id = u.id) ORDER BY id', conn)
+        subscriptions = pd.read_sql('SELECT s.user_id, s.theater_id FROM app_subscriptions s INNER JOIN app_users u ON u.id = s.user_id WHERE u.is_active = 1', conn)
         # zip_codes = pd.read_sql('SELECT * FROM zip_codes', conn)
         all_theaters = pd.read_sql('SELECT * FROM theaters', conn)
         all_movies = pd.read_sql('SELECT * FROM movies', conn)
@@ -411,8 +460,10 @@ def run(test=False, specific_subscribers=None):
                                                             AND CAST(strftime(\'%s\', s2.date) AS integer) <= CAST(strftime(\'%s\', DATE(\'now\', \'-6 days\', \'localtime\')) AS integer))
                                         """, conn)
 
+        schedule_data = schedule_engine.prepare(subscriptions, all_showtimes, all_movies, all_theaters, all_new_this_week)
 
         logger.info('Starting schedule process')
+        film_card_cache.clear()
 
         # read email credentials
         with open(os.path.join('data', 'email_credentials.txt'), 'r') as f:
@@ -424,6 +475,9 @@ def run(test=False, specific_subscribers=None):
         if(test):
             logger.warning(f'Running in test mode - all schedule emails will go to {test_email}')
 
+        rendered_schedules = {} # theater set -> compiled schedule with {user} left
+        emailed = 0
+
         # generate schedule and send email for each subscriber
         for index, row in subscribers.iterrows():
 
@@ -438,24 +492,29 @@ def run(test=False, specific_subscribers=None):
 
             logger.info(f'Schedule for user {subscriber_id}: {subscriber_name}')
 
-            logger.info('Gathering subscription-specific data')
-            # ids of theaters that the subscriber subscribes to
-            theater_ids = list(sql(f'SELECT DISTINCT theater_id FROM subscriptions WHERE user_id = {subscriber_id}').df()['theater_id'])
-
-            # # data only includes theaters that the subscriber subscribes to
-            theaters = sql(f'SELECT * FROM all_theaters WHERE id IN {theater_ids} ORDER BY name').df()
-            showtimes = sql(f'SELECT * FROM all_showtimes WHERE CAST(theater_id as varchar(15)) IN {theater_ids}').df()
-            movies = sql(f'SELECT * FROM all_movies WHERE id IN (SELECT movie_id FROM showtimes)').df()
-            new_this_week = sql(f'SELECT * FROM all_new_this_week WHERE CAST(theater_id AS varchar(15)) IN {theater_ids}').df()
-            # only movies with 3 or less screenings at a particular theater in the next week. if something is showing 5 times at one theater, but 2 at another, it will be included here only for the theater with 2 screenings
-            limited_showings = sql('SELECT movie_id, theater_id, COUNT(*) AS count FROM showtimes GROUP BY movie_id, theater_id HAVING COUNT(*) <= 3 ORDER BY theater_id, movie_id').df()
-
-            logger.info('Generating schedule')
-            # generate and email html schedule
-            # schedule = schedule_simple_html(showtimes, movies, theaters, new_this_week, limited_showings, subscriber=subscriber_name)
-            schedule = schedule_styled_html(showtimes, movies, theaters, new_this_week, limited_showings, subscriber=subscriber_name)
+            # subscribers to the same theaters get the same schedule, only the greeting is filled in per subscriber
+            theater_set = schedule_engine.theater_set(schedule_data, subscriber_id)
+            if(theater_set not in rendered_schedules):
+                logger.info('Gathering subscription-specific data')
+                # data only includes theaters that the subscriber subscribes to
+                showtimes, movies, theaters, new_this_week, limited_showings = schedule_engine.subscriber_data(schedule_data, subscriber_id)
+
+                logger.info('Generating schedule')
+                # generate and email html schedule
+                # schedule = schedule_simple_html(showtimes, movies, theaters, new_this_week, limited_showings, subscriber=subscriber_name)
+                with metrics.timed('schedule_render'):
+                    rendered_schedules[theater_set] = styled_schedule(showtimes, movies, theaters, new_this_week, limited_showings)
+            else:
+                logger.info('Reusing schedule rendered for the same theaters')
+                metrics.count('schedules_reused')
+
+            schedule = template_engine.render(rendered_schedules[theater_set], {'user': subscriber_name})
             logger.info('Emailing schedule')
             send_email(schedule, subscriber_name, subscriber_email if not test else test_email, subscriber_id, html=True) # if test mode active send all emails to test emails
+            emailed += 1
+
+        logger.info(f'Rendered {len(rendered_schedules)} schedules for {emailed} subscribers')
+        metrics.count('schedules_rendered', len(rendered_schedules))
 
     except Exception:
         logger.error(traceback.format_exc())
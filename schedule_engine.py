@@ -0,0 +1,109 @@
+import logging
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger('schedule_engine')
+
+limited_max_showings = 3 # a movie showing this many times or less at a theater in the next week is limited there, even if it shows more often at another theater
+
+def index_positions(df, column):
+    """Group the row positions of a DataFrame by the value of a column
+
+    Keyword arguments:
+    df - DataFrame
+    column - name of column to group by
+
+    Returns:
+    dict - value -> np.array of row positions, in row order
+    """
+    if(len(df) == 0):
+        return {}
+    return {key: np.asarray(positions) for key, positions in df.groupby(df[column].astype(str), sort=False).indices.items()}
+
+def take_rows(df, index, keys):
+    """Get the rows of a DataFrame that belong to any of the keys, in the DataFrame's own order
+
+    Keyword arguments:
+    df - DataFrame
+    index - dict from index_positions
+    keys - values to get rows for
+
+    Returns:
+    pd.DataFrame
+    """
+    positions = [index[key] for key in dict.fromkeys(str(key) for key in keys) if key in index]
+    if(positions == []):
+        return df.iloc[0:0].reset_index(drop=True)
+    return df.iloc[np.sort(np.concatenate(positions))].reset_index(drop=True)
+
+def prepare(subscriptions, all_showtimes, all_movies, all_theaters, all_new_this_week):
+    """Work out everything schedules are built from once for all subscribers
+
+    Showtimes are restricted to subscribed theaters, per (movie, theater) show counts and limited showings are computed over all of them together,
+    and every table is indexed by theater so a subscriber's part is a lookup instead of a scan
+
+    Keyword arguments:
+    subscriptions - DataFrame of active subscriptions with user_id and theater_id
+    all_showtimes - DataFrame of upcoming showtimes
+    all_movies - DataFrame of movies
+    all_theaters - DataFrame of theaters
+    all_new_this_week - DataFrame of showtimes for movies new to their theater this week
+
+    Returns:
+    dict - schedule data to pass to subscriber_data
+    """
+    with metrics.timed('schedule_prepare'):
+        subscribed = set(subscriptions['theater_id'].astype(str))
+
+        showtimes = all_showtimes[all_showtimes['theater_id'].astype(str).isin(subscribed)].reset_index(drop=True)
+        new_this_week = all_new_this_week[all_new_this_week['theater_id'].astype(str).isin(subscribed)].reset_index(drop=True)
+        theaters = all_theaters[all_theaters['id'].astype(str).isin(subscribed)].sort_values(by=['name'], kind='stable').reset_index(drop=True)
+
+        # show counts only depend on the theater, so they are the same in every subscriber's schedule
+        show_counts = showtimes.groupby(['movie_id', 'theater_id']).size().reset_index(name='count')
+        limited_showings = show_counts[show_counts['count'] <= limited_max_showings].sort_values(by=['theater_id', 'movie_id'], kind='stable').reset_index(drop=True)
+
+        logger.info(f'Prepared {len(showtimes)} showtimes at {len(theaters)} theaters for {subscriptions["user_id"].nunique()} subscribers')
+
+        return {
+            'theater_ids': {user_id: list(group.astype(str).unique()) for user_id, group in subscriptions.groupby('user_id')['theater_id']}
+            ,'showtimes': [showtimes, index_positions(showtimes, 'theater_id')]
+            ,'new_this_week': [new_this_week, index_positions(new_this_week, 'theater_id')]
+            ,'theaters': [theaters, index_positions(theaters, 'id')]
+            ,'limited_showings': [limited_showings, index_positions(limited_showings, 'theater_id')]
+            ,'movies': [all_movies.reset_index(drop=True), index_positions(all_movies, 'id')]
+        }
+
+def theater_set(data, user_id):
+    """Get the set of theaters a subscriber subscribes to, in a form subscribers can be grouped by
+
+    Keyword arguments:
+    data - schedule data from prepare
+    user_id - id of subscriber
+
+    Returns:
+    tuple - sorted theater ids
+    """
+    return tuple(sorted(data['theater_ids'].get(user_id, [])))
+
+def subscriber_data(data, user_id):
+    """Get the part of the schedule data for a subscriber's theaters
+
+    Keyword arguments:
+    data - schedule data from prepare
+    user_id - id of subscriber
+
+    Returns:
+    [showtimes DataFrame, movies DataFrame, theaters DataFrame, new this week DataFrame, limited showings DataFrame]
+    """
+    theater_ids = data['theater_ids'].get(user_id, [])
+
+    showtimes = take_rows(*data['showtimes'], theater_ids)
+    movies = take_rows(*data['movies'], showtimes['movie_id'].unique() if len(showtimes) > 0 else [])
+    theaters = take_rows(*data['theaters'], theater_ids)
+    new_this_week = take_rows(*data['new_this_week'], theater_ids)
+    limited_showings = take_rows(*data['limited_showings'], theater_ids)
+
+    return showtimes, movies, theaters, new_this_week, limited_showings
@@ -0,0 +1,141 @@
+import json
+import hashlib
+import logging
+
+import webapp_api
+import metrics
+
+logger = logging.getLogger('subscription_sync')
+
+# api endpoint -> [local table, key columns, columns kept]
+tables = {
+    'users': ['app_users', ['id'], ['id', 'username', 'first_name', 'email', 'is_active']]
+    ,'subscriptions': ['app_subscriptions', ['user_id', 'theater_id'], ['user_id', 'theater_id']]
+    ,'theaters': ['app_theaters', ['id'], ['id', 'name', 'url']]
+}
+
+def create_tables(cursor):
+    """Create the local copies of the webapp's tables if they don't exist yet
+
+    Keyword arguments:
+    cursor - cursor for database
+
+    Returns:
+    None
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_users(
+            id integer primary key
+            ,username text
+            ,first_name text
+            ,email text
+            ,is_active int not null default 1
+            ,row_hash text not null
+        );
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_subscriptions(
+            user_id integer not null
+            ,theater_id text not null
+            ,row_hash text not null
+            ,PRIMARY KEY(user_id, theater_id)
+        );
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_theaters(
+            id text primary key
+            ,name text
+            ,url text
+            ,row_hash text not null
+        );
+        """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_sync_state(
+            endpoint text primary key
+            ,content_hash text not null
+            ,date_synced datetime not null
+        );
+        """)
+    cursor.execute('CREATE INDEX IF NOT EXISTS app_users_active ON app_users(is_active);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS app_subscriptions_theater ON app_subscriptions(theater_id);')
+
+def row_values(record, columns):
+    """Get the values of a record that are kept locally, with the hash they are compared by
+
+    Keyword arguments:
+    record - dict from api
+    columns - columns kept
+
+    Returns:
+    list - [values of columns..., hash of values]
+    """
+    values = [record.get(column) for column in columns]
+    # the webapp sends booleans, sqlite stores them as ints
+    values = [int(value) if isinstance(value, bool) else value for value in values]
+    return values + [hashlib.sha256(json.dumps(values, default=str).encode('utf8')).hexdigest()]
+
+def sync_table(cursor, table, key_columns, columns, records):
+    """Bring a local table in line with the records from the api, touching only rows that changed
+
+    Keyword arguments:
+    cursor - cursor for database
+    table - name of local table
+    key_columns - columns that identify a row
+    columns - columns kept
+    records - list of dicts from api
+
+    Returns:
+    [int - rows inserted or updated, int - rows deleted]
+    """
+    key_indexes = [columns.index(column) for column in key_columns]
+
+    stored = {tuple(row[:-1]): row[-1] for row in cursor.execute(f'SELECT {", ".join(key_columns)}, row_hash FROM {table};')}
+
+    incoming = {}
+    for record in records:
+        values = row_values(record, columns)
+        incoming[tuple(values[i] for i in key_indexes)] = values
+
+    changed = [values for key, values in incoming.items() if stored.get(key) != values[-1]]
+    deleted = [key for key in stored if key not in incoming]
+
+    if(changed != []):
+        cursor.executemany(f'INSERT OR REPLACE INTO {table}({", ".join(columns)}, row_hash) VALUES({", ".join(["?"]*(len(columns) + 1))});', changed)
+    if(deleted != []):
+        cursor.executemany(f'DELETE FROM {table} WHERE {" AND ".join([f"{column} = ?" for column in key_columns])};', deleted)
+
+    return len(changed), len(deleted)
+
+def sync(conn, cursor, max_age=None):
+    """Update the local copies of the webapp's tables from the api
+
+    Endpoints whose response is the same as at the last sync are skipped, otherwise only changed rows are written
+
+    Keyword arguments:
+    conn - database connection
+    cursor - cursor for database
+    max_age - seconds an api snapshot is used without asking the api, defaults to webapp_api.snapshot_max_age
+
+    Returns:
+    None
+    """
+    create_tables(cursor)
+    snapshots = webapp_api.get_api_snapshots(max_age)
+
+    with metrics.timed('subscription_sync'), conn:
+        synced = dict(cursor.execute('SELECT endpoint, content_hash FROM app_sync_state;').fetchall())
+
+        for endpoint, (table, key_columns, columns) in tables.items():
+            snapshot = snapshots[endpoint]
+            if(snapshot.get('content_hash') is not None and synced.get(endpoint) == snapshot['content_hash']):
+                logger.info(f'{endpoint} unchanged since last sync')
+                continue
+
+            changed, deleted = sync_table(cursor, table, key_columns, columns, snapshot['records'])
+            logger.info(f'Synced {endpoint}: {changed} rows inserted or updated, {deleted} deleted')
+
+            if(snapshot.get('content_hash') is not None):
+                cursor.execute("""
+                    INSERT OR REPLACE INTO app_sync_state(endpoint, content_hash, date_synced)
+                    VALUES(?, ?, DATETIME('now', 'localtime'));
+                    """, (endpoint, snapshot['content_hash']))
@@ -0,0 +1,70 @@
+import re
+import threading
+
+placeholder_pattern = re.compile(r'\{(\w+)\}') # {name} is a field, anything else (e.g. css blocks) is kept as is
+
+compiled_templates = {} # filename -> compiled template, read once per process
+compiled_templates_lock = threading.Lock()
+
+def compile_template(text):
+    """Split a template into the text between fields and the fields themselves
+
+    Keyword arguments:
+    text - template text with {name} fields
+
+    Returns:
+    list - [text, field name, text, field name, ..., text], text always at even positions
+    """
+    return placeholder_pattern.split(text)
+
+def load_template(filename):
+    """Get a compiled template, reading and compiling it the first time it is asked for
+
+    Keyword arguments:
+    filename - filepath of template
+
+    Returns:
+    list - compiled template from compile_template
+    """
+    with compiled_templates_lock:
+        if(filename not in compiled_templates):
+            with open(filename, 'r') as f:
+                compiled_templates[filename] = compile_template(f.read())
+        return compiled_templates[filename]
+
+def fill(template, values):
+    """Fill in some of a template's fields, leaving the rest for later
+
+    Values are inserted as they are - text in a value that looks like a field is not filled in
+
+    Keyword arguments:
+    template - compiled template
+    values - dict of field name -> str
+
+    Returns:
+    list - compiled template with only the fields not in values left
+    """
+    filled = [template[0]]
+    for i in range(1, len(template), 2):
+        if(template[i] in values):
+            filled[-1] += values[template[i]] + template[i + 1]
+        else:
+            filled += [template[i], template[i + 1]]
+    return filled
+
+def render(template, values):
+    """Fill in a template's fields in a single pass
+
+    Keyword arguments:
+    template - compiled template
+    values - dict of field name -> str, fields without a value are left as {name}
+
+    Returns:
+    str - rendered text
+    """
+    parts = [template[0]]
+    for i in range(1, len(template), 2):
+        name = template[i]
+        parts.append(values[name] if name in values else '{' + name + '}')
+        parts.append(template[i + 1])
+    return ''.join(parts)
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+@pytest.fixture
+def in_repo(monkeypatch):
+    """Run a test from the repository root, where templates and table_structure are looked up"""
+    monkeypatch.chdir(repo_root)
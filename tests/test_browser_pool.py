@@ -0,0 +1,36 @@
+import threading
+
+import data_collection
+
+class FakeBrowser:
+    def execute_script(self, script):
+        return 1
+
+    def execute_cdp_cmd(self, command, args):
+        return {}
+
+    def quit(self):
+        pass
+
+def test_waiting_fetch_gets_replacement_for_retired_browser(monkeypatch):
+    monkeypatch.setattr(data_collection, 'browser_init', FakeBrowser)
+    monkeypatch.setattr(data_collection, 'browser_pool_size', 1)
+    monkeypatch.setattr(data_collection, 'browser_wait_seconds', 0.05)
+    monkeypatch.setattr(data_collection, 'live_browsers', 0)
+    monkeypatch.setattr(data_collection, 'browser_pool', data_collection.queue.Queue())
+
+    first = data_collection.borrow_browser()
+
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(data_collection.borrow_browser()), daemon=True)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive() # the only browser is borrowed
+
+    # the page load crashed, so the browser is retired instead of handed back
+    data_collection.release_browser(first, crashed=True)
+    waiter.join(5)
+
+    assert not waiter.is_alive()
+    assert borrowed[0] is not first
+    assert data_collection.live_browsers == 1
@@ -0,0 +1,54 @@
+import pytest
+
+import data_collection
+import rate_limit
+
+class StatusBrowser:
+    """Browser that loads one canned page, served with the given status"""
+    def __init__(self, status, html):
+        self.status = status
+        self.html = html
+        self.page_source = None
+
+    def get(self, url):
+        self.page_source = self.html
+
+    def execute_script(self, script):
+        return self.status
+
+    def execute_cdp_cmd(self, command, args):
+        return {}
+
+    def find_element(self, by, value):
+        return object()
+
+    def quit(self):
+        pass
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'wait_for_token', lambda url, bucket=None: 0)
+    monkeypatch.setattr(data_collection, 'live_browsers', 0)
+    monkeypatch.setattr(data_collection, 'browser_pool', data_collection.queue.Queue())
+
+    def use(browser):
+        monkeypatch.setattr(data_collection, 'browser_init', lambda: browser)
+        return browser
+    return use
+
+def test_server_error_page_raises_and_keeps_browser(pool):
+    browser = pool(StatusBrowser(503, '<html><body>Service Unavailable</body></html>'))
+
+    with pytest.raises(Exception, match='HTTP 503'):
+        data_collection.fetch_page('http://localhost/theater-page', ready_selector=data_collection.theater_ready_selector)
+
+    # the browser is fine, only the page was an error
+    assert data_collection.browser_pool.get_nowait() is browser
+
+def test_page_without_movie_list_is_empty(pool, monkeypatch, tmp_path):
+    monkeypatch.setattr(data_collection.page_cache, 'cache_dir', str(tmp_path))
+    pool(StatusBrowser(200, '<html><body><main><p>Nothing is playing today.</p></main></body></html>'))
+
+    html, payloads = data_collection.get_theater_page('Shu Community Theatre', 'http://localhost/theater-page', data_collection.datetime(2026, 10, 17))
+
+    assert data_collection.collect_from_theater(data_collection.parse_theater_page(html)) == ([], [])
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import fetch_planner
+
+publishing_days = {'AAA01': 6, 'AAA02': 8, 'AAS01': 3, 'AAS02': 2} # theater id -> days ahead it publishes showtimes
+
+def test_steady_state_fetches_at_most_baseline(in_repo, monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    for table in ['theaters', 'showtimes', 'page_journal']:
+        with open(os.path.join('table_structure', f'{table}.txt'), 'r') as f:
+            conn.executescript(f.read())
+    conn.executemany('INSERT INTO theaters(id, name, url) VALUES(?, ?, ?);', [(theater_id, theater_id, f'/{theater_id}') for theater_id in publishing_days])
+
+    start = datetime.now()
+    for night in range(21):
+        now = start + timedelta(days=night)
+        monkeypatch.setattr(fetch_planner, 'datetime', type('night_datetime', (datetime,), {'now': classmethod(lambda cls: now)}))
+        today = now.date()
+        dates = [today + timedelta(days=i) for i in range(7)]
+
+        planned, skipped = fetch_planner.plan_pages(pd.read_sql('SELECT * FROM theaters', conn), dates, conn)
+        if(night >= 7):
+            assert len(planned) <= fetch_planner.baseline_pages(planned, skipped)
+
+        # the site publishes a theater's showtimes publishing_days ahead
+        for row, date in planned:
+            formatted_date = date.strftime('%Y-%m-%d')
+            showtimes = 2 if (date - today).days <= publishing_days[row['id']] else 0
+            conn.executemany("INSERT OR REPLACE INTO showtimes(id, movie_id, theater_id, url, date, time) VALUES(?, '1', ?, '/ticket', ?, '19:00:00');", [(f'{row["id"]}{formatted_date}{i}', row['id'], formatted_date) for i in range(showtimes)])
+            conn.execute('INSERT OR REPLACE INTO page_journal(theater_id, date, date_collected, showtimes) VALUES(?, ?, ?, ?);', (row['id'], formatted_date, today.strftime('%Y-%m-%d'), showtimes))
+        conn.execute('UPDATE theaters SET date_updated = ?;', (today.strftime('%Y-%m-%d'),))
+
+        # every published date is stored, including for theaters that publish fewer days ahead
+        for theater_id, days in publishing_days.items():
+            for date in dates[:days + 1]:
+                assert conn.execute('SELECT COUNT(*) FROM showtimes WHERE theater_id = ? AND date = ?;', (theater_id, date.strftime('%Y-%m-%d'))).fetchone()[0] > 0
@@ -0,0 +1,13 @@
+import os
+
+import fixture_pages
+import parser_benchmark
+
+def test_fixtures_generated(in_repo, monkeypatch, tmp_path):
+    monkeypatch.setattr(fixture_pages, 'fixture_dir', str(tmp_path))
+    for name in fixture_pages.generate():
+        with open(tmp_path / f'{name}.html', 'rb') as generated, open(os.path.join('fixtures', f'{name}.html'), 'rb') as committed:
+            assert generated.read() == committed.read(), name
+
+def test_parsers_match_expected_output(in_repo):
+    assert parser_benchmark.check_output() == []
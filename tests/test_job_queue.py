@@ -0,0 +1,69 @@
+import sqlite3
+import multiprocessing
+from time import sleep
+
+import job_queue
+
+job_count = 60 # jobs queued for the workers to share
+worker_count = 4 # worker processes working the same database
+
+def work(db_name):
+    """Work theater page jobs until none are left, recording each job worked in the same transaction that completes it"""
+    conn = sqlite3.connect(db_name, timeout=30)
+    worker = job_queue.worker_name()
+    while True:
+        job = job_queue.claim(conn, worker, ['theater_page'])
+        if(job is None):
+            if(job_queue.pending(conn, ['theater_page']) == 0):
+                break
+            sleep(0.01)
+            continue
+
+        sleep(0.005) # the page fetch
+        with conn:
+            conn.execute('INSERT INTO worked(job_id, worker) VALUES(?, ?);', (job['id'], worker))
+            job_queue.complete(conn.cursor(), job['id'], worker)
+    conn.close()
+
+def create_db(db_name):
+    conn = sqlite3.connect(db_name)
+    job_queue.create_table(conn.cursor())
+    conn.execute('CREATE TABLE worked(job_id integer, worker text);')
+    return conn
+
+def test_jobs_worked_once_across_processes(tmp_path):
+    db_name = str(tmp_path / 'moviedb')
+    conn = create_db(db_name)
+    for i in range(job_count):
+        job_queue.enqueue('theater_page', f'theater_page:AA{i:03d}:2026-01-01', {'id': f'AA{i:03d}'}, conn.cursor(), theater_id=f'AA{i:03d}')
+    conn.commit()
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=work, args=(db_name,)) for i in range(worker_count)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert worker.exitcode == 0
+
+    worked = conn.execute('SELECT job_id, COUNT(*) FROM worked GROUP BY job_id;').fetchall()
+    assert len(worked) == job_count
+    assert all(count == 1 for job_id, count in worked)
+    assert conn.execute("SELECT COUNT(*) FROM scrape_jobs WHERE status = 'done';").fetchone()[0] == job_count
+    assert conn.execute('SELECT COUNT(DISTINCT worker) FROM worked;').fetchone()[0] > 1
+
+def test_finished_jobs_requeued(tmp_path):
+    conn = create_db(str(tmp_path / 'moviedb'))
+    cursor = conn.cursor()
+    for kind, requeue_today in [('theater_page', True), ('movie_info', False)]:
+        job_queue.enqueue(kind, f'{kind}:1', {}, cursor, requeue_today=requeue_today)
+        job = job_queue.claim(conn, 'worker', [kind])
+        job_queue.complete(cursor, job['id'], 'worker')
+
+        job_queue.enqueue(kind, f'{kind}:1', {}, cursor, requeue_today=requeue_today)
+        assert job_queue.pending(conn, [kind]) == (1 if requeue_today else 0)
+
+    # movie info finished on an earlier day is fetched again
+    cursor.execute("UPDATE scrape_jobs SET date_queued = DATETIME('now', 'localtime', '-1 days') WHERE kind = 'movie_info';")
+    job_queue.enqueue('movie_info', 'movie_info:1', {}, cursor, requeue_today=False)
+    assert job_queue.pending(conn, ['movie_info']) == 1
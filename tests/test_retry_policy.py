@@ -0,0 +1,32 @@
+import retry_policy
+
+def park(monkeypatch, key):
+    monkeypatch.setattr(retry_policy, 'breakers', {})
+    monkeypatch.setattr(retry_policy, 'park_seconds', 0)
+    for i in range(retry_policy.failure_threshold):
+        retry_policy.record_failure(key)
+
+def test_half_open_breaker_lets_one_attempt_through(monkeypatch):
+    park(monkeypatch, 'AABQU')
+
+    # the park has run out - only the first caller gets to try the theater
+    assert [retry_policy.breaker_open('AABQU') for i in range(7)] == [False] + [True]*6
+
+    retry_policy.record_success('AABQU')
+    assert [retry_policy.breaker_open('AABQU') for i in range(7)] == [False]*7
+
+def test_failed_probe_parks_theater_again(monkeypatch):
+    park(monkeypatch, 'AABQU')
+    monkeypatch.setattr(retry_policy, 'park_seconds', 1800)
+
+    # still parked
+    assert retry_policy.breaker_open('AABQU')
+
+    monkeypatch.setattr(retry_policy, 'park_seconds', 0)
+    assert not retry_policy.breaker_open('AABQU')
+    assert retry_policy.breaker_open('AABQU')
+
+    monkeypatch.setattr(retry_policy, 'park_seconds', 1800)
+    retry_policy.record_failure('AABQU')
+    assert retry_policy.breaker_open('AABQU')
+    assert retry_policy.breaker_wait('AABQU') > 0
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import pandas as pd
+
+import schedule
+import schedule_engine
+
+def create_db(db_name):
+    conn = sqlite3.connect(db_name)
+    for table in ['theaters', 'movies', 'showtimes']:
+        with open(os.path.join('table_structure', f'{table}.txt'), 'r') as f:
+            conn.executescript(f.read())
+    return conn
+
+def test_styled_schedule_from_sqlite_scores(in_repo, tmp_path):
+    conn = create_db(str(tmp_path / 'moviedb'))
+    tomorrow = str(date.today() + timedelta(days=1))
+    conn.execute("INSERT INTO theaters(id, name, url, address, date_updated) VALUES('AA001', 'Theater 1', '/theater-1', '', ?);", (tomorrow,))
+    conn.executemany('INSERT INTO movies(id, name, url, runtime, rt_critic, rt_audience) VALUES(?, ?, ?, ?, ?, ?);', [
+        ('1', 'Scored', '/movie-1', 120, 91, 84)
+        ,('2', 'Unscored', '/movie-2', None, None, None)
+        ,('3', 'Old Unscored', '/movie-3', 95, 'NULL', 'NULL') # written by versions that stored the text NULL
+    ])
+    conn.executemany("INSERT INTO showtimes(id, movie_id, theater_id, url, date, time) VALUES(?, ?, 'AA001', ?, ?, '19:00:00');", [
+        (str(i), str(i), f'/ticket-{i}', tomorrow) for i in range(1, 4)
+    ])
+    conn.commit()
+
+    subscriptions = pd.DataFrame([{'user_id': 1, 'theater_id': 'AA001'}])
+    movies = pd.read_sql('SELECT * FROM movies', conn)
+    showtimes = pd.read_sql('SELECT * FROM showtimes', conn)
+    theaters = pd.read_sql('SELECT * FROM theaters', conn)
+
+    for movie_df in [movies, movies[movies['id'] != '3']]: # mixed int/text scores, and float scores with NaN
+        schedule.film_card_cache.clear()
+        schedule_data = schedule_engine.prepare(subscriptions, showtimes, movie_df, theaters, showtimes.iloc[0:0])
+        html = schedule.schedule_styled_html(*schedule_engine.subscriber_data(schedule_data, 1), subscriber='Tester')
+
+        assert 'Tester' in html
+        assert 'Critic Score: 91%, Audience Score: 84%' in html
+        assert 'Critic Score: --%, Audience Score: --%' in html
+
+def test_score_text():
+    assert schedule.score_text(91) == '91'
+    assert schedule.score_text(91.0) == '91'
+    assert schedule.score_text('91') == '91'
+    assert schedule.score_text(None) == ''
+    assert schedule.score_text(float('nan')) == ''
+    assert schedule.score_text('NULL') == ''
@@ -0,0 +1,98 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import webapp_api
+
+class StubApi(BaseHTTPRequestHandler):
+    """Answer /api/<endpoint>/ like the webapp, with an ETag per version of the records and injected 503s"""
+    protocol_version = 'HTTP/1.1' # keep-alive, like the webapp behind its proxy
+
+    records = {}
+    version = 1
+    failures = {} # endpoint -> number of 503s still to answer with
+    requests = [] # (endpoint, If-None-Match header)
+
+    def do_GET(self):
+        endpoint = self.path.strip('/').split('/')[1]
+        StubApi.requests.append((endpoint, self.headers.get('If-None-Match')))
+
+        etag = f'"{endpoint}-{StubApi.version}"'
+        if(StubApi.failures.get(endpoint, 0) > 0):
+            StubApi.failures[endpoint] -= 1
+            self.respond(503, b'Service Unavailable')
+        elif(self.headers.get('If-None-Match') == etag):
+            self.respond(304, b'')
+        else:
+            self.respond(200, json.dumps(StubApi.records[endpoint]).encode('utf8'), etag)
+
+    def respond(self, status, body, etag=None):
+        self.send_response(status)
+        if(etag is not None):
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_api(monkeypatch, tmp_path):
+    StubApi.records = {'users': [{'id': 1, 'is_active': True}], 'subscriptions': [{'user_id': 1, 'theater_id': 'AA001'}], 'theaters': [{'id': 'AA001', 'name': 'Theater 1'}]}
+    StubApi.version = 1
+    StubApi.failures = {}
+    StubApi.requests = []
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv('WEBAPP_BASEURL', f'http://127.0.0.1:{server.server_address[1]}/')
+    monkeypatch.setenv('API_KEY', 'test')
+    monkeypatch.setattr(webapp_api, 'snapshot_dir', str(tmp_path / 'api'))
+    monkeypatch.setattr(webapp_api, 'session', None)
+    monkeypatch.setattr(webapp_api, 'retry_backoff', 0) # retry right away
+
+    yield StubApi
+
+    server.shutdown()
+    server.server_close()
+
+def test_snapshots_and_conditional_requests(stub_api):
+    data = webapp_api.get_api_data(max_age=0)
+    assert data['users'].to_dict('records') == [{'id': 1, 'is_active': True}]
+    assert sorted(stub_api.requests) == [('subscriptions', None), ('theaters', None), ('users', None)]
+
+    # a recent snapshot is used without asking the api
+    webapp_api.get_api_data()
+    assert len(stub_api.requests) == 3
+
+    # unchanged records are answered with a 304 and the snapshot is kept
+    snapshots = webapp_api.get_api_snapshots(max_age=0)
+    assert sorted(stub_api.requests[3:]) == [('subscriptions', '"subscriptions-1"'), ('theaters', '"theaters-1"'), ('users', '"users-1"')]
+    assert snapshots['theaters']['records'] == [{'id': 'AA001', 'name': 'Theater 1'}]
+
+    # changed records replace the snapshot
+    stub_api.version = 2
+    stub_api.records['theaters'] = [{'id': 'AA001', 'name': 'Theater 1'}, {'id': 'AA002', 'name': 'Theater 2'}]
+    snapshots = webapp_api.get_api_snapshots(max_age=0)
+    assert len(snapshots['theaters']['records']) == 2
+    assert snapshots['theaters']['etag'] == '"theaters-2"'
+    assert webapp_api.load_snapshot('theaters')['records'] == snapshots['theaters']['records']
+
+def test_server_errors_retried(stub_api):
+    stub_api.failures = {'users': webapp_api.max_retries}
+    data = webapp_api.get_api_data(max_age=0)
+    assert len(data['users']) == 1
+    assert [endpoint for endpoint, etag in stub_api.requests].count('users') == webapp_api.max_retries + 1
+
+def test_snapshot_kept_when_retries_run_out(stub_api):
+    webapp_api.get_api_data(max_age=0)
+
+    stub_api.failures = {'users': webapp_api.max_retries + 1}
+    with pytest.raises(requests.exceptions.RetryError):
+        webapp_api.get_api_data(max_age=0)
+    assert webapp_api.load_snapshot('users')['records'] == [{'id': 1, 'is_active': True}]
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+logger = logging.getLogger('webapp_api')
+
+endpoints = ['subscriptions', 'theaters', 'users'] # api endpoints the pipeline reads
+timeout = 30 # seconds before a request to the webapp api is given up on
+max_retries = 3 # retries of a request that failed to connect or got a 5xx/429 response
+retry_backoff = 1 # backoff factor between retries - seconds waited grow as retry_backoff * 2^(retry - 1)
+snapshot_dir = os.path.join('cache', 'api') # directory the last response of every endpoint is kept in
+snapshot_max_age = 2*60*60 # seconds a snapshot is used without asking the api again, so every stage of a run reads the same data
+
+session = None
+session_lock = threading.Lock()
+
+def get_session():
+    """Get the keep-alive session shared by every api request
+
+    Returns:
+    requests.Session
+    """
+    global session
+
+    with session_lock:
+        if(session is None):
+            session = requests.Session()
+            session.headers['Authorization'] = f'Token {os.environ["API_KEY"]}'
+
+            retry = Retry(total=max_retries, backoff_factor=retry_backoff, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=len(endpoints), max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        return session
+
+def snapshot_path(endpoint):
+    return os.path.join(snapshot_dir, f'{endpoint}.json')
+
+def load_snapshot(endpoint):
+    """Read the last response of an endpoint
+
+    Keyword arguments:
+    endpoint - name of endpoint
+
+    Returns:
+    dict - {fetched, etag, last_modified, content_hash, records}, or None if there is no snapshot
+    """
+    try:
+        with open(snapshot_path(endpoint), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def store_snapshot(endpoint, snapshot):
+    """Keep the last response of an endpoint
+
+    Keyword arguments:
+    endpoint - name of endpoint
+    snapshot - dict from load_snapshot
+
+    Returns:
+    None
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    # each stage may read the snapshot at any time, so it is swapped in whole
+    tmp_path = f'{snapshot_path(endpoint)}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, snapshot_path(endpoint))
+
+def fetch_endpoint(endpoint, max_age):
+    """Get the snapshot of an endpoint, asking the api again if it is not recent
+
+    Keyword arguments:
+    endpoint - name of endpoint
+    max_age - seconds a snapshot is used without asking the api
+
+    Returns:
+    dict - snapshot from load_snapshot
+    """
+    snapshot = load_snapshot(endpoint)
+
+    if(snapshot is not None and time() - snapshot['fetched'] <= max_age):
+        logger.info(f'Using {endpoint} snapshot from {round(time() - snapshot["fetched"])} seconds ago')
+        return snapshot
+
+    # the api only sends the records again if they changed since the snapshot
+    headers = {}
+    if(snapshot is not None and snapshot.get('etag')):
+        headers['If-None-Match'] = snapshot['etag']
+    if(snapshot is not None and snapshot.get('last_modified')):
+        headers['If-Modified-Since'] = snapshot['last_modified']
+
+    response = get_session().get(os.environ['WEBAPP_BASEURL'] + f'api/{endpoint}/', headers=headers, timeout=timeout)
+
+    if(response.status_code == 304 and snapshot is not None):
+        logger.info(f'{endpoint} unchanged since last snapshot')
+        snapshot['fetched'] = time()
+    else:
+        response.raise_for_status()
+        logger.info(f'Collected {endpoint} from API')
+        snapshot = {
+            'fetched': time()
+            ,'etag': response.headers.get('ETag')
+            ,'last_modified': response.headers.get('Last-Modified')
+            ,'content_hash': hashlib.sha256(response.content).hexdigest()
+            ,'records': response.json()
+        }
+
+    store_snapshot(endpoint, snapshot)
+    return snapshot
+
+def get_api_snapshots(max_age=None):
+    """Get the snapshot of every endpoint the pipeline reads, fetched in parallel
+
+    Keyword arguments:
+    max_age - seconds a snapshot is used without asking the api, defaults to snapshot_max_age; 0 always asks
+
+    Returns:
+    dict - endpoint name -> snapshot from load_snapshot
+    """
+    max_age = snapshot_max_age if max_age is None else max_age
+
+    with metrics.timed('api_fetch'), ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+        return dict(zip(endpoints, executor.map(lambda endpoint: fetch_endpoint(endpoint, max_age), endpoints)))
+
+def get_api_data(max_age=None):
+    """Get every endpoint the pipeline reads, fetched in parallel
+
+    Keyword arguments:
+    max_age - seconds a snapshot is used without asking the api, defaults to snapshot_max_age; 0 always asks
+
+    Returns:
+    dict - endpoint name -> pd.DataFrame of records
+    """
+    return {endpoint: pd.DataFrame(snapshot['records']) for endpoint, snapshot in get_api_snapshots(max_age).items()}